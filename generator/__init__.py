@@ -1,3 +1,20 @@
-from generator.project import Project
-from generator.project.es import ESProject
-from generator.project.runner import RunnerProject
+import importlib
+
+# loaded on first access, jinja is expensive to import
+_exports = {
+    'Project': 'generator.project',
+    'ESProject': 'generator.project.es',
+    'RunnerProject': 'generator.project.runner',
+}
+
+
+def __getattr__(name: str):
+    if name not in _exports:
+        raise AttributeError(
+            'module {!r} has no attribute {!r}'.format(__name__, name)
+        )
+    return getattr(importlib.import_module(_exports[name]), name)
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_exports))
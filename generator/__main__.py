@@ -1,14 +1,54 @@
 import argparse
+import collections
+import itertools
+import json
 import logging
+import os
 import pathlib
 import sys
 import typing
 
+from generator import profiling
+from generator.cache import (
+    BYTECODE_CACHE_MAX_SIZE,
+    get_cache_dir,
+)
+from generator.config import (
+    Config,
+    PATCH_APPEND,
+    PATCH_REMOVE,
+    PATCH_SET,
+    Patch,
+)
 from generator.project import (
     Project,
     InvalidConfig,
     INHERIT,
+    TEMPLATES,
+)
+from generator.transaction import (
+    DURABILITY_LEVELS,
+    DURABILITY_NONE,
 )
+from generator.version import __version__
+
+if typing.TYPE_CHECKING:
+    from generator.sink import TarSink
+
+LOG_FORMAT = '{name}: %(levelname)s %(name)s: %(message)s'
+
+EXIT_CODE_DRIFT = 3
+
+logger = logging.getLogger('generator')
+
+
+def _get_patch_type(operation: str) -> typing.Callable[[str], Patch]:
+    def parse(raw: str) -> Patch:
+        return Patch.parse(operation, raw)
+
+    # argparse names the type in its errors
+    parse.__name__ = operation
+    return parse
 
 
 def get_args(args: typing.Optional[typing.List[str]] = None):
@@ -21,8 +61,31 @@ def get_args(args: typing.Optional[typing.List[str]] = None):
         'path',
         nargs='*',
         type=pathlib.Path,
-        default=[pathlib.Path.cwd()],
-        help='One or more project paths',
+        help='One or more project paths, defaults to the current directory',
+    )
+
+    parser.add_argument(
+        '--discover',
+        action='append',
+        type=pathlib.Path,
+        default=[],
+        metavar='ROOT',
+        help=(
+            'Process every project below ROOT, starting while searching,'
+            ' can be repeated'
+        ),
+    )
+
+    parser.add_argument(
+        '--version',
+        action='version',
+        version='%(prog)s ' + __version__,
+    )
+
+    parser.add_argument(
+        '--list-projects',
+        action='store_true',
+        help='Print the name and language of the projects and exit',
     )
 
     parser.add_argument(
@@ -43,35 +106,1041 @@ def get_args(args: typing.Optional[typing.List[str]] = None):
         help='Set the node version for a project',
     )
 
-    return parser.parse_args(args)
+    parser.add_argument(
+        '--set',
+        action='append',
+        dest='patches',
+        default=[],
+        type=_get_patch_type(PATCH_SET),
+        metavar='KEY=VALUE',
+        help=(
+            'Set a field in the config of every project, a trailing comma'
+            ' makes a list; only the outputs using it get rendered'
+        ),
+    )
 
+    parser.add_argument(
+        '--append',
+        action='append',
+        dest='patches',
+        type=_get_patch_type(PATCH_APPEND),
+        metavar='KEY=ITEM',
+        help='Append items to a list field, like --set',
+    )
 
-def main(args: argparse.Namespace = None) -> int:
-    if not args:
-        args = get_args()
+    parser.add_argument(
+        '--remove',
+        action='append',
+        dest='patches',
+        type=_get_patch_type(PATCH_REMOVE),
+        metavar='KEY[=ITEM]',
+        help='Remove items from a list field or the whole field, like --set',
+    )
 
-    for raw_path in args.path:
-        path = pathlib.Path(raw_path)
-        logging.root.handlers.clear()
-        logging.basicConfig(
-            level=logging.INFO,
-            format=(
-                '{name}: %(levelname)s %(name)s: %(message)s'
-            ).format(
-                name=path.resolve().name,
-            ),
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help=(
+            'Render in memory, list outdated files and exit with %d in case'
+            ' of any, never writes' % EXIT_CODE_DRIFT
+        ),
+    )
+
+    parser.add_argument(
+        '--diff',
+        action='store_true',
+        help='Log a diff for every outdated file in --check mode',
+    )
+
+    parser.add_argument(
+        '--render',
+        action='store_true',
+        help=(
+            'Print the rendered outputs as json per project path,'
+            ' never writes'
+        ),
+    )
+
+    parser.add_argument(
+        '--serve',
+        type=pathlib.Path,
+        metavar='SOCKET',
+        help=(
+            'Keep running and handle update, check and render requests'
+            ' on a unix socket, with warm caches'
+        ),
+    )
+
+    parser.add_argument(
+        '--connect',
+        type=pathlib.Path,
+        metavar='SOCKET',
+        help='Send the request to a generator started with --serve',
+    )
+
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Skip outputs with unchanged inputs since the last run',
+    )
+
+    parser.add_argument(
+        '--fsync',
+        choices=DURABILITY_LEVELS,
+        default=DURABILITY_NONE,
+        help=(
+            'Durability of the writes: leave syncing to the OS, flush the'
+            ' file system once per project before and after its renames'
+            ' (syncfs, else fsync per file) or fsync every file as it gets'
+            ' written'
+        ),
+    )
+
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument(
+        '--output-dir',
+        type=pathlib.Path,
+        metavar='DIR',
+        help=(
+            'Write the outputs into DIR, mirroring the project paths relative'
+            ' to the working directory, instead of in place'
+        ),
+    )
+    output.add_argument(
+        '--output-tar',
+        metavar='FILE',
+        help=(
+            'Write the outputs into one tar stream, - for stdout; the'
+            ' projects get processed one after another'
+        ),
+    )
+
+    parser.add_argument(
+        '--affected-by',
+        action='append',
+        type=lambda raw: pathlib.Path(raw).resolve(),
+        metavar='TEMPLATE',
+        help=(
+            'Only render the outputs that depend on the given template file,'
+            ' can be repeated'
+        ),
+    )
+
+    parser.add_argument(
+        '--since',
+        metavar='REF',
+        help=(
+            'Only render the projects and outputs with inputs that changed'
+            ' since the given git ref: templates and generator sources'
+            ' in this repository, buildscript.txt and has_* files in the'
+            ' projects'
+        ),
+    )
+
+    parser.add_argument(
+        '--keep-going',
+        action='store_true',
+        help=(
+            'Process all projects despite failures, report them at the end'
+            ' and record the completed projects in the --journal'
+        ),
+    )
+
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help=(
+            'Like --keep-going, but skip projects that completed in the'
+            ' previous run and did not change since'
+        ),
+    )
+
+    parser.add_argument(
+        '--journal',
+        type=pathlib.Path,
+        default=get_cache_dir() / 'journal.jsonl',
+        help='Record of the completed projects for --resume',
+    )
+
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='Keep running and update projects on changes to their inputs',
+    )
+
+    parser.add_argument(
+        '--watch-interval',
+        type=float,
+        default=0.2,
+        help='Seconds between two polls for changes in --watch mode',
+    )
+
+    parser.add_argument(
+        '--jobs',
+        '-j',
+        type=int,
+        default=1,
+        help='Process projects in parallel, 0 uses one job per cpu',
+    )
+
+    parser.add_argument(
+        '--io-threads',
+        type=int,
+        default=0,
+        metavar='N',
+        help=(
+            'Read the outputs and scan the project directories ahead of'
+            ' rendering and write in the background on N threads, hides'
+            ' the latency of network file systems'
+        ),
+    )
+
+    parser.add_argument(
+        '--bytecode-cache',
+        action='store_true',
+        help='Persist compiled templates between runs',
+    )
+
+    parser.add_argument(
+        '--bytecode-cache-dir',
+        type=pathlib.Path,
+        default=get_cache_dir() / 'bytecode',
+        help='Location of the persisted compiled templates',
+    )
+
+    parser.add_argument(
+        '--bytecode-cache-size',
+        type=int,
+        default=BYTECODE_CACHE_MAX_SIZE,
+        help='Evict the oldest compiled templates past this size in bytes',
+    )
+
+    parser.add_argument(
+        '--compile-templates',
+        type=pathlib.Path,
+        metavar='TARGET',
+        help=(
+            'Compile the templates into python modules in the TARGET'
+            ' directory or .zip archive and exit'
+        ),
+    )
+
+    parser.add_argument(
+        '--precompiled',
+        type=pathlib.Path,
+        metavar='PATH',
+        help=(
+            'Load the templates from the output of --compile-templates,'
+            ' an outdated PATH is ignored'
+        ),
+    )
+
+    parser.add_argument(
+        '--profile',
+        type=pathlib.Path,
+        metavar='DIR',
+        help=(
+            'Write a Chrome trace with the time, calls and bytes per phase'
+            ' for every project and for the whole run into DIR'
+        ),
+    )
+
+    parser.add_argument(
+        '--no-render-cache',
+        action='store_true',
+        help=(
+            'Render every output of every project, instead of sharing the'
+            ' output between projects with identical inputs'
+        ),
+    )
+
+    parsed = parser.parse_args(args)
+    if parsed.output_tar is not None:
+        if parsed.watch or parsed.serve:
+            parser.error('--output-tar writes a single archive')
+        if parsed.output_tar == '-' and parsed.render:
+            parser.error('--render prints to stdout already')
+    if not parsed.path and not parsed.discover:
+        parsed.path = [pathlib.Path.cwd()]
+    return parsed
+
+
+def _get_paths(args: argparse.Namespace) -> typing.Iterable[pathlib.Path]:
+    if not args.discover:
+        return args.path
+
+    from generator.discover import discover
+
+    cfg_name = Project.get_cfg_path(pathlib.Path()).name
+    return itertools.chain(
+        args.path,
+        *(discover(root, cfg_name) for root in args.discover)
+    )
+
+
+def _setup_caches(
+    bytecode_cache_dir: typing.Optional[pathlib.Path],
+    bytecode_cache_size: int,
+    render_cache: bool,
+    precompiled: typing.Optional[pathlib.Path] = None,
+    io_threads: int = 0,
+    output_dir: typing.Optional[pathlib.Path] = None,
+):
+    from generator import prefetch
+    from generator import templates as template_cache
+
+    prefetch.set_io_threads(io_threads)
+    if output_dir is not None:
+        from generator.sink import OverlaySink, set_sink
+
+        set_sink(OverlaySink(directory=output_dir))
+
+    if precompiled is not None:
+        from generator.precompiled import Precompiled
+
+        template_cache.set_precompiled(
+            Precompiled.load(path=precompiled, root=TEMPLATES),
         )
+    if bytecode_cache_dir is not None:
+        template_cache.set_bytecode_cache(
+            template_cache.BytecodeCache(
+                directory=bytecode_cache_dir,
+                max_size=bytecode_cache_size,
+            )
+        )
+    if render_cache:
+        template_cache.set_render_cache(template_cache.RenderCache())
+
+
+def _get_overrides(args: argparse.Namespace) -> dict:
+    # INHERIT does not survive pickling, resolve it before forking
+    return {
+        key: value
+        for key, value in {
+            'node_version': args.node_version,
+        }.items()
+        if value is not INHERIT
+    }
+
+
+def _get_options(args: argparse.Namespace) -> dict:
+    return {
+        'dry_run': args.dry_run,
+        'incremental': args.incremental,
+        'durability': args.fsync,
+    }
+
+
+class Result:
+    __slots__ = (
+        'path',
+        'code',
+        'changed',
+        'drift',
+        'log',
+        'trace',
+        'outputs',
+    )
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        code: int = 0,
+        changed: bool = False,
+        drift: typing.List[str] = None,
+        log: typing.List[str] = None,
+        trace: dict = None,
+        outputs: typing.Dict[str, str] = None,
+    ):
+        self.path = path
+        self.code = code
+        self.changed = changed
+        self.drift = drift or []
+        self.log = log or []
+        self.trace = trace
+        self.outputs = outputs
+
+
+class _CollectingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+def _setup_logging(
+    path: pathlib.Path,
+    handler: logging.Handler = None,
+):
+    logging.root.handlers.clear()
+    logging.basicConfig(
+        level=logging.INFO,
+        format=LOG_FORMAT.format(
+            name=path.resolve().name,
+        ),
+        handlers=[handler] if handler else None,
+    )
+
+
+def _setup_summary_logging():
+    logging.root.handlers.clear()
+    logging.basicConfig(
+        level=logging.INFO,
+        format=LOG_FORMAT.format(name='generator'),
+    )
+
+
+class Job:
+    """Settings shared by all the projects of one run"""
+
+    def __init__(
+        self,
+        options: dict,
+        overrides: dict,
+        changed_templates: typing.Optional[typing.List[pathlib.Path]] = None,
+        check: bool = False,
+        diff: bool = False,
+        profile: bool = False,
+        render: bool = False,
+        since: typing.Optional[str] = None,
+        patches: typing.Sequence[Patch] = (),
+    ):
+        self.options = options
+        self.overrides = overrides
+        self.changed_templates = changed_templates
+        self.check = check
+        self.diff = diff
+        self.profile = profile
+        self.render = render
+        self.since = since
+        self.patches = patches
+
+    def run(
+        self,
+        path: pathlib.Path,
+        changed_templates: typing.Optional[typing.List[pathlib.Path]] = None,
+    ) -> Result:
+        if not self.profile:
+            return self._run(path, changed_templates)
+
+        profiler = profiling.Profiler()
+        profiling.set_profiler(profiler)
+        try:
+            with profiler.phase('project', path=str(path)):
+                result = self._run(path, changed_templates)
+        finally:
+            profiling.set_profiler(None)
+        result.trace = profiler.to_dict()
+        return result
+
+    def _run(
+        self,
+        path: pathlib.Path,
+        changed_templates: typing.Optional[typing.List[pathlib.Path]],
+    ) -> Result:
+        if changed_templates is None:
+            changed_templates = self.changed_templates
 
         try:
             project = Project.from_path(
                 path=path,
-                dry_run=args.dry_run,
-                node_version=args.node_version,
+                **self.options,
+                **self.overrides
             )
         except InvalidConfig as err:
-            return err.args[0]
+            return Result(path=path, code=err.args[0])
+
+        outputs = None
+        if self.since is not None and self._has_changed_inputs(path, project):
+            logger.info('inputs changed since %s', self.since)
+        elif changed_templates is not None:
+            outputs = project.get_affected_outputs(changed_templates)
+        elif self.patches:
+            outputs = set()
+
+        variables = set()
+        if self.patches:
+            try:
+                variables = project.patch(self.patches)
+            except InvalidConfig as err:
+                return Result(path=path, code=err.args[0])
+            if variables and outputs is not None:
+                outputs.update(project.get_outputs_using(variables))
+            logger.info(
+                'patched variables: %s',
+                ', '.join(sorted(variables)) or 'none',
+            )
+
+        if outputs is not None:
+            if not outputs and not variables:
+                logger.info('not affected by the changes')
+                return Result(path=path)
+            logger.info(
+                'affected outputs: %s',
+                ', '.join(sorted(outputs)) or 'none',
+            )
+
+        if self.render:
+            return Result(path=path, outputs=project.render(outputs=outputs))
+        if self.check:
+            return self._check(path, project, outputs)
+
+        return Result(path=path, changed=project.process(outputs=outputs))
+
+    def _has_changed_inputs(
+        self,
+        path: pathlib.Path,
+        project: Project,
+    ) -> bool:
+        from generator.vcs import has_changed_inputs
+        return has_changed_inputs(project, path, self.since)
+
+    def _check(
+        self,
+        path: pathlib.Path,
+        project: Project,
+        outputs: typing.Optional[typing.Set[str]],
+    ) -> Result:
+        drift = project.check(outputs=outputs)
+        for item in drift:
+            if item.expected is None:
+                logger.warning('out of date: %s (orphan)', item.name)
+            else:
+                logger.warning('out of date: %s', item.name)
+            if self.diff:
+                logger.info('diff for %s:\n%s', item.name, item.get_diff())
+
+        return Result(path=path, drift=[item.name for item in drift])
+
+    def run_buffered(
+        self,
+        path: pathlib.Path,
+    ) -> Result:
+        handler = _CollectingHandler()
+        _setup_logging(path, handler)
+        try:
+            result = self.run(path)
+        except Exception:
+            logger.exception('processing failed')
+            result = Result(path=path, code=-1)
+
+        result.log = handler.lines
+        return result
+
+
+def _run_serial(
+    paths: typing.Iterable[pathlib.Path],
+    job: Job,
+    keep_going: bool = False,
+) -> typing.Iterator[Result]:
+    for raw_path in paths:
+        path = pathlib.Path(raw_path)
+        _setup_logging(path)
+        try:
+            result = job.run(path)
+        except Exception:
+            if not keep_going:
+                raise
+            logger.exception('processing failed')
+            result = Result(path=path, code=-1)
+        yield result
+        if result.code and not keep_going:
+            return
+
+
+def _run_parallel(
+    paths: typing.Iterable[pathlib.Path],
+    job: Job,
+    jobs: int,
+    initializer: typing.Callable = None,
+    initargs: tuple = (),
+    keep_going: bool = False,
+) -> typing.Iterator[Result]:
+    import concurrent.futures
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=initializer,
+        initargs=initargs,
+    ) as pool:
+        futures = collections.deque()
+        # a bounded backlog keeps the memory flat for large fleets
+        max_pending = jobs * 2
+
+        def pop() -> Result:
+            result = futures.popleft().result()
+            # keep the output of one project together
+            for line in result.log:
+                sys.stderr.write(line + '\n')
+            result.log = []
+            return result
+
+        def stop(result: Result) -> bool:
+            if not result.code or keep_going:
+                return False
+            # like the serial runner, leave the remaining projects alone
+            for future in futures:
+                future.cancel()
+            return True
+
+        for raw_path in paths:
+            futures.append(
+                pool.submit(job.run_buffered, pathlib.Path(raw_path))
+            )
+            # paths may come in slowly, report in order while submitting
+            while futures and (
+                futures[0].done() or len(futures) >= max_pending
+            ):
+                result = pop()
+                yield result
+                if stop(result):
+                    return
+        while futures:
+            result = pop()
+            yield result
+            if stop(result):
+                return
+
+
+def _log_summary(results: typing.List[Result]):
+    _setup_summary_logging()
+    failed = [result for result in results if result.code]
+    changed = [result for result in results if result.changed]
+    drifted = [result for result in results if result.drift]
+    logger.info(
+        'processed %d projects: %d changed, %d out of date, %d unchanged,'
+        ' %d failed',
+        len(results),
+        len(changed),
+        len(drifted),
+        len(results) - len(changed) - len(drifted) - len(failed),
+        len(failed),
+    )
+    for result in drifted:
+        logger.warning(
+            'out of date: %s (%s)',
+            result.path,
+            ', '.join(result.drift),
+        )
+    for result in failed:
+        logger.warning('failed: %s (code %s)', result.path, result.code)
+
+
+def _write_traces(
+    directory: pathlib.Path,
+    results: typing.List[Result],
+):
+    traces = []
+    names = set()
+    for result in results:
+        if result.trace is None:
+            continue
+        traces.append(result.trace)
+
+        name = pathlib.Path(result.path).resolve().name
+        if name in names:
+            name += '-%d' % len(traces)
+        names.add(name)
+        profiling.write_trace(directory / (name + '.json'), result.trace)
+
+    trace = profiling.merge(traces)
+    profiling.write_trace(directory / 'run.json', trace)
+
+    _setup_summary_logging()
+    for name, stats in sorted(
+        trace['phases'].items(),
+        key=lambda item: item[1]['wall'],
+        reverse=True,
+    ):
+        logger.info(
+            'profile: %-20s %6d calls %9.1fms %9d bytes read'
+            ' %9d bytes written',
+            name,
+            stats['calls'],
+            stats['wall'] * 1000,
+            stats['bytes_read'],
+            stats['bytes_written'],
+        )
+    logger.info('profile: traces written to %s', directory)
+
+
+def _get_changed_templates_since(
+    ref: str,
+    affected_by: typing.Optional[typing.List[pathlib.Path]],
+) -> typing.Optional[typing.List[pathlib.Path]]:
+    from generator.vcs import get_changed_templates
+
+    _setup_summary_logging()
+    changed = get_changed_templates(ref)
+    if changed is None:
+        return None
+    logger.info('%d templates changed since %s', len(changed), ref)
+    return changed + (affected_by or [])
+
+
+def _watch(
+    paths: typing.List[pathlib.Path],
+    job: Job,
+    interval: float,
+) -> int:
+    # imported late, the watch mode is rarely used
+    from generator.watch import watch
+
+    def on_change(
+        path: pathlib.Path,
+        changed_templates: typing.Optional[typing.List[pathlib.Path]],
+    ):
+        _setup_logging(path)
+        try:
+            result = job.run(path, changed_templates=changed_templates)
+        except Exception:
+            logger.exception('processing failed')
+            return
+        if result.changed:
+            logger.info('updated')
+
+    try:
+        watch(
+            paths=paths,
+            on_change=on_change,
+            interval=interval,
+        )
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _get_exit_code(results: typing.List[Result]) -> int:
+    for result in results:
+        if result.code:
+            return result.code
+    for result in results:
+        if result.drift:
+            return EXIT_CODE_DRIFT
+    return 0
+
+
+def _print_outputs(results: typing.List[Result]):
+    json.dump(
+        {str(result.path): result.outputs for result in results},
+        sys.stdout,
+        indent=2,
+        sort_keys=True,
+    )
+    sys.stdout.write('\n')
+
+
+def _get_action(args: argparse.Namespace) -> str:
+    if args.render:
+        return 'render'
+    if args.check:
+        return 'check'
+    return 'update'
+
+
+def _serve(
+    args: argparse.Namespace,
+    caches: tuple,
+) -> int:
+    from generator import templates as template_cache
+    from generator.server import serve
+    from generator.snapshot import SnapshotCache, set_snapshot_cache
+
+    _setup_caches(*caches)
+    set_snapshot_cache(SnapshotCache())
+
+    def dispatch(request: dict) -> dict:
+        action = request.get('action')
+        if action == 'ping':
+            return {'code': 0, 'version': __version__}
+        if action not in ('update', 'check', 'render'):
+            return {'code': -1, 'log': ['unknown action %r' % action]}
+
+        options = _get_options(args)
+        options.update(
+            dry_run=bool(request.get('dry_run')),
+            incremental=bool(
+                request.get('incremental', options['incremental'])
+            ),
+            durability=request.get('durability', options['durability']),
+        )
+        if options['durability'] not in DURABILITY_LEVELS:
+            return {
+                'code': -1,
+                'log': ['unknown durability %r' % options['durability']],
+            }
+
+        # pick up new and deleted templates
+        template_cache.invalidate_graphs()
+        job = Job(
+            options=options,
+            overrides=request.get('overrides', {}),
+            check=action == 'check',
+            diff=bool(request.get('diff')),
+            render=action == 'render',
+            patches=[Patch(*item) for item in request.get('patches', [])],
+        )
+        results = [
+            job.run_buffered(pathlib.Path(path))
+            for path in request.get('paths', [])
+        ]
+        _setup_summary_logging()
+        logger.info('%s: %d projects', action, len(results))
+        return {
+            'code': _get_exit_code(results),
+            'log': [line for result in results for line in result.log],
+            'results': [
+                {
+                    'path': str(result.path),
+                    'code': result.code,
+                    'changed': result.changed,
+                    'drift': result.drift,
+                    'outputs': result.outputs,
+                }
+                for result in results
+            ],
+        }
+
+    _setup_summary_logging()
+    serve(args.serve, dispatch)
+    return 0
+
+
+def _connect(
+    args: argparse.Namespace,
+    paths: typing.Iterable[pathlib.Path],
+) -> int:
+    from generator.server import request
+
+    response = request(
+        path=args.connect,
+        payload={
+            'action': _get_action(args),
+            'paths': [str(pathlib.Path(path).resolve()) for path in paths],
+            'dry_run': args.dry_run,
+            'incremental': args.incremental,
+            'durability': args.fsync,
+            'diff': args.diff,
+            'overrides': _get_overrides(args),
+            'patches': [patch.to_list() for patch in args.patches],
+        },
+    )
+    for line in response['log']:
+        sys.stderr.write(line + '\n')
+    if args.render:
+        _print_outputs([
+            Result(path=result['path'], outputs=result['outputs'])
+            for result in response['results']
+        ])
+    return response['code']
+
+
+def _list_projects(paths: typing.Iterable[pathlib.Path]) -> int:
+    code = 0
+    try:
+        for raw_path in paths:
+            path = pathlib.Path(raw_path)
+            cfg_path = Project.get_cfg_path(path)
+            try:
+                cfg = Config(cfg_path.read_text())
+            except FileNotFoundError:
+                _setup_logging(path)
+                logger.warning('missing %s', cfg_path)
+                code = 1
+                continue
+            print(
+                '{}\t{}\t{}'.format(
+                    path,
+                    cfg.name,
+                    cfg.values.get('language', ''),
+                )
+            )
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # the reader went away, e.g. head; the final flush must not fail
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.close(devnull)
+    return code
+
+
+def _compile_templates(target: pathlib.Path) -> int:
+    from generator.precompiled import compile_templates
+
+    _setup_logging(target)
+    count = compile_templates(root=TEMPLATES, target=target)
+    logger.info('compiled %d templates into %s', count, target)
+    return 0
+
+
+def _collect(
+    paths: typing.Iterable[pathlib.Path],
+    into: typing.List[pathlib.Path],
+) -> typing.Iterator[pathlib.Path]:
+    for path in paths:
+        into.append(pathlib.Path(path))
+        yield path
+
+
+def _open_tar(target: str) -> 'TarSink':
+    from generator.sink import TarSink, set_sink
+
+    tar = TarSink(
+        file=sys.stdout.buffer if target == '-' else pathlib.Path(target),
+    )
+    set_sink(tar)
+    return tar
+
+
+def main(args: argparse.Namespace = None) -> int:
+    if not args:
+        args = get_args()
+
+    paths = _get_paths(args)
+    if args.list_projects:
+        return _list_projects(paths)
+    if args.connect:
+        return _connect(args, paths)
+    if args.compile_templates:
+        return _compile_templates(args.compile_templates)
+
+    jobs = args.jobs or os.cpu_count() or 1
+    changed_templates = args.affected_by
+    since = args.since
+    if since is not None:
+        changed_templates = _get_changed_templates_since(
+            since,
+            args.affected_by,
+        )
+        if changed_templates is None:
+            since = None
+    job = Job(
+        options=_get_options(args),
+        overrides=_get_overrides(args),
+        changed_templates=changed_templates,
+        check=args.check,
+        diff=args.diff,
+        profile=args.profile is not None,
+        render=args.render,
+        since=since,
+        patches=args.patches,
+    )
+    caches = (
+        args.bytecode_cache_dir if args.bytecode_cache else None,
+        args.bytecode_cache_size,
+        # rendering a single project once does not benefit from it
+        not args.no_render_cache and (
+            len(args.path) > 1
+            or bool(args.discover)
+            or args.watch
+            or args.serve is not None
+        ),
+        args.precompiled,
+        args.io_threads,
+        args.output_dir,
+    )
+    if args.serve:
+        return _serve(args, caches)
+
+    keep_going = args.keep_going or args.resume
+    journal = None
+    # the journal may skip projects, the watcher still covers them
+    selected = []  # type: typing.List[pathlib.Path]
+    if args.watch:
+        paths = _collect(paths, selected)
+
+    # checking and rendering write nothing, there is nothing to resume, and
+    #  a tar stream starts over on every run
+    if (
+        keep_going
+        and not args.check
+        and not args.render
+        and args.output_tar is None
+    ):
+        from generator.journal import Journal, get_run_signature
+
+        journal = Journal(
+            path=args.journal,
+            signature=get_run_signature(
+                options=[
+                    job.options,
+                    job.overrides,
+                    job.changed_templates,
+                    job.since,
+                    [patch.to_list() for patch in job.patches],
+                    args.output_dir,
+                ],
+            ),
+            resume=args.resume,
+        )
+        paths = journal.filter(paths)
+
+    tar = None
+    if args.output_tar is not None:
+        tar = _open_tar(args.output_tar)
+        # one process owns the stream
+        jobs = 1
+
+    if jobs == 1:
+        _setup_caches(*caches)
+        runner = _run_serial(
+            paths=paths,
+            job=job,
+            keep_going=keep_going,
+        )
+    else:
+        runner = _run_parallel(
+            paths=paths,
+            job=job,
+            jobs=jobs,
+            initializer=_setup_caches,
+            initargs=caches,
+            keep_going=keep_going,
+        )
+
+    results = []
+    try:
+        for result in runner:
+            results.append(result)
+            if journal is not None and not result.code:
+                journal.record(result.path)
+    finally:
+        # a complete archive and journal for the projects that finished
+        if journal is not None:
+            journal.close()
+        if tar is not None:
+            tar.close()
+
+    if len(results) > 1:
+        _log_summary(results)
+    if journal is not None and journal.skipped:
+        _setup_summary_logging()
+        logger.info(
+            'resumed: skipped %d projects that completed before',
+            journal.skipped,
+        )
+    if args.profile is not None:
+        _write_traces(args.profile, results)
+
+    if args.watch:
+        if jobs > 1:
+            # the watcher runs in this process, not in the workers
+            _setup_caches(*caches)
+        # later changes get picked up by the watcher
+        job.since = None
+        job.changed_templates = args.affected_by
+        job.patches = ()
+        return _watch(
+            paths=selected,
+            job=job,
+            interval=args.watch_interval,
+        )
 
-        project.process()
+    if args.render:
+        _print_outputs(results)
+    return _get_exit_code(results)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,383 @@
+"""Benchmark the render pipeline on a synthetic fleet of projects
+
+python3 -m generator.benchmark --sizes 1,10,100 --output new.json \
+  --compare old.json
+python3 -m generator.benchmark --sizes 1 --memory 1000
+"""
+import argparse
+import gc
+import json
+import logging
+import pathlib
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing
+
+from generator import templates as template_cache
+from generator.project import Project
+from generator.version import __version__
+
+Results = typing.Dict[str, float]
+
+NAMES = (
+    'clsi',
+    'filestore',
+    'real-time',
+    'web',
+)
+DEPENDENCIES = (
+    'minio',
+    'mongo',
+    'redis_api',
+    'redis_pubsub',
+    'redis_websessions',
+)
+
+logger = logging.getLogger('generator.benchmark')
+
+
+def _get_cfg(
+    rng: random.Random,
+    index: int,
+) -> str:
+    if index % 3:
+        name = 'service-%d' % index
+    else:
+        name = NAMES[index // 3 % len(NAMES)]
+    lines = [
+        name,
+        '--language=' + ('runner' if index % 10 == 9 else 'es'),
+        '--node-version=%d.%d.0' % (rng.randint(10, 16), rng.randint(0, 9)),
+    ]
+    dependencies = rng.sample(DEPENDENCIES, rng.randint(0, 3))
+    if dependencies:
+        lines.append('--dependencies=' + ','.join(dependencies) + ',')
+    if rng.random() < 0.3:
+        lines.append('--src-dir=src')
+    return '\n'.join(lines) + '\n'
+
+
+def _add_marker(
+    path: pathlib.Path,
+    marker: str,
+):
+    target = path / marker
+    if marker.endswith('/') or not target.suffix:
+        target.mkdir(parents=True, exist_ok=True)
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.touch()
+
+
+def create_fleet(
+    root: pathlib.Path,
+    count: int,
+    seed: int = 0,
+    start: int = 0,
+) -> typing.List[pathlib.Path]:
+    """Create count projects with varying options and has_* marker files
+
+    The same seed and start create the same fleet.
+    """
+    rng = random.Random(seed)
+    paths = []
+    for index in range(start, start + count):
+        path = root / ('project-%04d' % index)
+        path.mkdir(parents=True)
+        Project.get_cfg_path(path).write_text(_get_cfg(rng, index))
+
+        markers = Project.from_path(path)._get_possible_project_files()
+        for marker in sorted(markers.values()):
+            if rng.random() < 0.4:
+                _add_marker(path, marker)
+        paths.append(path)
+    return paths
+
+
+def _run(
+    paths: typing.List[pathlib.Path],
+) -> typing.Tuple[float, float]:
+    from_path = process = 0.0
+    for path in paths:
+        start = time.perf_counter()
+        project = Project.from_path(path)
+        end = time.perf_counter()
+        project.process()
+        from_path += end - start
+        process += time.perf_counter() - end
+    return from_path, process
+
+
+def _reset_caches(render_cache: bool):
+    template_cache.clear_cache()
+    template_cache.set_render_cache(
+        template_cache.RenderCache() if render_cache else None
+    )
+
+
+def run_benchmark(
+    root: pathlib.Path,
+    sizes: typing.Iterable[int],
+    repeat: int = 3,
+    seed: int = 0,
+) -> Results:
+    """Best of repeat seconds per scenario, fleet size and phase
+
+    The scenarios:
+     - cold: empty caches, all outputs get written
+     - warm: compiled templates in memory, all outputs get written
+     - noop: compiled templates in memory, all outputs are up to date
+    """
+    results = {}  # type: Results
+
+    def record(scenario: str, size: int, timings: tuple):
+        for phase, duration in zip(('from_path', 'process'), timings):
+            key = '{}/{}/{}'.format(scenario, size, phase)
+            results[key] = min(results.get(key, duration), duration)
+
+    for size in sizes:
+        # the cli enables the render cache for more than one project
+        render_cache = size > 1
+        for attempt in range(repeat):
+            directory = root / ('%d-%d' % (size, attempt))
+            fleet = create_fleet(directory / 'cold', size, seed)
+            other = create_fleet(directory / 'warm', size, seed)
+
+            _reset_caches(render_cache)
+            record('cold', size, _run(fleet))
+            record('warm', size, _run(other))
+            record('noop', size, _run(fleet))
+
+            shutil.rmtree(str(directory))
+    _reset_caches(False)
+    return results
+
+
+def _get_retained() -> int:
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def run_memory_benchmark(
+    root: pathlib.Path,
+    size: int,
+    seed: int = 0,
+    render_cache_size: int = 256,
+) -> Results:
+    """Bytes allocated while streaming a fleet of projects through processing
+
+    A first fleet fills the caches, a second one with other project names
+     follows under tracemalloc. Flat memory means the second half of it
+     retains next to nothing per project: the growth. The render cache is
+     bounded already, a small one gets filled by the first fleet.
+    """
+    warmup = create_fleet(root / 'memory' / 'warmup', size, seed)
+    fleet = create_fleet(root / 'memory' / 'fleet', size, seed, start=size)
+    half = size // 2
+    template_cache.clear_cache()
+    template_cache.set_render_cache(
+        template_cache.RenderCache(max_entries=render_cache_size)
+    )
+    try:
+        _run(warmup)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            _run(fleet[:half])
+            middle = _get_retained()
+            _run(fleet[half:])
+            end = _get_retained()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    finally:
+        shutil.rmtree(str(root / 'memory'))
+        _reset_caches(False)
+
+    prefix = 'memory/{}/'.format(size)
+    return {
+        prefix + 'retained': end,
+        prefix + 'peak': peak,
+        prefix + 'growth': (end - middle) / max(size - half, 1),
+    }
+
+
+def check_memory(
+    results: Results,
+    max_growth: float,
+) -> typing.List[str]:
+    """The keys with a growth of more than max_growth bytes per project"""
+    exceeded = []
+    for key, value in sorted(results.items()):
+        if key.endswith('/growth') and value > max_growth:
+            logger.warning(
+                '%s: %d bytes per project, more than %d',
+                key,
+                value,
+                max_growth,
+            )
+            exceeded.append(key)
+    return exceeded
+
+
+def compare(
+    baseline: Results,
+    current: Results,
+    threshold: float,
+    min_delta: float = 0.005,
+) -> typing.List[str]:
+    """Log a comparison and return the keys that got slower
+
+    Differences below min_delta seconds are noise, not a regression.
+    """
+    regressions = []
+    for key in sorted(set(baseline).intersection(current)):
+        ratio = current[key] / baseline[key] if baseline[key] else 1.0
+        marker = ''
+        if (
+            ratio > 1 + threshold
+            and current[key] - baseline[key] > min_delta
+        ):
+            marker = '  REGRESSION'
+            regressions.append(key)
+        logger.info(
+            '%-28s %10.2fms %10.2fms %7.2fx%s',
+            key,
+            baseline[key] * 1000,
+            current[key] * 1000,
+            ratio,
+            marker,
+        )
+    return regressions
+
+
+def get_args(args: typing.Optional[typing.List[str]] = None):
+    parser = argparse.ArgumentParser(
+        'generator.benchmark',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        '--sizes',
+        type=lambda raw: [int(size) for size in raw.split(',')],
+        default=[1, 10, 100, 1000],
+        help='Comma separated numbers of projects',
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Keep the best time of this many runs',
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Seed for the synthetic fleet',
+    )
+    parser.add_argument(
+        '--output',
+        type=pathlib.Path,
+        help='Store the results as json',
+    )
+    parser.add_argument(
+        '--compare',
+        type=pathlib.Path,
+        metavar='BASELINE',
+        help='Compare with the stored results of an earlier run',
+    )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.2,
+        help='Fail on timings that are slower by more than this fraction',
+    )
+    parser.add_argument(
+        '--min-delta',
+        type=float,
+        default=0.005,
+        help='Ignore slowdowns below this many seconds',
+    )
+    parser.add_argument(
+        '--memory',
+        type=int,
+        metavar='SIZE',
+        help='Trace the memory while processing a fleet of this size',
+    )
+    parser.add_argument(
+        '--max-growth',
+        type=int,
+        default=512,
+        help='Fail on a memory growth above this many bytes per project',
+    )
+    return parser.parse_args(args)
+
+
+def main(args: argparse.Namespace = None) -> int:
+    if not args:
+        args = get_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(levelname)s %(name)s: %(message)s',
+    )
+    # keep the logging of the projects out of the timings
+    logging.getLogger('generator.project').setLevel(logging.WARNING)
+
+    root = pathlib.Path(tempfile.mkdtemp())
+    try:
+        results = run_benchmark(
+            root=root,
+            sizes=args.sizes,
+            repeat=args.repeat,
+            seed=args.seed,
+        )
+        memory = {}  # type: Results
+        if args.memory:
+            memory = run_memory_benchmark(
+                root=root,
+                size=args.memory,
+                seed=args.seed,
+            )
+    finally:
+        shutil.rmtree(str(root))
+
+    report = {
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'results': results,
+        'memory': memory,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        for key, duration in sorted(results.items()):
+            logger.info('%-28s %10.2fms', key, duration * 1000)
+        for key, value in sorted(memory.items()):
+            logger.info('%-28s %10.1fKiB', key, value / 1024)
+
+    if check_memory(memory, args.max_growth):
+        return 1
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        regressions = compare(
+            baseline=baseline['results'],
+            current=results,
+            threshold=args.threshold,
+            min_delta=args.min_delta,
+        )
+        if regressions:
+            logger.warning('%d timings regressed', len(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
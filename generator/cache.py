@@ -0,0 +1,14 @@
+import os
+import pathlib
+
+BYTECODE_CACHE_MAX_SIZE = 32 * 1024 * 1024
+RENDER_CACHE_MAX_ENTRIES = 4096
+
+
+def get_cache_dir() -> pathlib.Path:
+    base = os.environ.get('XDG_CACHE_HOME')
+    if base:
+        root = pathlib.Path(base)
+    else:
+        root = pathlib.Path.home() / '.cache'
+    return root / 'sharelatex-dev-env'
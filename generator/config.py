@@ -0,0 +1,204 @@
+import typing
+
+from generator.manifest import hash_text
+
+Value = typing.Union[None, str, typing.List[str]]
+Cfg = typing.Dict[str, Value]
+
+
+def parse(
+    raw: str,
+) -> Cfg:
+    values = {}  # type: Cfg
+
+    for line in raw.splitlines():
+        if line[:2] != '--':
+            values['name'] = line
+            continue
+
+        argument, value = line[2:].split('=', 1)
+
+        if ',' in value:
+            value = [item for item in value.split(',') if item]
+
+        if value == 'None':
+            value = None
+
+        values[argument.replace('-', '_')] = value
+
+    return values
+
+
+PATCH_SET = 'set'
+PATCH_APPEND = 'append'
+PATCH_REMOVE = 'remove'
+PATCH_OPERATIONS = (
+    PATCH_SET,
+    PATCH_APPEND,
+    PATCH_REMOVE,
+)
+
+# the value of a field that gets dropped from the config
+DELETE = object()
+
+
+class Patch:
+    """One change of a field: set it, append to or remove from a list
+
+    The value uses the syntax of buildscript.txt: a comma separates list
+     items. Removing without a value drops the whole field.
+    """
+
+    def __init__(
+        self,
+        operation: str,
+        key: str,
+        value: Value = None,
+    ):
+        if operation not in PATCH_OPERATIONS:
+            raise ValueError('unknown operation {!r}'.format(operation))
+        if key in ('name', 'language'):
+            raise ValueError('cannot patch the {}'.format(key))
+        self.operation = operation
+        self.key = key
+        self.value = value
+
+    @classmethod
+    def parse(
+        cls,
+        operation: str,
+        raw: str,
+    ) -> 'Patch':
+        if '=' not in raw:
+            if operation != PATCH_REMOVE:
+                raise ValueError('expected key=value, got {!r}'.format(raw))
+            return cls(operation, raw.replace('-', '_'))
+
+        [(key, value)] = parse('--' + raw).items()
+        return cls(operation, key, value)
+
+    def __repr__(self):
+        return '<Patch {} {}={!r}>'.format(
+            self.operation,
+            self.key,
+            self.value,
+        )
+
+    def to_list(self) -> list:
+        return [self.operation, self.key, self.value]
+
+    def _get_items(self) -> typing.List[str]:
+        if isinstance(self.value, list):
+            return self.value
+        if self.value is None:
+            return []
+        return [self.value]
+
+    def apply(
+        self,
+        current: Value,
+    ) -> typing.Any:
+        """The new value of the field, or DELETE"""
+        if self.operation == PATCH_SET:
+            return self.value
+
+        if isinstance(current, list):
+            items = list(current)
+        elif current:
+            items = [current]
+        else:
+            items = []
+
+        if self.operation == PATCH_APPEND:
+            for item in self._get_items():
+                if item not in items:
+                    items.append(item)
+            return items
+
+        if self.value is None:
+            return DELETE
+        removed = self._get_items()
+        return [item for item in items if item not in removed]
+
+
+class FieldOrder:
+    """Sort keys for the fields of a config, computed once per language
+
+    Known fields keep the given order, unknown fields go sorted by name to
+     the position of the insert marker.
+    """
+
+    def __init__(
+        self,
+        fields: typing.Sequence[str],
+        insert_marker: str,
+    ):
+        self._marker = fields.index(insert_marker)
+        self._positions = {
+            field: (position, '')
+            for position, field in enumerate(fields)
+            if field != insert_marker
+        }
+
+    def key(self, field: str) -> typing.Tuple[int, str]:
+        return self._positions.get(field, (self._marker, field))
+
+
+def serialize(
+    name: str,
+    values: Cfg,
+    order: FieldOrder,
+) -> str:
+    lines = [
+        name,
+    ]
+    for field in sorted(values, key=order.key):
+        value = values[field]
+        if isinstance(value, list):
+            value = ','.join(value)
+            if ',' not in value:
+                value += ','
+        lines.append(
+            '--{field}={value}'.format(
+                field=field.replace('_', '-'),
+                value=value,
+            )
+        )
+
+    lines.append('')
+    return '\n'.join(lines)
+
+
+class Config:
+    """A buildscript.txt, parsed once
+
+    The original text and its hash stay around, detecting changes of the
+     fields needs no further I/O.
+    """
+
+    def __init__(
+        self,
+        raw: str,
+    ):
+        self.raw = raw
+        self.digest = hash_text(raw)
+        self.values = parse(raw)
+        self.fields = {
+            key: value
+            for key, value in self.values.items()
+            if key not in ('name', 'language')
+        }  # type: Cfg
+
+    @property
+    def name(self) -> str:
+        return self.values.get('name', '')
+
+    @property
+    def language(self) -> str:
+        return self.values['language']
+
+    def is_unchanged(
+        self,
+        fields: Cfg,
+    ) -> bool:
+        return fields == self.fields
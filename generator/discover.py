@@ -0,0 +1,51 @@
+import os
+import pathlib
+import typing
+
+# dependencies, vcs metadata and build outputs never hold projects
+PRUNE = frozenset({
+    '.git',
+    '.hg',
+    '.svn',
+    '.tox',
+    '.venv',
+    '__pycache__',
+    'build',
+    'dist',
+    'node_modules',
+    'output',
+})
+
+
+def discover(
+    root: pathlib.Path,
+    cfg_name: str,
+    prune: typing.AbstractSet[str] = PRUNE,
+) -> typing.Iterator[pathlib.Path]:
+    """Yield every directory below root that holds a cfg_name file
+
+    Directories are yielded while walking, in sorted order. Symlinks to
+     directories are not followed.
+    """
+    pending = [str(root)]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+
+        children = []
+        for entry in entries:
+            if entry.name == cfg_name:
+                if entry.is_file():
+                    yield pathlib.Path(directory)
+            elif entry.name not in prune:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        children.append(entry.path)
+                except OSError:
+                    continue
+        # depth first, keep the sorted order
+        pending.extend(reversed(children))
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import typing
+
+from generator.project import (
+    InvalidConfig,
+    Project,
+    TEMPLATES,
+)
+from generator.snapshot import Snapshot
+from generator.version import __version__
+
+logger = logging.getLogger(__name__)
+
+
+def get_run_signature(
+    options: dict,
+    templates: pathlib.Path = TEMPLATES,
+) -> str:
+    """The inputs shared by all the projects of one run"""
+    files = []
+    for directory, _, names in os.walk(str(templates)):
+        for name in names:
+            stat = os.stat(os.path.join(directory, name))
+            files.append([
+                os.path.relpath(os.path.join(directory, name), str(templates)),
+                stat.st_mtime_ns,
+                stat.st_size,
+            ])
+    return hashlib.sha1(
+        json.dumps(
+            [__version__, options, sorted(files)],
+            sort_keys=True,
+            default=str,
+        ).encode()
+    ).hexdigest()
+
+
+def get_fingerprint(
+    path: pathlib.Path,
+    signature: str,
+) -> typing.Optional[str]:
+    """The inputs of a project: its config and its has_* marker files"""
+    try:
+        project = Project.from_path(path)
+    except (InvalidConfig, OSError):
+        return None
+
+    markers = Snapshot(path).probe(project._get_possible_project_files())
+    return hashlib.sha1(
+        json.dumps(
+            [signature, project._cfg.digest, sorted(markers.items())],
+        ).encode()
+    ).hexdigest()
+
+
+class Journal:
+    """Append-only record of the projects that completed a run
+
+    One json line per project, the last line of a project wins. Every line
+     is flushed right away, an aborted run keeps its checkpoints.
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        signature: str,
+        resume: bool = False,
+    ):
+        self._path = path
+        self._signature = signature
+        self._entries = {}  # type: typing.Dict[str, str]
+        if resume:
+            self._entries = self._load(path)
+        self.skipped = 0
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = path.open('a' if resume else 'w')
+
+    @staticmethod
+    def _load(path: pathlib.Path) -> typing.Dict[str, str]:
+        entries = {}
+        try:
+            lines = path.read_text().splitlines()
+        except FileNotFoundError:
+            return entries
+
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # a torn write of an aborted run
+                continue
+            entries[entry['path']] = entry['fingerprint']
+        return entries
+
+    @staticmethod
+    def _get_key(path: pathlib.Path) -> str:
+        return str(pathlib.Path(path).resolve())
+
+    def is_done(
+        self,
+        path: pathlib.Path,
+    ) -> bool:
+        previous = self._entries.get(self._get_key(path))
+        if previous is None:
+            return False
+        return previous == get_fingerprint(path, self._signature)
+
+    def filter(
+        self,
+        paths: typing.Iterable[pathlib.Path],
+    ) -> typing.Iterator[pathlib.Path]:
+        for raw_path in paths:
+            path = pathlib.Path(raw_path)
+            if self.is_done(path):
+                self.skipped += 1
+                continue
+            yield path
+
+    def record(
+        self,
+        path: pathlib.Path,
+    ):
+        fingerprint = get_fingerprint(path, self._signature)
+        if fingerprint is None:
+            return
+
+        key = self._get_key(path)
+        self._entries[key] = fingerprint
+        self._file.write(
+            json.dumps({'path': key, 'fingerprint': fingerprint}) + '\n'
+        )
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import pathlib
+import typing
+
+from generator.cache import get_cache_dir
+from generator.version import __version__
+
+Stat = typing.Optional[typing.List[int]]
+
+
+def get_stat(path: typing.Union[str, pathlib.Path]) -> Stat:
+    try:
+        stat = os.stat(str(path))
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def hash_file(path: typing.Union[str, pathlib.Path]) -> typing.Optional[str]:
+    try:
+        with open(str(path), 'rb') as file:
+            return hashlib.sha1(file.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def hash_env(env: dict) -> str:
+    return hash_text(json.dumps(env, sort_keys=True, default=repr))
+
+
+class Manifest:
+    """Inputs and outputs of the last run for skipping unchanged outputs
+
+    An entry is fresh when the env, all the template sources and the target
+     are unchanged. Any change to the stat of a file falls back to comparing
+     its hash.
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        env_hash: str,
+        search_path: typing.List[pathlib.Path],
+    ):
+        self._path = path
+        self._env_hash = env_hash
+        self._search_path = {
+            str(directory): get_stat(directory)
+            for directory in search_path
+        }
+        self._entries = {}  # type: typing.Dict[str, dict]
+        self._changed = False
+
+    def __contains__(self, item):
+        return item in self._entries
+
+    @staticmethod
+    def get_path(project_path: pathlib.Path) -> pathlib.Path:
+        key = hash_text(str(project_path.resolve()))
+        return get_cache_dir() / 'manifests' / (key + '.json')
+
+    @classmethod
+    def load(
+        cls,
+        path: pathlib.Path,
+        env: dict,
+        search_path: typing.List[pathlib.Path],
+    ) -> 'Manifest':
+        manifest = cls(
+            path=path,
+            env_hash=hash_env(env),
+            search_path=search_path,
+        )
+        try:
+            raw = json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            return manifest
+
+        if raw.get('version') != __version__:
+            return manifest
+        # new templates may shadow the recorded ones
+        if raw.get('search_path') != manifest._search_path:
+            return manifest
+
+        manifest._entries = raw.get('entries', {})
+        return manifest
+
+    def _is_file_fresh(
+        self,
+        path: str,
+        record: list,
+    ) -> bool:
+        stat = get_stat(path)
+        if stat == record[0]:
+            return True
+        if stat is None or hash_file(path) != record[1]:
+            return False
+
+        # touched only, refresh the stat
+        record[0] = stat
+        self._changed = True
+        return True
+
+    def is_fresh(
+        self,
+        name: str,
+        target: pathlib.Path,
+        sources: typing.Optional[typing.List[str]],
+    ) -> bool:
+        """sources are the currently resolved templates of the output
+
+        A template added to a higher layer shadows a recorded one without
+         changing any recorded stat, the resolution has to match.
+        """
+        entry = self._entries.get(name)
+        if entry is None or sources is None:
+            return False
+
+        if entry['env'] != self._env_hash:
+            return False
+
+        if sorted(entry['sources']) != sorted(sources):
+            return False
+
+        for filename, record in entry['sources'].items():
+            if not self._is_file_fresh(filename, record):
+                return False
+
+        return self._is_file_fresh(str(target), entry['target'])
+
+    def record(
+        self,
+        name: str,
+        sources: typing.List[str],
+        output: str,
+        target: pathlib.Path,
+    ):
+        target_stat = get_stat(target)
+        self._entries[name] = {
+            'env': self._env_hash,
+            'sources': {
+                filename: [get_stat(filename), hash_file(filename)]
+                for filename in sources
+            },
+            'output': hash_text(output),
+            'target': [
+                target_stat,
+                hash_file(target) if target_stat else None,
+            ],
+        }
+        self._changed = True
+
+    def discard(self, name: str):
+        if self._entries.pop(name, None) is not None:
+            self._changed = True
+
+    def save(self) -> bool:
+        if not self._changed:
+            return False
+
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._path.with_suffix('.tmp')
+        tmp.write_text(
+            json.dumps(
+                {
+                    'version': __version__,
+                    'search_path': self._search_path,
+                    'entries': self._entries,
+                },
+                sort_keys=True,
+            )
+        )
+        os.replace(str(tmp), str(self._path))
+        self._changed = False
+        return True
@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import pathlib
+import typing
+import zipfile
+
+import jinja2
+
+from generator.manifest import hash_file
+from generator.templates import (
+    ENV_OPTIONS,
+    ParsedTemplate,
+    parse,
+)
+from generator.version import __version__
+
+INDEX = 'index.json'
+
+logger = logging.getLogger(__name__)
+
+
+def _get_template_names(
+    root: pathlib.Path,
+) -> typing.Dict[str, str]:
+    names = {}
+    for directory, _, files in os.walk(str(root)):
+        for file in files:
+            if not file.endswith('.j2'):
+                continue
+            filename = os.path.join(directory, file)
+            name = pathlib.Path(filename).relative_to(root).as_posix()
+            names[name] = filename
+    return names
+
+
+def compile_templates(
+    root: pathlib.Path,
+    target: pathlib.Path,
+) -> int:
+    """Compile all the templates below root into python modules
+
+    The modules are named after the path of the template relative to root,
+     a target ending in .zip gets a zip archive, any other a directory.
+    """
+    env = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(searchpath=[str(root)]),
+        **ENV_OPTIONS
+    )
+    archive = target.suffix == '.zip'
+    env.compile_templates(
+        target=str(target),
+        extensions=['j2'],
+        zip='deflated' if archive else None,
+        ignore_errors=False,
+    )
+
+    entries = {}
+    for name, filename in sorted(_get_template_names(root).items()):
+        parsed = parse(filename)
+        entries[name] = {
+            'checksum': hash_file(filename),
+            'references': (
+                None if parsed.references is None
+                else sorted(parsed.references)
+            ),
+            'variables': sorted(parsed.variables),
+        }
+    index = json.dumps(
+        {
+            'version': __version__,
+            'jinja2': jinja2.__version__,
+            'templates': entries,
+        },
+        sort_keys=True,
+    )
+    if archive:
+        with zipfile.ZipFile(str(target), 'a') as file:
+            file.writestr(INDEX, index)
+    else:
+        (target / INDEX).write_text(index)
+    return len(entries)
+
+
+class PrefixedLoader(jinja2.BaseLoader):
+    """Load a search path directory from the modules of the whole tree"""
+
+    has_source_access = False
+
+    def __init__(
+        self,
+        modules: jinja2.ModuleLoader,
+        prefix: str,
+    ):
+        self._modules = modules
+        self._prefix = prefix
+
+    def load(
+        self,
+        environment: jinja2.Environment,
+        name: str,
+        globals: typing.Optional[typing.MutableMapping] = None,
+    ) -> jinja2.Template:
+        return self._modules.load(environment, self._prefix + name, globals)
+
+
+class Precompiled:
+    """Templates compiled ahead of time by compile_templates
+
+    The modules skip lexing, parsing and compiling of the templates, the
+     index holds their references and variables for the TemplateGraph.
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        root: pathlib.Path,
+        entries: typing.Dict[str, dict],
+    ):
+        self._abs_root = os.path.abspath(str(root))
+        self._entries = entries
+        self._modules = jinja2.ModuleLoader(str(path))
+        self._parsed = {}  # type: typing.Dict[str, ParsedTemplate]
+
+    @classmethod
+    def load(
+        cls,
+        path: pathlib.Path,
+        root: pathlib.Path,
+    ) -> typing.Optional['Precompiled']:
+        """Returns None in case the modules do not match the templates"""
+        try:
+            if path.suffix == '.zip':
+                with zipfile.ZipFile(str(path)) as file:
+                    raw = file.read(INDEX)
+            else:
+                raw = (path / INDEX).read_bytes()
+        except (OSError, KeyError, zipfile.BadZipFile):
+            logger.warning('no precompiled templates at %s', path)
+            return None
+
+        index = json.loads(raw.decode())
+        if (
+            index['version'] != __version__
+            or index['jinja2'] != jinja2.__version__
+        ):
+            logger.warning('precompiled templates at %s are outdated', path)
+            return None
+
+        entries = index['templates']
+        names = _get_template_names(root)
+        if set(names) != set(entries) or any(
+            hash_file(filename) != entries[name]['checksum']
+            for name, filename in names.items()
+        ):
+            logger.warning('precompiled templates at %s are outdated', path)
+            return None
+
+        return cls(path=path, root=root, entries=entries)
+
+    def get_loader(
+        self,
+        directory: str,
+    ) -> typing.Optional[jinja2.BaseLoader]:
+        """None for a directory outside of the precompiled tree"""
+        try:
+            relative = pathlib.Path(
+                os.path.abspath(directory),
+            ).relative_to(self._abs_root)
+        except ValueError:
+            return None
+
+        prefix = relative.as_posix() + '/'
+        if prefix == './':
+            prefix = ''
+        return PrefixedLoader(modules=self._modules, prefix=prefix)
+
+    def get_parsed(
+        self,
+        filename: str,
+    ) -> typing.Optional[ParsedTemplate]:
+        if filename not in self._parsed:
+            name = os.path.relpath(filename, self._abs_root)
+            entry = self._entries.get(name.replace(os.sep, '/'))
+            if entry is None:
+                return None
+
+            references = entry['references']
+            self._parsed[filename] = ParsedTemplate(
+                references=None if references is None else set(references),
+                variables=set(entry['variables']),
+            )
+        return self._parsed[filename]
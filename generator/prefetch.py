@@ -0,0 +1,62 @@
+"""Overlap the disk access of a project with rendering
+
+Every syscall adds latency on bind mounts and network file systems. A thread
+ pool scans the directories and reads the targets of a project ahead of the
+ main thread, which renders as the data arrives. The transaction hands its
+ writes to the same pool.
+"""
+import pathlib
+import typing
+
+if typing.TYPE_CHECKING:
+    import concurrent.futures
+
+_executor = None  # type: typing.Optional[concurrent.futures.ThreadPoolExecutor]
+
+
+def set_io_threads(count: int):
+    """Zero threads keep all the I/O on the main thread"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    if count > 0:
+        import concurrent.futures
+
+        _executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=count,
+            thread_name_prefix='generator-io',
+        )
+
+
+def get_executor() -> typing.Optional['concurrent.futures.Executor']:
+    return _executor
+
+
+def _read(path: pathlib.Path) -> typing.Optional[str]:
+    try:
+        return path.read_text()
+    except FileNotFoundError:
+        return None
+
+
+class Prefetched:
+    """Contents of files, read ahead on a thread pool"""
+
+    def __init__(
+        self,
+        executor: 'concurrent.futures.Executor',
+        paths: typing.Dict[str, pathlib.Path],
+        read: typing.Callable[[pathlib.Path], typing.Optional[str]] = _read,
+    ):
+        self._futures = {
+            name: executor.submit(read, path)
+            for name, path in paths.items()
+        }
+
+    def get(self, name: str) -> typing.Optional[str]:
+        """None for a file that does not exist"""
+        future = self._futures.pop(name, None)
+        if future is None:
+            return None
+        return future.result()
@@ -0,0 +1,218 @@
+import json
+import os
+import pathlib
+import time
+import typing
+
+# the phase counters and trace events of the current project
+_profiler = None  # type: typing.Optional[Profiler]
+
+Stats = typing.Dict[str, typing.Dict[str, typing.Union[int, float]]]
+
+
+class Span:
+    __slots__ = ('bytes_read', 'bytes_written')
+
+    def __init__(self):
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+
+class _NullPhase:
+    """Stand-in while profiling is disabled, discards all counters"""
+
+    def __init__(self):
+        self._span = Span()
+
+    def __enter__(self) -> Span:
+        return self._span
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_null_phase = _NullPhase()
+
+
+class _Phase:
+    def __init__(
+        self,
+        profiler: 'Profiler',
+        name: str,
+        args: dict,
+    ):
+        self._profiler = profiler
+        self._name = name
+        self._args = args
+        self._span = Span()
+        self._start = 0.0
+
+    def __enter__(self) -> Span:
+        self._start = time.perf_counter()
+        return self._span
+
+    def __exit__(self, *exc_info):
+        self._profiler.add(
+            name=self._name,
+            start=self._start,
+            duration=time.perf_counter() - self._start,
+            span=self._span,
+            args=self._args,
+        )
+        return False
+
+
+class Profiler:
+    """Wall time, calls and bytes per phase, plus a Chrome trace
+
+    Durations include nested phases, e.g. compare includes the rendering of
+     the chunks it compares. The trace opens in chrome://tracing or
+     https://ui.perfetto.dev.
+    """
+
+    def __init__(self):
+        self.events = []  # type: typing.List[dict]
+        self.phases = {}  # type: Stats
+        self._pid = os.getpid()
+        # perf_counter has no defined epoch, align processes via time()
+        self._offset = time.time() - time.perf_counter()
+
+    def add(
+        self,
+        name: str,
+        start: float,
+        duration: float,
+        span: Span,
+        args: dict,
+    ):
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = self.phases[name] = {
+                'calls': 0,
+                'wall': 0.0,
+                'bytes_read': 0,
+                'bytes_written': 0,
+            }
+        stats['calls'] += 1
+        stats['wall'] += duration
+        stats['bytes_read'] += span.bytes_read
+        stats['bytes_written'] += span.bytes_written
+
+        args = dict(args)
+        if span.bytes_read:
+            args['bytes_read'] = span.bytes_read
+        if span.bytes_written:
+            args['bytes_written'] = span.bytes_written
+        self.events.append({
+            'name': name,
+            'ph': 'X',
+            'ts': round((start + self._offset) * 1e6),
+            'dur': round(duration * 1e6),
+            'pid': self._pid,
+            'tid': 0,
+            'args': args,
+        })
+
+    def phase(
+        self,
+        name: str,
+        **args
+    ) -> _Phase:
+        return _Phase(profiler=self, name=name, args=args)
+
+    def iterate(
+        self,
+        name: str,
+        iterator: typing.Iterable,
+        **args
+    ) -> typing.Iterator:
+        # one span for all the items, not one per item
+        iterator = iter(iterator)
+        start = time.perf_counter()
+        duration = 0.0
+        chunks = 0
+        try:
+            while True:
+                before = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    duration += time.perf_counter() - before
+                chunks += 1
+                yield item
+        finally:
+            self.add(
+                name=name,
+                start=start,
+                duration=duration,
+                span=Span(),
+                args=dict(args, chunks=chunks),
+            )
+
+    def to_dict(self) -> dict:
+        return {
+            'traceEvents': self.events,
+            'displayTimeUnit': 'ms',
+            'phases': self.phases,
+        }
+
+
+def get_profiler() -> typing.Optional[Profiler]:
+    return _profiler
+
+
+def set_profiler(
+    profiler: typing.Optional[Profiler],
+):
+    global _profiler
+    _profiler = profiler
+
+
+def phase(
+    name: str,
+    **args
+) -> typing.Union[_Phase, _NullPhase]:
+    """Time a block and count its bytes, a no-op without a profiler"""
+    if _profiler is None:
+        return _null_phase
+    return _profiler.phase(name, **args)
+
+
+def iterate(
+    name: str,
+    iterator: typing.Iterable,
+    **args
+) -> typing.Iterable:
+    """Time the production of all items, a no-op without a profiler"""
+    if _profiler is None:
+        return iterator
+    return _profiler.iterate(name, iterator, **args)
+
+
+def merge(
+    traces: typing.Iterable[dict],
+) -> dict:
+    """Aggregate the traces of several projects"""
+    events = []
+    phases = {}  # type: Stats
+    for trace in traces:
+        events.extend(trace['traceEvents'])
+        for name, stats in trace['phases'].items():
+            total = phases.setdefault(name, dict.fromkeys(stats, 0))
+            for key, value in stats.items():
+                total[key] += value
+    return {
+        'traceEvents': events,
+        'displayTimeUnit': 'ms',
+        'phases': phases,
+    }
+
+
+def write_trace(
+    path: pathlib.Path,
+    trace: dict,
+):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(trace, sort_keys=True))
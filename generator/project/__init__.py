@@ -1,19 +1,47 @@
-import copy
+import importlib
 import logging
 import pathlib
-import re
 import typing
 
-import jinja2
-
+from generator import prefetch
+from generator import profiling
+from generator import stream
+from generator.config import (
+    Cfg,
+    Config,
+    DELETE,
+    FieldOrder,
+    Patch,
+    parse,
+    serialize,
+)
+from generator.manifest import Manifest
+from generator.sink import get_sink
+from generator.snapshot import Snapshot
+from generator.transaction import (
+    DURABILITY_NONE,
+    Transaction,
+)
 from generator.version import __version__
 
+if typing.TYPE_CHECKING:
+    import jinja2
+    from generator import templates as template_cache
+    from generator.templates import TemplateGraph
+
 REPO = pathlib.Path(__file__).parent.parent.parent
 TEMPLATES = REPO / 'templates'  # type: pathlib.Path
 
 INHERIT = object()
 
-Cfg = typing.Dict[str, typing.Union[str, typing.List[str]]]
+# the validation codes 1 and 2 come from the dependencies, 3 is drift
+CODE_MISSING_LANGUAGE = 4
+
+# the language specific subclasses register themselves on import
+LANGUAGE_MODULES = {
+    'es': 'generator.project.es',
+    'runner': 'generator.project.runner',
+}
 
 
 logger = logging.getLogger(__name__)
@@ -23,8 +51,56 @@ class InvalidConfig(Exception):
     """check the log for an explanation"""
 
 
+class Drift:
+    """An output that differs from what the templates render"""
+
+    def __init__(
+        self,
+        name: str,
+        current: typing.Optional[str],
+        expected: typing.Optional[str],
+    ):
+        self.name = name
+        self.current = current
+        self.expected = expected
+
+    def __repr__(self):
+        return '<Drift {}>'.format(self.name)
+
+    def get_diff(self) -> str:
+        import difflib
+
+        return ''.join(
+            difflib.unified_diff(
+                (self.current or '').splitlines(keepends=True),
+                (self.expected or '').splitlines(keepends=True),
+                fromfile='a/' + self.name,
+                tofile='b/' + self.name,
+            )
+        )
+
+
 class Project:
+    # fleet runs create thousands of projects, keep the instances compact
+    __slots__ = (
+        '_cfg',
+        '_changed',
+        '_dry_run',
+        '_durability',
+        '_env',
+        '_graph',
+        '_incremental',
+        '_kwargs',
+        '_manifest',
+        '_name',
+        '_path',
+        '_search_path',
+        '_snapshot',
+        '_templates',
+        '_transaction',
+    )
     _languages = {}  # type: typing.Dict[str, typing.Type[Project]]
+    _field_orders = {}  # type: typing.Dict[typing.Type[Project], FieldOrder]
     language = ''
     insert_marker = 'INSERT_MARKER'
 
@@ -34,36 +110,119 @@ class Project:
         path: pathlib.Path,
         dry_run: bool = False,
         templates: pathlib.Path = TEMPLATES,
+        incremental: bool = False,
+        durability: str = DURABILITY_NONE,
         **kwargs
     ):
-        self._org_kwargs = copy.deepcopy(kwargs)
-
         if 'script_version' in kwargs:
             kwargs['script_version'] = __version__
 
         self._name = name
         self._path = path
         self._dry_run = dry_run
+        self._incremental = incremental
+        self._durability = durability
+        self._manifest = None  # type: typing.Optional[Manifest]
+        self._snapshot = None  # type: typing.Optional[Snapshot]
+        self._transaction = None  # type: typing.Optional[Transaction]
+        # a shallow copy from the call: the values are shared with the
+        #  Config, writes replace values and never modify them in place
         self._kwargs = kwargs
         self._templates = templates
         self._changed = False
+        self._cfg = None  # type: typing.Optional[Config]
 
         if 'script_version' in self:
             del self['script_version']
 
-        search_path = self._get_search_path(
+        self._search_path = self._get_search_path(
             templates=templates,
             project_name=name,
         )
+        self._env = None  # type: typing.Optional[jinja2.Environment]
+        self._graph = None  # type: typing.Optional[TemplateGraph]
 
-        self._template_env = jinja2.Environment(
-            loader=jinja2.FileSystemLoader(
-                searchpath=search_path,
-            ),
-            lstrip_blocks=True,
-            trim_blocks=True,
-            keep_trailing_newline=True,
-        )
+    @property
+    def _template_env(self) -> 'jinja2.Environment':
+        # jinja is imported late, only when rendering actually happens
+        from generator import templates as template_cache
+
+        # shared with all the other projects using the same templates
+        if self._env is None:
+            self._env = template_cache.get_environment(self._search_path)
+        return self._env
+
+    def get_template_graph(self) -> 'template_cache.TemplateGraph':
+        from generator import templates as template_cache
+
+        if self._graph is None:
+            self._graph = template_cache.get_graph(self._search_path)
+        return self._graph
+
+    def get_affected_outputs(
+        self,
+        paths: typing.Iterable[pathlib.Path],
+    ) -> typing.Set[str]:
+        """Outputs that need an update after changing the given templates"""
+        graph = self.get_template_graph()
+        names = set()
+        for path in paths:
+            names.update(graph.get_names(path))
+
+        outputs = set()
+        for file in self._get_files_to_update():
+            closure = graph.get_closure(self._get_template_name(file))
+            if closure is None or closure & names:
+                outputs.add(file)
+        return outputs
+
+    def get_outputs_using(
+        self,
+        variables: typing.Set[str],
+    ) -> typing.Set[str]:
+        """Outputs with templates that may access any of the variables"""
+        graph = self.get_template_graph()
+        outputs = set()
+        for file in self._get_files_to_update():
+            used = graph.get_variables(self._get_template_name(file))
+            if used is None or used & variables:
+                outputs.add(file)
+        return outputs
+
+    def patch(
+        self,
+        patches: typing.Iterable[Patch],
+    ) -> typing.Set[str]:
+        """Apply the patches and return the env variables that changed
+
+        Comparing the env catches derived values too, e.g. has_* flags that
+         depend on a field. A patched config that does not validate raises
+         InvalidConfig before anything gets rendered.
+        """
+        self._snapshot = get_sink().get_snapshot(self._path)
+        try:
+            before = self._get_env()
+            for item in patches:
+                value = item.apply(self._kwargs.get(item.key))
+                if value is DELETE:
+                    if item.key in self:
+                        del self[item.key]
+                else:
+                    self[item.key] = value
+            code = self._validate_cfg(self._kwargs)
+            if code:
+                raise InvalidConfig(code)
+            after = self._get_env()
+        finally:
+            self._snapshot = None
+
+        return {
+            key
+            for key in set(before).union(after)
+            if key not in before
+            or key not in after
+            or before[key] != after[key]
+        }
 
     def __eq__(self, other):
         if not isinstance(other, Project):
@@ -110,6 +269,9 @@ class Project:
         cls,
         language: str,
     ) -> 'typing.Type[Project]':
+        if language not in cls._languages and language in LANGUAGE_MODULES:
+            importlib.import_module(LANGUAGE_MODULES[language])
+
         for lang, target in cls._languages.items():
             if language == lang:
                 return target
@@ -120,22 +282,34 @@ class Project:
         cls,
         path: pathlib.Path,
         dry_run: bool = False,
+        incremental: bool = False,
+        durability: str = DURABILITY_NONE,
         **override
     ) -> 'Project':
-        raw = cls.get_cfg_path(path).read_text()
-        kwargs = cls._parse_cfg(raw)
-        code = cls._validate_cfg(kwargs)
+        with profiling.phase('parse_cfg') as span:
+            raw = get_sink().read(cls.get_cfg_path(path))
+            if raw is None:
+                raise FileNotFoundError('no config in {}'.format(path))
+            cfg = Config(raw)
+            span.bytes_read += len(cfg.raw)
+            code = cls._validate_cfg(cfg.values)
         if code:
             raise InvalidConfig(code)
+        if 'language' not in cfg.values:
+            logger.warning('the language is missing, add --language=...')
+            raise InvalidConfig(CODE_MISSING_LANGUAGE)
 
-        target = cls._get_subclass(kwargs['language'])
-        del kwargs['language']
+        target = cls._get_subclass(cfg.language)
 
         instance = target(
+            name=cfg.name,
             path=path,
             dry_run=dry_run,
-            **kwargs
+            incremental=incremental,
+            durability=durability,
+            **cfg.fields
         )
+        instance._cfg = cfg
         for key, value in override.items():
             if value is INHERIT:
                 continue
@@ -176,48 +350,43 @@ class Project:
     def _parse_cfg(
         raw: str,
     ) -> Cfg:
-        kwargs = {}
-
-        for line in raw.splitlines():
-            if line[:2] != '--':
-                kwargs['name'] = line
-                continue
-
-            argument, value = line[2:].split('=', 1)
-
-            if ',' in value:
-                value = [item for item in value.split(',') if item]
-
-            if value == 'None':
-                value = None
-
-            kwargs[argument.replace('-', '_')] = value
-
-        return kwargs
+        return parse(raw)
 
     @staticmethod
+    def _validate_dependencies(
+        value: typing.Union[str, typing.List[str]],
+    ) -> int:
+        if not value:
+            return 0
+        if not isinstance(value, list):
+            logger.warning(
+                '%s is a list, add a trailing comma.',
+                'dependencies',
+            )
+            return 1
+        if 'redis' in value:
+            logger.warning(
+                'specify which redis instance is required: '
+                'e.g. "redis_api"'
+            )
+            return 2
+        return 0
+
+    @classmethod
     def _validate_cfg(
+        cls,
         cfg: Cfg,
     ) -> int:
-        for argument, value in cfg.items():
-            if argument == 'dependencies':
-                if not value:
-                    continue
-                if not isinstance(value, list):
-                    logger.warning(
-                        '%s is a list, add a trailing comma.',
-                        argument,
-                    )
-                    return 1
-                for dep in value:
-                    if dep == 'redis':
-                        logger.warning(
-                            'specify which redis instance is required: '
-                            'e.g. "redis_api"'
-                        )
-                        return 2
-
-        return 0
+        """Log all the problems at once, return the code of the first one"""
+        validators = {
+            'dependencies': cls._validate_dependencies,
+        }
+        codes = [
+            validators[argument](value)
+            for argument, value in cfg.items()
+            if argument in validators
+        ]
+        return next((code for code in codes if code), 0)
 
     def _get_cfg_fields(
         self,
@@ -227,57 +396,47 @@ class Project:
             self.insert_marker,
         ]
 
+    def _get_field_order(self) -> FieldOrder:
+        cls = type(self)
+        if cls not in self._field_orders:
+            self._field_orders[cls] = FieldOrder(
+                fields=self._get_cfg_fields(),
+                insert_marker=self.insert_marker,
+            )
+        return self._field_orders[cls]
+
     def _serialize_cfg(
         self,
     ) -> str:
         cfg = self._kwargs.copy()
         cfg['language'] = self.language
+        return serialize(self._name, cfg, self._get_field_order())
 
-        field_preference = self._get_cfg_fields()
+    def _get_cfg_update(self) -> typing.Optional[str]:
+        if self._cfg is None:
+            # not loaded via from_path
+            raw = get_sink().read(self.get_cfg_path(self._path))
+            if raw is not None:
+                self._cfg = Config(raw)
 
-        unknown_fields = set(cfg.keys()) - set(field_preference)
-        pos = field_preference.index(self.insert_marker)
-
-        for key in sorted(unknown_fields, reverse=True):
-            field_preference.insert(pos, key)
-
-        def get_pos(item):
-            return field_preference.index(item[0])
+        if self._cfg is not None:
+            if not self._changed:
+                return None
 
-        lines = [
-            self._name,
-        ]
-        for field, value in sorted(cfg.items(), key=get_pos):
-            if isinstance(value, list):
-                value = ','.join(value)
-                if ',' not in value:
-                    value += ','
-            lines.append(
-                '--{field}={value}'.format(
-                    field=field.replace('_', '-'),
-                    value=value,
-                )
-            )
+            # did the config actually changed?
+            if self._cfg.is_unchanged(self._kwargs):
+                return None
 
-        lines.append('')
-        return '\n'.join(lines)
+        return self._serialize_cfg()
 
     def _dump_cfg(self):
-        path = self.get_cfg_path(self._path)
-        if path.exists():
-            if not self._changed:
-                return False
-
-            # did the config actually changed?
-            reloaded = self._parse_cfg(path.read_text())
-            del reloaded['name']
-            del reloaded['language']
-            if self._kwargs == reloaded:
-                return False
+        content = self._get_cfg_update()
+        if content is None:
+            return False
 
         return self._write(
-            path=path,
-            content=self._serialize_cfg(),
+            path=self.get_cfg_path(self._path),
+            content=content,
         )
 
     def _write(
@@ -295,12 +454,17 @@ class Project:
         if content.strip() == '':
             return -1
 
-        path.parent.mkdir(parents=True, exist_ok=True)
-        written = path.write_text(content)
-
-        if path.suffix == '.sh':
-            path.chmod(0o755)
-
+        with profiling.phase('write', file=path.name) as span:
+            if self._transaction is not None:
+                written = self._transaction.stage(path, content)
+            else:
+                transaction = get_sink().begin(durability=self._durability)
+                try:
+                    written = transaction.stage(path, content)
+                    transaction.commit()
+                finally:
+                    transaction.rollback()
+            span.bytes_written += written
         return written
 
     def _get_possible_project_files(
@@ -327,14 +491,24 @@ class Project:
             'has_unit_tests': 'test/unit',
         }
 
+    def _get_snapshot(self) -> Snapshot:
+        # shared by all the phases of process()
+        if self._snapshot is not None:
+            return self._snapshot
+        return get_sink().get_snapshot(self._path)
+
     def _get_env(self):
         env = {
             'version': __version__,
             'name': self._name,
             'language': self.language,
         }
-        for label, file in self._get_possible_project_files().items():
-            env[label] = (self._path / file).exists()
+        snapshot = self._get_snapshot()
+        files = self._get_possible_project_files()
+        executor = prefetch.get_executor()
+        if executor is not None:
+            snapshot.prefetch(files.values(), executor)
+        env.update(snapshot.probe(files))
 
         env['env_prefix'] = {
             'api': 'API',
@@ -351,56 +525,188 @@ class Project:
         env.update(self._kwargs)
         return env
 
+    @staticmethod
+    def _get_template_name(
+        name: str,
+    ) -> str:
+        return name + '.j2'
+
     def _get_template(
         self,
         name: str,
     ):
         return self._template_env.get_template(
-            name=name + '.j2',
+            name=self._get_template_name(name),
         )
 
-    def _update_file(
+    def _read_current(
+        self,
+        name: str,
+    ) -> typing.Optional[str]:
+        if not self._get_snapshot().exists(name):
+            return None
+        with profiling.phase('read', file=name) as span:
+            current = get_sink().read(self._path / name)
+            span.bytes_read += len(current or '')
+        return current
+
+    def _render(
         self,
         name: str,
         env: dict,
-    ):
-        target = self._path / name
-        if target.exists():
-            current = target.read_text()
-        else:
-            current = None
+    ) -> str:
+        return ''.join(self._iter_render(name, env))
 
+    def _iter_render(
+        self,
+        name: str,
+        env: dict,
+    ) -> typing.Iterable[str]:
+        from generator import templates as template_cache
+
+        cache = template_cache.get_render_cache()
+        if cache is None:
+            return self._generate(name, env)
+
+        key = cache.get_key(
+            graph=self.get_template_graph(),
+            name=self._get_template_name(name),
+            env=env,
+        )
+        if key is None:
+            return self._generate(name, env)
+
+        new = cache.get(key)
+        if new is None:
+            new = ''.join(self._generate(name, env))
+            cache.set(key, new)
+        return [new]
+
+    def _generate(
+        self,
+        name: str,
+        env: dict,
+    ) -> typing.Iterator[str]:
         try:
-            template = self._get_template(
-                name=name,
-            )
+            with profiling.phase('load', template=name):
+                template = self._get_template(
+                    name=name,
+                )
         except:
             logger.error('failed to load template %s', name)
             raise
 
         try:
-            new = template.render(**env)
+            yield from profiling.iterate(
+                'normalize',
+                stream.normalize(
+                    profiling.iterate(
+                        'render',
+                        template.generate(**env),
+                        template=name,
+                    ),
+                ),
+                template=name,
+            )
         except:
             logger.error('failed to render template %s with %r', name, env)
             raise
 
-        # allow at max two empty lines in a row
-        new = re.sub(r'\n{3,}', '\n\n', new)
+    def _prefetch(
+        self,
+        files: typing.List[str],
+    ) -> typing.Optional[prefetch.Prefetched]:
+        executor = prefetch.get_executor()
+        if executor is None:
+            return None
+
+        snapshot = self._get_snapshot()
+        snapshot.prefetch(files, executor)
+        return prefetch.Prefetched(
+            executor=executor,
+            paths={
+                file: self._path / file
+                for file in files
+                if snapshot.exists(file)
+            },
+            read=get_sink().read,
+        )
 
-        # strip all but the final trailing new line
-        new = new.strip('\n') + '\n'
+    def _update_file(
+        self,
+        name: str,
+        env: dict,
+        current: typing.Optional[prefetch.Prefetched] = None,
+    ):
+        target = self._path / name
+        with profiling.phase('compare', file=name) as span:
+            if current is None:
+                equal, new = get_sink().compare(
+                    chunks=self._iter_render(name, env),
+                    path=target if self._get_snapshot().exists(name) else None,
+                    span=span,
+                )
+            else:
+                new = self._render(name, env)
+                existing = current.get(name)
+                span.bytes_read += len(existing or '')
+                equal = existing == new
+
+        # empty outputs do not get written
+        changed = not equal and new.strip() != ''
+        if changed:
+            self._changed = True
+            self._write(target, new)
 
-        if current == new:
-            return False
+        if self._manifest is None:
+            pass
+        elif changed and self._transaction is not None:
+            # the target is in place after the commit only
+            self._transaction.on_commit(self._record, name, new, target)
+        else:
+            self._record(name, new, target)
+        return changed
 
-        self._changed = True
-        self._write(target, new)
-        return True
+    def _record(
+        self,
+        name: str,
+        output: str,
+        target: pathlib.Path,
+    ):
+        sources = self.get_template_graph().get_sources(
+            self._get_template_name(name),
+        )
+        if sources is None:
+            self._manifest.discard(name)
+            return
+
+        self._manifest.record(
+            name=name,
+            sources=sources,
+            output=output,
+            target=target,
+        )
+
+    def _load_manifest(
+        self,
+        env: dict,
+    ) -> typing.Optional[Manifest]:
+        if not self._incremental or not get_sink().in_place:
+            # the manifest tracks the stat of outputs in place
+            return None
+
+        return Manifest.load(
+            path=Manifest.get_path(self._path),
+            env=env,
+            search_path=self._search_path,
+        )
 
     def _get_files_to_update(
         self,
         search_path: typing.List[pathlib.Path] = None,
     ) -> typing.List[str]:
+        from generator import templates as template_cache
+
         files = set()
         structure_names = (
             '_',
@@ -408,25 +714,14 @@ class Project:
             'macros',
         )
         if not search_path:
-            search_path = self._template_env.loader.searchpath
+            search_path = self._search_path
 
         for directory in search_path:
-            if not directory.exists():
-                continue
-            intermediate = []
-            for file in directory.iterdir():
-                if file.name in structure_names:
-                    continue
-
-                if file.is_dir():
-                    intermediate.extend(file.glob('**/*'))
-                else:
-                    intermediate.append(file)
-
             files.update(
-                str(file.relative_to(directory).with_suffix(''))
-                for file in intermediate
-                if file.is_file()
+                template_cache.get_template_files(
+                    directory=directory,
+                    skip=structure_names,
+                )
             )
 
         return list(sorted(files))
@@ -435,30 +730,168 @@ class Project:
     def _get_deleted_templates() -> typing.Set[str]:
         return set()
 
+    def _get_orphan_files(
+        self,
+    ) -> typing.List[str]:
+        snapshot = self._get_snapshot()
+        return sorted(
+            file
+            for file in self._get_deleted_templates()
+            if snapshot.exists(file)
+        )
+
     def _delete_orphan_files(
         self,
     ) -> int:
         deleted = 0
-        for file in self._get_deleted_templates():
-            path = self._path / file
-            if path.exists():
-                self._changed = True
-                deleted += 1
-                path.unlink()
+        for file in self._get_orphan_files():
+            self._changed = True
+            deleted += 1
+            if self._transaction is not None:
+                self._transaction.delete(self._path / file)
+            else:
+                transaction = get_sink().begin(durability=self._durability)
+                transaction.delete(self._path / file)
+                transaction.commit()
+            self._get_snapshot().discard(file)
 
         return deleted
 
     def process(
         self,
-    ):
-        self._delete_orphan_files()
+        outputs: typing.Optional[typing.Set[str]] = None,
+    ) -> bool:
+        self._snapshot = get_sink().get_snapshot(self._path)
+        self._transaction = get_sink().begin(
+            durability=self._durability,
+            executor=prefetch.get_executor(),
+        )
+        try:
+            self._process(outputs)
+        finally:
+            # a failed project keeps all its files untouched
+            self._transaction.rollback()
+            self._transaction = None
+            self._manifest = None
+            self._snapshot = None
+        return self._changed
+
+    def _get_stale_files(
+        self,
+        outputs: typing.Optional[typing.Set[str]],
+    ) -> typing.Iterator[str]:
+        with profiling.phase('get_files_to_update'):
+            files = self._get_files_to_update()
+        if outputs is not None:
+            files = [file for file in files if file in outputs]
 
-        files = self._get_files_to_update()
-        env = self._get_env()
         for file in files:
+            if self._manifest is not None and self._manifest.is_fresh(
+                name=file,
+                target=self._path / file,
+                sources=self.get_template_graph().get_sources(
+                    self._get_template_name(file),
+                ),
+            ):
+                continue
+            yield file
+
+    def render(
+        self,
+        outputs: typing.Optional[typing.Set[str]] = None,
+    ) -> typing.Dict[str, str]:
+        """Render the template outputs in memory, without writing"""
+        self._snapshot = get_sink().get_snapshot(self._path)
+        try:
+            env = self._get_env()
+            rendered = {}
+            for file in self._get_files_to_update():
+                if outputs is not None and file not in outputs:
+                    continue
+                new = self._render(file, env)
+                # empty outputs do not get written
+                if new.strip() != '':
+                    rendered[file] = new
+            return rendered
+        finally:
+            self._snapshot = None
+
+    def check(
+        self,
+        outputs: typing.Optional[typing.Set[str]] = None,
+    ) -> typing.List[Drift]:
+        """Render everything in memory and collect the outdated files"""
+        self._snapshot = get_sink().get_snapshot(self._path)
+        try:
+            return self._check(outputs)
+        finally:
+            self._manifest = None
+            self._snapshot = None
+
+    def _check(
+        self,
+        outputs: typing.Optional[typing.Set[str]],
+    ) -> typing.List[Drift]:
+        drift = [
+            Drift(
+                name=file,
+                current=self._read_current(file),
+                expected=None,
+            )
+            for file in self._get_orphan_files()
+        ]
+
+        with profiling.phase('get_env'):
+            env = self._get_env()
+        self._manifest = self._load_manifest(env)
+        stale = list(self._get_stale_files(outputs))
+        prefetched = self._prefetch(stale)
+        for file in stale:
+            if prefetched is None:
+                current = self._read_current(file)
+            else:
+                current = prefetched.get(file)
+            new = self._render(file, env)
+            # empty outputs do not get written
+            if current != new and new.strip() != '':
+                drift.append(Drift(name=file, current=current, expected=new))
+
+        if drift:
+            self._changed = True
+        cfg = self._get_cfg_update()
+        if cfg is not None:
+            path = self.get_cfg_path(self._path)
+            drift.append(
+                Drift(
+                    name=path.name,
+                    current=get_sink().read(path),
+                    expected=cfg,
+                )
+            )
+        return drift
+
+    def _process(
+        self,
+        outputs: typing.Optional[typing.Set[str]],
+    ):
+        with profiling.phase('delete_orphan_files'):
+            self._delete_orphan_files()
+
+        with profiling.phase('get_env'):
+            env = self._get_env()
+        self._manifest = self._load_manifest(env)
+        stale = list(self._get_stale_files(outputs))
+        current = self._prefetch(stale)
+        for file in stale:
             self._update_file(
                 name=file,
                 env=env,
+                current=current,
             )
 
         self._dump_cfg()
+        with profiling.phase('commit'):
+            self._transaction.commit()
+
+        if self._manifest is not None and not self._dry_run:
+            self._manifest.save()
@@ -2,6 +2,7 @@ from generator.project import Project
 
 
 class ESProject(Project):
+    __slots__ = ()
     language = 'es'
 
     @classmethod
@@ -2,4 +2,5 @@ from generator.project import Project
 
 
 class RunnerProject(Project):
+    __slots__ = ()
     language = 'runner'
@@ -0,0 +1,87 @@
+import json
+import logging
+import os
+import pathlib
+import socket
+import socketserver
+import typing
+
+Dispatch = typing.Callable[[dict], dict]
+
+logger = logging.getLogger(__name__)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """One json request line in, one json response line out"""
+
+    def handle(self):
+        raw = self.rfile.readline()
+        try:
+            request = json.loads(raw.decode())
+        except ValueError:
+            response = {'code': -1, 'log': ['invalid request']}
+        else:
+            try:
+                response = self.server.dispatch(request)
+            except Exception:
+                logger.exception('request failed: %r', request)
+                response = {'code': -1, 'log': ['request failed']}
+        self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class Server(socketserver.UnixStreamServer):
+    """Handles the requests one after another
+
+    The caches of the generator are process-wide and not thread-safe.
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        dispatch: Dispatch,
+    ):
+        self.dispatch = dispatch
+        _remove_stale_socket(path)
+        super().__init__(str(path), _RequestHandler)
+        os.chmod(str(path), 0o600)
+
+
+def _remove_stale_socket(path: pathlib.Path):
+    if not path.exists():
+        return
+    try:
+        request(path, {'action': 'ping'})
+    except OSError:
+        path.unlink()
+        return
+    raise FileExistsError('already serving on {}'.format(path))
+
+
+def serve(
+    path: pathlib.Path,
+    dispatch: Dispatch,
+):
+    server = Server(path, dispatch)
+    logger.info('serving on %s', path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        path.unlink()
+
+
+def request(
+    path: pathlib.Path,
+    payload: dict,
+) -> dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(str(path))
+        connection.sendall(json.dumps(payload).encode() + b'\n')
+        connection.shutdown(socket.SHUT_WR)
+        with connection.makefile('rb') as file:
+            raw = file.readline()
+    if not raw:
+        raise ConnectionError('no response from {}'.format(path))
+    return json.loads(raw.decode())
@@ -0,0 +1,452 @@
+"""Where the projects read their files from and write their outputs to
+
+ - FileSink: everything in place, the default
+ - MemorySink: an in-memory tree, no disk access at all
+ - OverlaySink: reads fall through to the checkout, writes go to a
+   separate output directory
+ - TarSink: reads come from the checkout, writes get appended to a single
+   tar stream
+
+Deleting an orphan in an overlay or a tar stream hides it from the reads of
+ the current process only, neither carries deletions.
+"""
+import abc
+import os
+import pathlib
+import typing
+
+from generator import snapshot
+from generator import stream
+from generator.transaction import Transaction
+
+if typing.TYPE_CHECKING:
+    import concurrent.futures
+    import tarfile
+    from generator.profiling import Span
+
+Changes = typing.Dict[pathlib.Path, str]
+# the names in a directory, mapped to whether they are directories
+Tree = typing.Dict[pathlib.Path, typing.Dict[str, bool]]
+
+_sink = None  # type: typing.Optional[Sink]
+
+
+def _read(path: pathlib.Path) -> typing.Optional[str]:
+    try:
+        return path.read_text()
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def _get_name(
+    path: pathlib.Path,
+    base: pathlib.Path,
+) -> str:
+    """The path relative to base, like tar strips a leading slash"""
+    path = pathlib.Path(os.path.abspath(str(path)))
+    try:
+        return path.relative_to(base).as_posix()
+    except ValueError:
+        return path.as_posix().lstrip('/')
+
+
+class _SinkSnapshot(snapshot.Snapshot):
+    def __init__(
+        self,
+        root: pathlib.Path,
+        sink: 'Sink',
+    ):
+        super().__init__(root)
+        self._sink = sink
+
+    def _list(self, directory: str) -> typing.Optional[snapshot.Entries]:
+        return self._sink.list_directory(self._root / directory)
+
+
+class BufferedTransaction:
+    """Collect the changes of a project, apply them at once on commit"""
+
+    def __init__(
+        self,
+        apply: typing.Callable[[Changes, typing.List[pathlib.Path]], None],
+    ):
+        self._apply = apply
+        self._staged = {}  # type: Changes
+        self._deleted = []  # type: typing.List[pathlib.Path]
+        self._callbacks = []  # type: typing.List[tuple]
+
+    def __len__(self):
+        return len(self._staged) + len(self._deleted)
+
+    def stage(
+        self,
+        path: pathlib.Path,
+        content: str,
+    ) -> int:
+        self._staged[path] = content
+        return len(content)
+
+    def delete(self, path: pathlib.Path):
+        self._deleted.append(path)
+
+    def on_commit(self, callback: typing.Callable, *args):
+        self._callbacks.append((callback, args))
+
+    def commit(self):
+        staged, self._staged = self._staged, {}
+        deleted, self._deleted = self._deleted, []
+        self._apply(staged, deleted)
+
+        callbacks, self._callbacks = self._callbacks, []
+        for callback, args in callbacks:
+            callback(*args)
+
+    def rollback(self):
+        self._staged = {}
+        self._deleted = []
+        self._callbacks = []
+
+
+class Sink(abc.ABC):
+    """Access to the files of the projects"""
+
+    # the outputs end up next to their inputs, manifests can stat them
+    in_place = False
+
+    @abc.abstractmethod
+    def read(self, path: pathlib.Path) -> typing.Optional[str]:
+        """None for a file that does not exist"""
+
+    @abc.abstractmethod
+    def list_directory(
+        self,
+        path: pathlib.Path,
+    ) -> typing.Optional[snapshot.Entries]:
+        """Names and sub directories, None for a missing directory"""
+
+    @abc.abstractmethod
+    def begin(
+        self,
+        durability: str,
+        executor: typing.Optional['concurrent.futures.Executor'] = None,
+    ):
+        """A transaction for the changes of one project"""
+
+    def get_snapshot(self, root: pathlib.Path) -> snapshot.Snapshot:
+        return _SinkSnapshot(root, self)
+
+    def compare(
+        self,
+        chunks: typing.Iterable[str],
+        path: typing.Optional[pathlib.Path],
+        span: typing.Optional['Span'] = None,
+    ) -> typing.Tuple[bool, str]:
+        new = ''.join(chunks)
+        current = None if path is None else self.read(path)
+        if span is not None:
+            span.bytes_read += len(current or '')
+        return current == new, new
+
+    def close(self):
+        pass
+
+
+class FileSink(Sink):
+    """Read and write in place"""
+
+    in_place = True
+
+    def read(self, path: pathlib.Path) -> typing.Optional[str]:
+        return _read(path)
+
+    def list_directory(
+        self,
+        path: pathlib.Path,
+    ) -> typing.Optional[snapshot.Entries]:
+        return snapshot.scan(str(path))
+
+    def begin(
+        self,
+        durability: str,
+        executor: typing.Optional['concurrent.futures.Executor'] = None,
+    ) -> Transaction:
+        return Transaction(durability=durability, executor=executor)
+
+    def get_snapshot(self, root: pathlib.Path) -> snapshot.Snapshot:
+        # the listings may get cached between runs
+        return snapshot.get_snapshot(root)
+
+    def compare(
+        self,
+        chunks: typing.Iterable[str],
+        path: typing.Optional[pathlib.Path],
+        span: typing.Optional['Span'] = None,
+    ) -> typing.Tuple[bool, str]:
+        # stops reading at the first difference
+        return stream.compare(chunks=chunks, path=path, span=span)
+
+
+class MemorySink(Sink):
+    """An in-memory tree of files, keyed by absolute path
+
+    Directories exist as long as they held a file once.
+    """
+
+    def __init__(
+        self,
+        files: typing.Optional[typing.Dict[pathlib.Path, str]] = None,
+    ):
+        self.files = {}  # type: typing.Dict[pathlib.Path, str]
+        self._tree = {}  # type: Tree
+        for path, content in (files or {}).items():
+            self.write(path, content)
+
+    @staticmethod
+    def _get_key(path: pathlib.Path) -> pathlib.Path:
+        return pathlib.Path(os.path.abspath(str(path)))
+
+    def write(
+        self,
+        path: pathlib.Path,
+        content: str,
+    ):
+        path = self._get_key(path)
+        self.files[path] = content
+        is_dir = False
+        while path.parent != path:
+            self._tree.setdefault(path.parent, {})[path.name] = is_dir
+            path = path.parent
+            is_dir = True
+
+    def delete(self, path: pathlib.Path):
+        path = self._get_key(path)
+        if self.files.pop(path, None) is not None:
+            del self._tree[path.parent][path.name]
+
+    def read(self, path: pathlib.Path) -> typing.Optional[str]:
+        return self.files.get(self._get_key(path))
+
+    def list_directory(
+        self,
+        path: pathlib.Path,
+    ) -> typing.Optional[snapshot.Entries]:
+        entries = self._tree.get(self._get_key(path))
+        if entries is None:
+            return None
+        return (
+            set(entries),
+            {name for name, is_dir in entries.items() if is_dir},
+        )
+
+    def begin(
+        self,
+        durability: str,
+        executor: typing.Optional['concurrent.futures.Executor'] = None,
+    ) -> BufferedTransaction:
+        return BufferedTransaction(apply=self._apply)
+
+    def _apply(
+        self,
+        staged: Changes,
+        deleted: typing.List[pathlib.Path],
+    ):
+        for path, content in staged.items():
+            self.write(path, content)
+        for path in deleted:
+            self.delete(path)
+
+
+class _HidingSink(Sink):
+    """Reads from the checkout, minus the files deleted in this process"""
+
+    def __init__(
+        self,
+        base: pathlib.Path,
+    ):
+        self._base = pathlib.Path(os.path.abspath(str(base)))
+        self._hidden = set()  # type: typing.Set[str]
+
+    def _get_name(self, path: pathlib.Path) -> str:
+        return _get_name(path, self._base)
+
+    def hide(self, path: pathlib.Path):
+        self._hidden.add(self._get_name(path))
+
+    def show(self, path: pathlib.Path):
+        self._hidden.discard(self._get_name(path))
+
+    def _is_hidden(self, path: pathlib.Path) -> bool:
+        return bool(self._hidden) and self._get_name(path) in self._hidden
+
+    def read(self, path: pathlib.Path) -> typing.Optional[str]:
+        if self._is_hidden(path):
+            return None
+        return _read(path)
+
+    def list_directory(
+        self,
+        path: pathlib.Path,
+    ) -> typing.Optional[snapshot.Entries]:
+        entries = snapshot.scan(str(path))
+        if entries is None or not self._hidden:
+            return entries
+
+        names, directories = entries
+        names = {name for name in names if not self._is_hidden(path / name)}
+        return names, directories & names
+
+
+class _OverlayTransaction(Transaction):
+    def __init__(
+        self,
+        sink: 'OverlaySink',
+        durability: str,
+        executor: typing.Optional['concurrent.futures.Executor'] = None,
+    ):
+        super().__init__(durability=durability, executor=executor)
+        self._sink = sink
+
+    def stage(
+        self,
+        path: pathlib.Path,
+        content: str,
+    ) -> int:
+        self.on_commit(self._sink.show, path)
+        return super().stage(self._sink.get_upper(path), content)
+
+    def delete(self, path: pathlib.Path):
+        super().delete(self._sink.get_upper(path))
+        self.on_commit(self._sink.hide, path)
+
+
+class OverlaySink(_HidingSink):
+    """Write the outputs into a separate directory
+
+    The output directory mirrors the paths of the projects relative to
+     base. Reads see the written files on top of the checkout.
+    """
+
+    def __init__(
+        self,
+        directory: pathlib.Path,
+        base: pathlib.Path = pathlib.Path(),
+    ):
+        super().__init__(base)
+        self._directory = directory
+
+    def get_upper(self, path: pathlib.Path) -> pathlib.Path:
+        return self._directory / self._get_name(path)
+
+    def read(self, path: pathlib.Path) -> typing.Optional[str]:
+        if self._is_hidden(path):
+            return None
+        current = _read(self.get_upper(path))
+        if current is None:
+            current = _read(path)
+        return current
+
+    def list_directory(
+        self,
+        path: pathlib.Path,
+    ) -> typing.Optional[snapshot.Entries]:
+        lower = super().list_directory(path)
+        upper = snapshot.scan(str(self.get_upper(path)))
+        if upper is None:
+            return lower
+        if lower is None:
+            return upper
+        return lower[0] | upper[0], lower[1] | upper[1]
+
+    def begin(
+        self,
+        durability: str,
+        executor: typing.Optional['concurrent.futures.Executor'] = None,
+    ) -> Transaction:
+        return _OverlayTransaction(
+            sink=self,
+            durability=durability,
+            executor=executor,
+        )
+
+
+class TarSink(_HidingSink):
+    """Append the outputs of all the projects to one tar stream
+
+    The members are named relative to base. A member keeps the permissions
+     of the file it replaces in the checkout.
+    """
+
+    def __init__(
+        self,
+        file: typing.Union[pathlib.Path, typing.BinaryIO],
+        base: pathlib.Path = pathlib.Path(),
+    ):
+        import tarfile
+
+        super().__init__(base)
+        if isinstance(file, pathlib.Path):
+            # the archive owns the file and closes it
+            self._archive = tarfile.open(
+                name=str(file),
+                mode='w|',
+                format=tarfile.PAX_FORMAT,
+            )  # type: tarfile.TarFile
+        else:
+            self._archive = tarfile.open(
+                fileobj=file,
+                mode='w|',
+                format=tarfile.PAX_FORMAT,
+            )
+
+    def begin(
+        self,
+        durability: str,
+        executor: typing.Optional['concurrent.futures.Executor'] = None,
+    ) -> BufferedTransaction:
+        return BufferedTransaction(apply=self._apply)
+
+    @staticmethod
+    def _get_mode(path: pathlib.Path) -> int:
+        if path.suffix == '.sh':
+            return 0o755
+        try:
+            return path.stat().st_mode & 0o7777
+        except (FileNotFoundError, NotADirectoryError):
+            return 0o644
+
+    def _apply(
+        self,
+        staged: Changes,
+        deleted: typing.List[pathlib.Path],
+    ):
+        import io
+        import tarfile
+        import time
+
+        now = int(time.time())
+        for path, content in sorted(staged.items()):
+            data = content.encode()
+            info = tarfile.TarInfo(self._get_name(path))
+            info.size = len(data)
+            info.mode = self._get_mode(path)
+            info.mtime = now
+            self._archive.addfile(info, io.BytesIO(data))
+            self.show(path)
+        for path in deleted:
+            self.hide(path)
+
+    def close(self):
+        self._archive.close()
+
+
+def set_sink(sink: typing.Optional[Sink]):
+    """None restores writing in place"""
+    global _sink
+    _sink = sink
+
+
+def get_sink() -> Sink:
+    global _sink
+    if _sink is None:
+        _sink = FileSink()
+    return _sink
@@ -0,0 +1,189 @@
+import os
+import pathlib
+import posixpath
+import typing
+
+if typing.TYPE_CHECKING:
+    import concurrent.futures
+
+Listing = typing.Optional[typing.Set[str]]
+# the names in a directory and the sub directories among them
+Entries = typing.Tuple[typing.Set[str], typing.Set[str]]
+
+_cache = None  # type: typing.Optional[SnapshotCache]
+
+
+def scan(path: str) -> typing.Optional[Entries]:
+    """None for a missing directory"""
+    names = set()
+    directories = set()
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                    if entry.is_symlink():
+                        # drop dangling links, like Path.exists does
+                        entry.stat()
+                except OSError:
+                    continue
+                names.add(entry.name)
+                if is_dir:
+                    directories.add(entry.name)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return names, directories
+
+
+class Snapshot:
+    """Directory listings of a project, every directory is scanned once
+
+    Probing many paths below a few directories costs one scandir call per
+     directory instead of one stat call per path.
+    """
+
+    def __init__(
+        self,
+        root: pathlib.Path,
+    ):
+        self._root = root
+        self._listings = {}  # type: typing.Dict[str, Listing]
+        self._directories = {}  # type: typing.Dict[str, typing.Set[str]]
+        self._mtimes = {}  # type: typing.Dict[str, typing.Optional[int]]
+
+    @staticmethod
+    def _split(path: str) -> typing.Tuple[str, str]:
+        parent, name = posixpath.split(posixpath.normpath(path))
+        if parent == '.':
+            parent = ''
+        return parent, name
+
+    def _scan(self, directory: str) -> Listing:
+        entries = self._list(directory)
+        if entries is None:
+            return None
+
+        names, self._directories[directory] = entries
+        return names
+
+    def _list(self, directory: str) -> typing.Optional[Entries]:
+        path = str(self._root / directory)
+        try:
+            # before scanning, a concurrent change invalidates the listing
+            self._mtimes[directory] = os.stat(path).st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            self._mtimes[directory] = None
+            return None
+
+        entries = scan(path)
+        if entries is None:
+            self._mtimes[directory] = None
+        return entries
+
+    def _get_listing(self, directory: str) -> Listing:
+        if directory not in self._listings:
+            listing = None
+            if directory == '' or self.is_dir(directory):
+                listing = self._scan(directory)
+            self._listings[directory] = listing
+        return self._listings[directory]
+
+    def exists(self, path: str) -> bool:
+        parent, name = self._split(path)
+        listing = self._get_listing(parent)
+        return listing is not None and name in listing
+
+    def is_dir(self, path: str) -> bool:
+        parent, name = self._split(path)
+        if self._get_listing(parent) is None:
+            return False
+        return name in self._directories[parent]
+
+    def prefetch(
+        self,
+        paths: typing.Iterable[str],
+        executor: 'concurrent.futures.Executor',
+    ):
+        """Scan all the directories that could hold paths concurrently
+
+        A missing directory costs one failed scandir call.
+        """
+        directories = set()
+        for path in paths:
+            parent = self._split(path)[0]
+            while parent not in directories:
+                directories.add(parent)
+                if parent == '':
+                    break
+                parent = self._split(parent)[0]
+
+        pending = {
+            directory: executor.submit(self._scan, directory)
+            for directory in sorted(directories)
+            if directory not in self._listings
+        }
+        for directory, future in pending.items():
+            self._listings[directory] = future.result()
+
+    def probe(
+        self,
+        paths: typing.Dict[str, str],
+    ) -> typing.Dict[str, bool]:
+        return {
+            label: self.exists(path)
+            for label, path in paths.items()
+        }
+
+    def is_fresh(self) -> bool:
+        """Whether no entries got added to or removed from the listings"""
+        for directory, mtime in self._mtimes.items():
+            try:
+                current = os.stat(str(self._root / directory)).st_mtime_ns
+            except (FileNotFoundError, NotADirectoryError):
+                current = None
+            if current != mtime:
+                return False
+        return True
+
+    def discard(self, path: str):
+        parent, name = self._split(path)
+        listing = self._listings.get(parent)
+        if listing is not None:
+            listing.discard(name)
+            self._directories[parent].discard(name)
+
+
+class SnapshotCache:
+    """Keep the snapshots of projects between runs in a long-lived process
+
+    A snapshot is reused as long as the mtimes of its scanned directories
+     did not change.
+    """
+
+    def __init__(self):
+        self._snapshots = {}  # type: typing.Dict[pathlib.Path, Snapshot]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, root: pathlib.Path) -> Snapshot:
+        snapshot = self._snapshots.get(root)
+        if snapshot is not None and snapshot.is_fresh():
+            self.hits += 1
+            return snapshot
+
+        self.misses += 1
+        snapshot = self._snapshots[root] = Snapshot(root)
+        return snapshot
+
+
+def set_snapshot_cache(
+    cache: typing.Optional[SnapshotCache],
+):
+    global _cache
+    _cache = cache
+
+
+def get_snapshot(root: pathlib.Path) -> Snapshot:
+    if _cache is None:
+        return Snapshot(root)
+    return _cache.get(root)
@@ -0,0 +1,77 @@
+import pathlib
+import re
+import typing
+
+if typing.TYPE_CHECKING:
+    from generator.profiling import Span
+
+_NEW_LINES = re.compile(r'(\n+)')
+
+
+def normalize(
+    chunks: typing.Iterable[str],
+) -> typing.Iterator[str]:
+    """Clean up the new lines of rendered chunks in one pass
+
+    Allow at max two empty lines in a row and strip all but the final
+     trailing new line. This is equivalent to
+     `re.sub(r'\\n{3,}', '\\n\\n', ''.join(chunks)).strip('\\n') + '\\n'`.
+    """
+    pending = 0
+    started = False
+    for chunk in chunks:
+        for part in _NEW_LINES.split(chunk):
+            if not part:
+                continue
+            if part[0] == '\n':
+                # hold back, it might be the trailing one
+                pending += len(part)
+                continue
+
+            if started and pending:
+                yield '\n' * min(pending, 2)
+            pending = 0
+            started = True
+            yield part
+    yield '\n'
+
+
+def compare(
+    chunks: typing.Iterable[str],
+    path: typing.Optional[pathlib.Path],
+    span: typing.Optional['Span'] = None,
+) -> typing.Tuple[bool, str]:
+    """Compare chunks with the content of a file
+
+    Reading the file stops at the first mismatch. Returns whether the file
+     is up to date and the content of all the chunks.
+    """
+    read = 0
+    chunks = iter(chunks)
+    consumed = []
+    equal = False
+    if path is not None:
+        try:
+            file = path.open()
+        except FileNotFoundError:
+            file = None
+
+        if file is not None:
+            with file:
+                equal = True
+                for chunk in chunks:
+                    consumed.append(chunk)
+                    current = file.read(len(chunk))
+                    read += len(current)
+                    if current != chunk:
+                        equal = False
+                        break
+                else:
+                    tail = file.read(1)
+                    read += len(tail)
+                    equal = tail == ''
+
+    if span is not None:
+        span.bytes_read += read
+    consumed.extend(chunks)
+    return equal, ''.join(consumed)
@@ -0,0 +1,544 @@
+import collections
+import json
+import os
+import pathlib
+import typing
+
+import jinja2
+import jinja2.bccache
+import jinja2.meta
+import jinja2.nodes
+
+from generator.cache import (
+    BYTECODE_CACHE_MAX_SIZE,
+    RENDER_CACHE_MAX_ENTRIES,
+    get_cache_dir,
+)
+from generator.version import __version__
+
+if typing.TYPE_CHECKING:
+    from generator.precompiled import Precompiled
+
+SearchPath = typing.List[pathlib.Path]
+EnvKey = typing.Tuple[str, ...]
+Outputs = typing.OrderedDict[tuple, str]
+
+
+_environments = {}  # type: typing.Dict[EnvKey, jinja2.Environment]
+_bytecode_cache = None  # type: typing.Optional[BytecodeCache]
+_render_cache = None  # type: typing.Optional[RenderCache]
+_precompiled = None  # type: typing.Optional[Precompiled]
+
+# shared by the environments and the ahead of time compilation
+ENV_OPTIONS = {
+    'lstrip_blocks': True,
+    'trim_blocks': True,
+    'keep_trailing_newline': True,
+}
+
+
+class BytecodeCache(jinja2.FileSystemBytecodeCache):
+    def __init__(
+        self,
+        directory: pathlib.Path = None,
+        max_size: int = BYTECODE_CACHE_MAX_SIZE,
+    ):
+        if directory is None:
+            directory = get_cache_dir() / 'bytecode'
+        directory.mkdir(parents=True, exist_ok=True)
+        super().__init__(
+            directory=str(directory),
+            pattern='%s.cache',
+        )
+        self.max_size = max_size
+
+    def get_bucket(self, environment, name, filename, source):
+        # Jinja keys a bucket by template name only. Include the source
+        #  hash and our version, so that switching between branches or
+        #  releases does not thrash the cache.
+        checksum = self.get_source_checksum(source)
+        key = self.get_cache_key(
+            name='{version}|{checksum}|{name}'.format(
+                version=__version__,
+                checksum=checksum,
+                name=name,
+            ),
+            filename=filename,
+        )
+        bucket = jinja2.bccache.Bucket(environment, key, checksum)
+        self.load_bytecode(bucket)
+        return bucket
+
+    def load_bytecode(self, bucket):
+        super().load_bytecode(bucket)
+        if bucket.code is None:
+            return
+        # track the last usage for the eviction
+        try:
+            os.utime(self._get_cache_filename(bucket))
+        except OSError:
+            pass
+
+    def dump_bytecode(self, bucket):
+        super().dump_bytecode(bucket)
+        self.evict()
+
+    def evict(self) -> int:
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith('.cache'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        return evicted
+
+
+def set_bytecode_cache(
+    cache: typing.Optional[BytecodeCache],
+):
+    global _bytecode_cache
+    _bytecode_cache = cache
+    for env in _environments.values():
+        env.bytecode_cache = cache
+
+
+def set_precompiled(
+    precompiled: typing.Optional['Precompiled'],
+):
+    global _precompiled
+    _precompiled = precompiled
+    _environments.clear()
+    _parsed.clear()
+
+
+def _get_loader(
+    key: EnvKey,
+) -> jinja2.BaseLoader:
+    if _precompiled is None:
+        return jinja2.FileSystemLoader(searchpath=list(key))
+
+    # same layering as the search path, per directory
+    return jinja2.ChoiceLoader([
+        _precompiled.get_loader(directory)
+        or jinja2.FileSystemLoader(searchpath=[directory])
+        for directory in key
+    ])
+
+
+def _get_cache_key(
+    search_path: SearchPath,
+) -> EnvKey:
+    # The loader skips missing directories. Leaving them out of the key
+    #  allows projects without project specific templates to share one
+    #  environment per language.
+    return tuple(
+        str(directory)
+        for directory in search_path
+        if directory.is_dir()
+    )
+
+
+def get_environment(
+    search_path: SearchPath,
+) -> jinja2.Environment:
+    key = _get_cache_key(search_path)
+    if key in _environments:
+        return _environments[key]
+
+    # Compiled templates are cached per environment and get reloaded once
+    #  the mtime of their source changes (auto_reload).
+    env = jinja2.Environment(
+        loader=_get_loader(key),
+        auto_reload=True,
+        cache_size=-1,
+        bytecode_cache=_bytecode_cache,
+        **ENV_OPTIONS
+    )
+    _environments[key] = env
+    return env
+
+
+_parsed = {}  # type: typing.Dict[tuple, ParsedTemplate]
+_parser = jinja2.Environment()
+
+
+class ParsedTemplate:
+    def __init__(
+        self,
+        references: typing.Optional[typing.Set[str]],
+        variables: typing.Set[str],
+    ):
+        # None in case a reference can only be resolved at render time
+        self.references = references
+        self.variables = variables
+
+
+def parse(
+    filename: str,
+) -> ParsedTemplate:
+    if _precompiled is not None:
+        parsed = _precompiled.get_parsed(filename)
+        if parsed is not None:
+            return parsed
+
+    stat = os.stat(filename)
+    key = (filename, stat.st_mtime_ns, stat.st_size)
+    if key not in _parsed:
+        with open(filename) as file:
+            ast = _parser.parse(file.read())
+
+        references = set()
+        for reference in jinja2.meta.find_referenced_templates(ast):
+            if reference is None:
+                references = None
+                break
+            references.add(reference)
+
+        # A superset of jinja2.meta.find_undeclared_variables, which needs a
+        #  pass of the code generator and costs as much as compiling.
+        variables = {
+            node.name
+            for node in ast.find_all(jinja2.nodes.Name)
+            if node.ctx == 'load'
+        }
+        _parsed[key] = ParsedTemplate(
+            references=references,
+            variables=variables,
+        )
+    return _parsed[key]
+
+
+class TemplateGraph:
+    """Dependencies between templates resolved along one search path
+
+    The `{% extends %}`, `{% import %}`, `{% from %}` and `{% include %}`
+     tags reference other templates by name. A name resolves to the first
+     search path directory that has a matching file.
+    """
+
+    def __init__(
+        self,
+        search_path: SearchPath,
+    ):
+        self._search_path = [
+            os.path.abspath(str(directory))
+            for directory in search_path
+        ]
+        self._resolved = {}  # type: typing.Dict[str, typing.Optional[tuple]]
+        self._closures = {}  # type: typing.Dict[str, typing.Optional[set]]
+        self._variables = {}  # type: typing.Dict[str, typing.Optional[set]]
+
+    def invalidate(self):
+        self._resolved.clear()
+        self._closures.clear()
+        self._variables.clear()
+
+    def resolve(
+        self,
+        name: str,
+    ) -> typing.Optional[typing.Tuple[int, str]]:
+        if name not in self._resolved:
+            self._resolved[name] = None
+            for index, directory in enumerate(self._search_path):
+                filename = os.path.join(directory, name)
+                if os.path.isfile(filename):
+                    self._resolved[name] = (index, filename)
+                    break
+        return self._resolved[name]
+
+    def get_closure(
+        self,
+        name: str,
+    ) -> typing.Optional[typing.Set[str]]:
+        """The template and the names of all the templates it references
+
+        Returns None in case a reference can only be resolved at render time.
+        """
+        if name not in self._closures:
+            self._closures[name] = self._get_closure(name)
+        return self._closures[name]
+
+    def _get_closure(
+        self,
+        name: str,
+    ) -> typing.Optional[typing.Set[str]]:
+        names = set()
+        pending = [name]
+        while pending:
+            current = pending.pop()
+            if current in names:
+                continue
+            names.add(current)
+
+            resolved = self.resolve(current)
+            if resolved is None:
+                continue
+            references = parse(resolved[1]).references
+            if references is None:
+                return None
+            pending.extend(references)
+        return names
+
+    def get_sources(
+        self,
+        name: str,
+    ) -> typing.Optional[typing.List[str]]:
+        names = self.get_closure(name)
+        if names is None:
+            return None
+
+        return sorted(
+            resolved[1]
+            for resolved in map(self.resolve, names)
+            if resolved is not None
+        )
+
+    def get_variables(
+        self,
+        name: str,
+    ) -> typing.Optional[typing.Set[str]]:
+        """Names of all the env variables the template may access"""
+        if name not in self._variables:
+            sources = self.get_sources(name)
+            variables = None
+            if sources is not None:
+                variables = set()
+                for filename in sources:
+                    variables.update(parse(filename).variables)
+            self._variables[name] = variables
+        return self._variables[name]
+
+    def get_names(
+        self,
+        path: typing.Union[str, pathlib.Path],
+    ) -> typing.Set[str]:
+        """Names of templates that change when the given file changes
+
+        A file shadows, replaces or is the resolved template of a name when
+         it lives in the same or a preferred search path directory.
+        """
+        path = os.path.abspath(str(path))
+        names = set()
+        for index, directory in enumerate(self._search_path):
+            name = os.path.relpath(path, directory)
+            if name.startswith('..'):
+                continue
+            resolved = self.resolve(name)
+            if resolved is None or index <= resolved[0]:
+                names.add(name)
+        return names
+
+
+_graphs = {}  # type: typing.Dict[EnvKey, TemplateGraph]
+_indexes = {}  # type: typing.Dict[tuple, TemplateIndex]
+
+
+def get_graph(
+    search_path: SearchPath,
+) -> TemplateGraph:
+    # same layering as the environment, see _get_cache_key
+    key = _get_cache_key(search_path)
+    if key not in _graphs:
+        _graphs[key] = TemplateGraph([pathlib.Path(path) for path in key])
+    return _graphs[key]
+
+
+class TemplateIndex:
+    """Output names of all the templates below one directory
+
+    The index is valid as long as the mtime of each scanned directory is
+     unchanged, which takes one stat call per directory instead of a walk.
+    """
+
+    def __init__(
+        self,
+        directory: pathlib.Path,
+        skip: typing.FrozenSet[str],
+    ):
+        self.files = ()  # type: typing.Tuple[str, ...]
+        self._directory = str(directory)
+        self._skip = skip
+        self._mtimes = {}  # type: typing.Dict[str, typing.Optional[int]]
+        self._build()
+
+    @staticmethod
+    def _get_mtime(directory: str) -> typing.Optional[int]:
+        try:
+            return os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _walk(
+        self,
+        directory: str,
+        prefix: str,
+        files: typing.List[str],
+    ):
+        self._mtimes[directory] = self._get_mtime(directory)
+        with os.scandir(directory) as it:
+            for entry in it:
+                if not prefix and entry.name in self._skip:
+                    continue
+
+                if entry.is_dir():
+                    self._walk(entry.path, prefix + entry.name + '/', files)
+                elif entry.is_file():
+                    files.append(prefix + os.path.splitext(entry.name)[0])
+
+    def _build(self):
+        self._mtimes.clear()
+        files = []
+        try:
+            self._walk(self._directory, '', files)
+        except (FileNotFoundError, NotADirectoryError):
+            files.clear()
+            self._mtimes = {self._directory: None}
+        self.files = tuple(sorted(files))
+
+    @property
+    def exists(self) -> bool:
+        return self._mtimes.get(self._directory) is not None
+
+    def is_fresh(self) -> bool:
+        for directory, mtime in self._mtimes.items():
+            if self._get_mtime(directory) != mtime:
+                return False
+        return True
+
+    def refresh(self) -> 'TemplateIndex':
+        if not self.is_fresh():
+            self._build()
+        return self
+
+
+class RenderCache:
+    """Rendered outputs keyed by their sources and the env values they use
+
+    Many outputs depend on a few env values only and render byte-identical
+     for many projects. Outputs that are unique per project would grow the
+     cache with the fleet, the least recently used ones get evicted.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RENDER_CACHE_MAX_ENTRIES,
+    ):
+        self._outputs = collections.OrderedDict()  # type: Outputs
+        self._max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(
+        graph: TemplateGraph,
+        name: str,
+        env: dict,
+    ) -> typing.Optional[tuple]:
+        sources = graph.get_sources(name)
+        variables = graph.get_variables(name)
+        if sources is None or variables is None:
+            return None
+
+        signature = []
+        for filename in sources:
+            stat = os.stat(filename)
+            signature.append((filename, stat.st_mtime_ns, stat.st_size))
+
+        values = json.dumps(
+            {
+                variable: env[variable]
+                for variable in variables
+                if variable in env
+            },
+            sort_keys=True,
+            default=repr,
+        )
+        return tuple(signature), values
+
+    def get(
+        self,
+        key: tuple,
+    ) -> typing.Optional[str]:
+        output = self._outputs.get(key)
+        if output is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._outputs.move_to_end(key)
+        return output
+
+    def set(
+        self,
+        key: tuple,
+        output: str,
+    ):
+        self._outputs[key] = output
+        if len(self._outputs) > self._max_entries:
+            self._outputs.popitem(last=False)
+
+    def __len__(self):
+        return len(self._outputs)
+
+    def clear(self):
+        self._outputs.clear()
+
+
+def get_render_cache() -> typing.Optional[RenderCache]:
+    return _render_cache
+
+
+def set_render_cache(
+    cache: typing.Optional[RenderCache],
+):
+    global _render_cache
+    _render_cache = cache
+
+
+def invalidate_graphs():
+    """Resolve the templates again, the rendered outputs stay cached
+
+    The keys of the render cache hold the stat of every source, an edited
+     template misses the cache.
+    """
+    for graph in _graphs.values():
+        graph.invalidate()
+
+
+def get_template_files(
+    directory: pathlib.Path,
+    skip: typing.Iterable[str] = (),
+) -> typing.Tuple[str, ...]:
+    skip = frozenset(skip)
+    key = (str(directory), skip)
+    if key in _indexes:
+        return _indexes[key].refresh().files
+
+    index = TemplateIndex(directory, skip)
+    # most projects have no templates of their own, keep the cache flat
+    if index.exists:
+        _indexes[key] = index
+    return index.files
+
+
+def clear_cache():
+    _environments.clear()
+    _graphs.clear()
+    _indexes.clear()
+    _parsed.clear()
@@ -0,0 +1,78 @@
+import pathlib
+import shutil
+import tempfile
+import unittest
+
+from generator import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.root = pathlib.Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_create_fleet(self):
+        fleet = benchmark.create_fleet(self.root / 'a', 12, seed=1)
+        other = benchmark.create_fleet(self.root / 'b', 12, seed=1)
+        self.assertEqual(len(fleet), 12)
+
+        def describe(path: pathlib.Path):
+            return sorted(
+                str(file.relative_to(path))
+                for file in path.rglob('*')
+            ) + [(path / 'buildscript.txt').read_text()]
+
+        self.assertEqual(
+            [describe(path) for path in fleet],
+            [describe(path) for path in other],
+        )
+        cfgs = [(path / 'buildscript.txt').read_text() for path in fleet]
+        self.assertTrue(any('--language=runner' in cfg for cfg in cfgs))
+        self.assertTrue(any('--dependencies=' in cfg for cfg in cfgs))
+        self.assertTrue(any('--src-dir=src' in cfg for cfg in cfgs))
+
+    def test_run_benchmark(self):
+        results = benchmark.run_benchmark(self.root, sizes=[2], repeat=1)
+        self.assertEqual(
+            sorted(results),
+            [
+                'cold/2/from_path',
+                'cold/2/process',
+                'noop/2/from_path',
+                'noop/2/process',
+                'warm/2/from_path',
+                'warm/2/process',
+            ],
+        )
+        self.assertEqual(list(self.root.iterdir()), [])
+
+    def test_compare(self):
+        baseline = {'a': 1.0, 'b': 1.0, 'c': 0.001, 'gone': 1.0}
+        current = {'a': 1.1, 'b': 1.5, 'c': 0.002, 'new': 1.0}
+        self.assertEqual(
+            benchmark.compare(baseline, current, threshold=0.2),
+            ['b'],
+        )
+
+    def test_memory_is_flat(self):
+        results = benchmark.run_memory_benchmark(
+            self.root,
+            size=40,
+            render_cache_size=32,
+        )
+        self.assertEqual(
+            sorted(results),
+            [
+                'memory/40/growth',
+                'memory/40/peak',
+                'memory/40/retained',
+            ],
+        )
+        self.assertEqual(benchmark.check_memory(results, 512), [])
+        self.assertEqual(
+            benchmark.check_memory({'memory/1/growth': 600.0}, 512),
+            ['memory/1/growth'],
+        )
+        self.assertEqual(list(self.root.iterdir()), [])
@@ -0,0 +1,70 @@
+import unittest
+
+from generator.config import (
+    Config,
+    DELETE,
+    FieldOrder,
+    Patch,
+    serialize,
+)
+
+
+class TestConfig(unittest.TestCase):
+    def test_config(self):
+        raw = 'NAME\n--language=es\n--dependencies=mongo,\n'
+        cfg = Config(raw)
+        self.assertEqual(cfg.raw, raw)
+        self.assertEqual(cfg.name, 'NAME')
+        self.assertEqual(cfg.language, 'es')
+        self.assertEqual(cfg.fields, {'dependencies': ['mongo']})
+        self.assertEqual(cfg.digest, Config(raw).digest)
+        self.assertNotEqual(cfg.digest, Config(raw + '\n').digest)
+
+        self.assertTrue(cfg.is_unchanged({'dependencies': ['mongo']}))
+        self.assertFalse(cfg.is_unchanged({'dependencies': ['redis_api']}))
+
+    def test_field_order(self):
+        order = FieldOrder(['language', 'b', 'MARKER', 'a'], 'MARKER')
+        self.assertEqual(
+            sorted(['a', 'z', 'b', 'language', 'c'], key=order.key),
+            ['language', 'b', 'c', 'z', 'a'],
+        )
+
+    def test_serialize(self):
+        order = FieldOrder(['language', 'MARKER'], 'MARKER')
+        self.assertEqual(
+            serialize(
+                'NAME',
+                {'other': 'VALUE', 'language': 'es', 'list': ['one']},
+                order,
+            ),
+            'NAME\n--language=es\n--list=one,\n--other=VALUE\n',
+        )
+
+    def test_patch_parse(self):
+        patch = Patch.parse('set', 'node-version=18.0.0')
+        self.assertEqual(patch.to_list(), ['set', 'node_version', '18.0.0'])
+        patch = Patch.parse('append', 'dependencies=mongo,redis')
+        self.assertEqual(patch.value, ['mongo', 'redis'])
+        patch = Patch.parse('remove', 'has-docs')
+        self.assertEqual(patch.to_list(), ['remove', 'has_docs', None])
+
+        with self.assertRaises(ValueError):
+            Patch.parse('set', 'node-version')
+        with self.assertRaises(ValueError):
+            Patch.parse('set', 'name=other')
+        with self.assertRaises(ValueError):
+            Patch.parse('replace', 'a=b')
+
+    def test_patch_apply(self):
+        self.assertEqual(Patch('set', 'a', 'b').apply('c'), 'b')
+        self.assertEqual(
+            Patch('append', 'a', ['b', 'c']).apply(['c']),
+            ['c', 'b'],
+        )
+        self.assertEqual(Patch('append', 'a', 'b').apply(None), ['b'])
+        self.assertEqual(
+            Patch('remove', 'a', 'b').apply(['b', 'c']),
+            ['c'],
+        )
+        self.assertIs(Patch('remove', 'a').apply(['b']), DELETE)
@@ -0,0 +1,54 @@
+import os
+import pathlib
+import shutil
+import tempfile
+import unittest
+
+from generator.discover import discover
+
+
+class TestDiscover(unittest.TestCase):
+    def setUp(self):
+        self.root = pathlib.Path(tempfile.mkdtemp())
+        for path in (
+            'services/web',
+            'services/web/modules/nested',
+            'services/clsi',
+            'services/clsi/node_modules/dependency',
+            'services/filestore/build',
+            '.git/services/web',
+            'empty',
+        ):
+            (self.root / path).mkdir(parents=True)
+            (self.root / path / 'buildscript.txt').touch()
+        (self.root / 'empty' / 'buildscript.txt').unlink()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _discover(self, root: pathlib.Path):
+        return [
+            str(path.relative_to(self.root))
+            for path in discover(root, 'buildscript.txt')
+        ]
+
+    def test_discover(self):
+        self.assertEqual(
+            self._discover(self.root),
+            [
+                'services/clsi',
+                'services/web',
+                'services/web/modules/nested',
+            ],
+        )
+
+    def test_skip_symlinks(self):
+        os.symlink(str(self.root / 'services'), str(self.root / 'link'))
+        self.assertEqual(len(self._discover(self.root)), 3)
+
+    def test_streaming(self):
+        found = discover(self.root, 'buildscript.txt')
+        self.assertEqual(next(found), self.root / 'services' / 'clsi')
+
+    def test_missing_root(self):
+        self.assertEqual(self._discover(self.root / 'missing'), [])
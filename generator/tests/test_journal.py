@@ -0,0 +1,106 @@
+import pathlib
+import shutil
+import tempfile
+import unittest
+
+from generator.journal import Journal, get_fingerprint, get_run_signature
+from generator.project import Project
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.root = pathlib.Path(tempfile.mkdtemp())
+        self.journal_path = self.root / 'journal.jsonl'
+        self.project_path = self.root / 'project'
+        self.project_path.mkdir()
+        self.cfg = Project.get_cfg_path(self.project_path)
+        self.cfg.write_text('NAME\n--language=runner\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_fingerprint(self):
+        fingerprint = get_fingerprint(self.project_path, 'SIGNATURE')
+        self.assertEqual(
+            fingerprint,
+            get_fingerprint(self.project_path, 'SIGNATURE'),
+        )
+        self.assertNotEqual(
+            fingerprint,
+            get_fingerprint(self.project_path, 'OTHER'),
+        )
+
+        (self.project_path / 'install_deps.sh').touch()
+        with_marker = get_fingerprint(self.project_path, 'SIGNATURE')
+        self.assertNotEqual(fingerprint, with_marker)
+
+        self.cfg.write_text('NAME\n--language=runner\n--node-version=1\n')
+        self.assertNotEqual(
+            with_marker,
+            get_fingerprint(self.project_path, 'SIGNATURE'),
+        )
+
+    def test_invalid(self):
+        self.cfg.write_text('NAME\n--dependencies=redis,\n')
+        self.assertIsNone(get_fingerprint(self.project_path, 'SIGNATURE'))
+        self.assertIsNone(get_fingerprint(self.root / 'missing', 'SIG'))
+
+    def test_run_signature(self):
+        templates = self.root / 'templates'
+        templates.mkdir()
+        (templates / 'dummy.j2').write_text('ONE')
+        signature = get_run_signature({'dry_run': False}, templates)
+        self.assertNotEqual(
+            signature,
+            get_run_signature({'dry_run': True}, templates),
+        )
+        (templates / 'dummy.j2').write_text('TWO_')
+        self.assertNotEqual(
+            signature,
+            get_run_signature({'dry_run': False}, templates),
+        )
+
+    def test_resume(self):
+        other = self.root / 'other'
+        other.mkdir()
+        Project.get_cfg_path(other).write_text('OTHER\n--language=runner\n')
+
+        journal = Journal(self.journal_path, 'SIGNATURE')
+        journal.record(self.project_path)
+        journal.close()
+        with self.journal_path.open('a') as file:
+            file.write('{"path": "/torn')
+
+        journal = Journal(self.journal_path, 'SIGNATURE', resume=True)
+        paths = [self.project_path, other]
+        self.assertEqual(list(journal.filter(paths)), [other])
+        self.assertEqual(journal.skipped, 1)
+        journal.close()
+
+        # a fresh run starts over
+        journal = Journal(self.journal_path, 'SIGNATURE')
+        self.assertFalse(journal.is_done(self.project_path))
+        journal.close()
+        self.assertEqual(self.journal_path.read_text(), '')
+
+    def test_resume_broken_config(self):
+        journal = Journal(self.journal_path, 'SIGNATURE')
+        journal.record(self.project_path)
+        journal.close()
+
+        self.cfg.write_text('NAME\n')
+        journal = Journal(self.journal_path, 'SIGNATURE', resume=True)
+        self.assertEqual(
+            list(journal.filter([self.project_path])),
+            [self.project_path],
+        )
+        journal.close()
+
+    def test_changed_signature(self):
+        journal = Journal(self.journal_path, 'SIGNATURE')
+        journal.record(self.project_path)
+        journal.close()
+
+        journal = Journal(self.journal_path, 'OTHER', resume=True)
+        self.assertFalse(journal.is_done(self.project_path))
+        journal.close()
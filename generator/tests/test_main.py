@@ -0,0 +1,384 @@
+import io
+import json
+import pathlib
+import shutil
+import tarfile
+import tempfile
+import unittest
+from unittest import mock
+
+from generator.__main__ import (
+    get_args,
+    main,
+    Job,
+)
+from generator import snapshot
+from generator import templates
+from generator.project import Project
+from generator.sink import set_sink
+
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.root = pathlib.Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        templates.set_render_cache(None)
+
+    def _add_project(self, name: str, cfg: str) -> pathlib.Path:
+        path = self.root / name
+        path.mkdir()
+        Project.get_cfg_path(path).write_text(name + '\n' + cfg)
+        return path
+
+    @mock.patch.object(Project, 'process', return_value=True)
+    def test_parallel(self, process):
+        paths = [
+            self._add_project('p%d' % i, '--language=runner\n')
+            for i in range(4)
+        ]
+        args = get_args(['--jobs', '2'] + [str(path) for path in paths])
+        self.assertEqual(main(args), 0)
+
+    @mock.patch.object(Project, 'process', return_value=True)
+    def test_parallel_invalid_config(self, process):
+        valid = self._add_project('valid', '--language=runner\n')
+        invalid = self._add_project('invalid', '--dependencies=single\n')
+        args = get_args(['--jobs', '2', str(invalid), str(valid)])
+        self.assertEqual(main(args), 1)
+
+    @mock.patch.object(Project, 'process', return_value=False)
+    def test_serial_stops_on_invalid_config(self, process):
+        invalid = self._add_project('invalid', '--dependencies=single\n')
+        valid = self._add_project('valid', '--language=runner\n')
+        args = get_args([str(invalid), str(valid)])
+        self.assertEqual(main(args), 1)
+        process.assert_not_called()
+
+    @mock.patch.object(Project, 'process', return_value=True)
+    def test_discover(self, process):
+        self._add_project('p0', '--language=runner\n')
+        self._add_project('p1', '--language=es\n')
+        (self.root / 'node_modules').mkdir()
+        self._add_project('node_modules/p2', '--language=es\n')
+
+        for jobs in ('1', '2'):
+            args = get_args(['--jobs', jobs, '--discover', str(self.root)])
+            self.assertEqual(args.path, [])
+            self.assertEqual(main(args), 0)
+        self.assertEqual(process.call_count, 2)
+
+    def test_keep_going(self):
+        broken = self._add_project('broken', '--language=runner\n')
+        invalid = self._add_project('invalid', '--dependencies=single\n')
+        valid = self._add_project('valid', '--language=runner\n')
+        journal = self.root / 'journal.jsonl'
+        paths = [str(broken), str(invalid), str(valid)]
+        failing = {broken}
+
+        def process(project, outputs=None):
+            if project._path in failing:
+                raise RuntimeError('boom')
+            return True
+
+        with mock.patch.object(
+            Project,
+            'process',
+            autospec=True,
+            side_effect=process,
+        ) as mocked:
+            args = get_args(['--keep-going', '--journal', str(journal)])
+            args.path = paths
+            self.assertEqual(main(args), -1)
+            self.assertEqual(mocked.call_count, 2)
+
+            # fix both projects, only they get processed again
+            failing.clear()
+            Project.get_cfg_path(invalid).write_text(
+                'invalid\n--language=runner\n'
+            )
+            args = get_args(['--resume', '--journal', str(journal)] + paths)
+            self.assertEqual(main(args), 0)
+            self.assertEqual(mocked.call_count, 4)
+
+            self.assertEqual(main(args), 0)
+            self.assertEqual(mocked.call_count, 4)
+
+    def test_check(self):
+        path = self._add_project('runner', '--language=runner\n')
+        self.assertEqual(main(get_args(['--check', str(path)])), 3)
+        self.assertEqual(
+            [file.name for file in path.iterdir()],
+            ['buildscript.txt'],
+        )
+
+        self.assertEqual(main(get_args([str(path)])), 0)
+        self.assertEqual(main(get_args(['--check', str(path)])), 0)
+
+        (path / 'Makefile').write_text('')
+        self.assertEqual(main(get_args(['--check', str(path)])), 3)
+
+    @mock.patch.object(Project, 'process', side_effect=RuntimeError('boom'))
+    def test_buffered_collects_log(self, process):
+        path = self._add_project('broken', '--language=runner\n')
+        job = Job(
+            options={'dry_run': True},
+            overrides={},
+        )
+        result = job.run_buffered(path)
+        self.assertEqual(result.code, -1)
+        self.assertTrue(result.log[0].startswith('broken: ERROR'))
+
+    def test_profile(self):
+        paths = [
+            self._add_project('p%d' % i, '--language=runner\n')
+            for i in range(2)
+        ]
+        traces = self.root / 'traces'
+        args = get_args(['--profile', str(traces)] + [str(p) for p in paths])
+        self.assertEqual(main(args), 0)
+        self.assertEqual(
+            sorted(file.name for file in traces.iterdir()),
+            ['p0.json', 'p1.json', 'run.json'],
+        )
+
+        project = json.loads((traces / 'p0.json').read_text())
+        run = json.loads((traces / 'run.json').read_text())
+        for phase in ('parse_cfg', 'get_env', 'load', 'render', 'write'):
+            self.assertIn(phase, project['phases'])
+        self.assertEqual(run['phases']['project']['calls'], 2)
+        self.assertEqual(
+            run['phases']['write']['bytes_written'],
+            sum(
+                file.stat().st_size
+                for path in paths
+                for file in path.iterdir()
+                if file.name != 'buildscript.txt'
+            ),
+        )
+
+    def test_render(self):
+        path = self._add_project('runner', '--language=runner\n')
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            self.assertEqual(main(get_args(['--render', str(path)])), 0)
+        outputs = json.loads(stdout.getvalue())[str(path)]
+        self.assertIn('Makefile', outputs)
+        self.assertEqual(
+            [file.name for file in path.iterdir()],
+            ['buildscript.txt'],
+        )
+
+    def test_patch(self):
+        path = self._add_project(
+            'runner',
+            '--language=runner\n--node-version=12.0.0\n',
+        )
+        self.assertEqual(main(get_args([str(path)])), 0)
+        ignore = (path / '.editorconfig').stat().st_mtime_ns
+
+        args = get_args(['--set', 'node-version=14.0.0', str(path)])
+        with mock.patch.object(Project, 'process', autospec=True) as process:
+            process.return_value = True
+            self.assertEqual(main(args), 0)
+        outputs = process.call_args[1]['outputs']
+        self.assertIn('.nvmrc', outputs)
+        self.assertNotIn('.editorconfig', outputs)
+
+        self.assertEqual(main(args), 0)
+        self.assertEqual((path / '.nvmrc').read_text(), '14.0.0\n')
+        self.assertIn(
+            '--node-version=14.0.0\n',
+            Project.get_cfg_path(path).read_text(),
+        )
+        self.assertEqual((path / '.editorconfig').stat().st_mtime_ns, ignore)
+
+    def test_patch_validate(self):
+        path = self._add_project('runner', '--language=runner\n')
+        cfg = Project.get_cfg_path(path).read_text()
+        args = get_args(['--set', 'dependencies=mongo', str(path)])
+        with mock.patch.object(Project, 'process') as process:
+            self.assertEqual(main(args), 1)
+        process.assert_not_called()
+
+        args = get_args(['--append', 'dependencies=redis', str(path)])
+        self.assertEqual(main(args), 2)
+        self.assertEqual(Project.get_cfg_path(path).read_text(), cfg)
+        self.assertEqual(
+            [file.name for file in path.iterdir()],
+            ['buildscript.txt'],
+        )
+
+    def test_patch_invalid(self):
+        with mock.patch('sys.stderr', new_callable=io.StringIO):
+            with self.assertRaises(SystemExit):
+                get_args(['--set', 'name=other', str(self.root)])
+
+    def test_output_tar(self):
+        path = self._add_project('runner', '--language=runner\n')
+        target = self.root / 'outputs.tar'
+        args = get_args(['--output-tar', str(target), str(path)])
+        self.addCleanup(set_sink, None)
+        self.assertEqual(main(args), 0)
+
+        self.assertEqual(
+            [file.name for file in path.iterdir()],
+            ['buildscript.txt'],
+        )
+        with tarfile.open(str(target)) as archive:
+            names = archive.getnames()
+        # outside of the working directory, like tar strips the root
+        self.assertIn(str(path / 'Makefile').lstrip('/'), names)
+
+    def test_render_not_journaled(self):
+        path = self._add_project('runner', '--language=runner\n')
+        journal = self.root / 'journal.jsonl'
+        with mock.patch('sys.stdout', new_callable=io.StringIO):
+            args = get_args([
+                '--render', '--keep-going', '--journal', str(journal),
+                str(path),
+            ])
+            self.assertEqual(main(args), 0)
+
+        args = get_args(['--resume', '--journal', str(journal), str(path)])
+        self.assertEqual(main(args), 0)
+        self.assertTrue((path / 'Makefile').exists())
+
+    def test_output_dir_journal(self):
+        path = self._add_project('runner', '--language=runner\n')
+        journal = self.root / 'journal.jsonl'
+        output = self.root / 'output'
+        self.addCleanup(set_sink, None)
+        args = get_args([
+            '--keep-going', '--journal', str(journal),
+            '--output-dir', str(output), str(path),
+        ])
+        self.assertEqual(main(args), 0)
+        self.assertFalse((path / 'Makefile').exists())
+        set_sink(None)
+
+        args = get_args(['--resume', '--journal', str(journal), str(path)])
+        self.assertEqual(main(args), 0)
+        self.assertTrue((path / 'Makefile').exists())
+
+    @mock.patch('generator.__main__._watch', return_value=0)
+    @mock.patch('generator.__main__._run_parallel', return_value=[])
+    @mock.patch('generator.__main__._setup_caches')
+    def test_watch_parallel_setup(self, setup_caches, run_parallel, watch):
+        output = self.root / 'output'
+        args = get_args([
+            '--watch', '--jobs', '2', '--output-dir', str(output),
+            str(self.root),
+        ])
+        self.assertEqual(main(args), 0)
+        setup_caches.assert_called_once()
+        self.assertEqual(setup_caches.call_args[0][-1], output)
+        watch.assert_called_once()
+
+    @mock.patch('generator.__main__._watch', return_value=0)
+    def test_watch_resumed(self, watch):
+        path = self._add_project('runner', '--language=runner\n')
+        journal = self.root / 'journal.jsonl'
+        args = get_args(['--keep-going', '--journal', str(journal), str(path)])
+        self.assertEqual(main(args), 0)
+
+        args = get_args([
+            '--resume', '--watch', '--journal', str(journal), str(path),
+        ])
+        self.assertEqual(main(args), 0)
+        self.assertEqual(watch.call_args[1]['paths'], [path])
+
+    def test_parallel_stop(self):
+        paths = [str(self._add_project('invalid', '--dependencies=one\n'))]
+        for index in range(6):
+            paths.append(str(self._add_project(
+                'valid-{}'.format(index),
+                '--language=runner\n',
+            )))
+
+        # at most two projects per job are in flight
+        args = get_args(['--jobs', '2'] + paths)
+        self.assertEqual(main(args), 1)
+        for path in paths[5:]:
+            self.assertFalse((pathlib.Path(path) / 'Makefile').exists())
+
+    def test_output_tar_failure(self):
+        valid = self._add_project('valid', '--language=runner\n')
+        broken = self._add_project('broken', '--language=runner\n')
+        target = self.root / 'outputs.tar'
+        args = get_args(['--output-tar', str(target), str(valid), str(broken)])
+        self.addCleanup(set_sink, None)
+
+        original = Project.process
+
+        def process(project, outputs=None):
+            if project._path == broken:
+                raise ValueError('boom')
+            return original(project, outputs=outputs)
+
+        with mock.patch.object(
+            Project,
+            'process',
+            autospec=True,
+            side_effect=process,
+        ):
+            with self.assertRaises(ValueError):
+                main(args)
+
+        # the archive is complete up to the failure
+        with tarfile.open(str(target)) as archive:
+            names = archive.getnames()
+        self.assertIn(str(valid / 'Makefile').lstrip('/'), names)
+
+    def test_serve(self):
+        path = self._add_project('runner', '--language=runner\n')
+        self.addCleanup(snapshot.set_snapshot_cache, None)
+        socket = self.root / 'generator.sock'
+        with mock.patch('generator.server.serve') as serve:
+            self.assertEqual(main(get_args(['--serve', str(socket)])), 0)
+        (served, dispatch), _ = serve.call_args
+        self.assertEqual(served, socket)
+
+        self.assertEqual(dispatch({'action': 'ping'})['code'], 0)
+        self.assertEqual(dispatch({'action': 'other'})['code'], -1)
+
+        response = dispatch({'action': 'check', 'paths': [str(path)]})
+        self.assertEqual(response['code'], 3)
+        self.assertEqual(response['results'][0]['path'], str(path))
+        response = dispatch({'action': 'update', 'paths': [str(path)]})
+        self.assertEqual(response['code'], 0)
+        self.assertTrue((path / 'Makefile').exists())
+        response = dispatch({'action': 'check', 'paths': [str(path)]})
+        self.assertEqual(response['code'], 0)
+
+        response = dispatch({'action': 'render', 'paths': [str(path)]})
+        self.assertEqual(
+            response['results'][0]['outputs']['Makefile'],
+            (path / 'Makefile').read_text(),
+        )
+
+        response = dispatch({'action': 'update', 'durability': 'always'})
+        self.assertEqual(response['code'], -1)
+        with mock.patch('generator.__main__.Job', wraps=Job) as job:
+            dispatch({
+                'action': 'update',
+                'paths': [],
+                'incremental': True,
+                'durability': 'file',
+            })
+        options = job.call_args[1]['options']
+        self.assertTrue(options['incremental'])
+        self.assertEqual(options['durability'], 'file')
+
+    @mock.patch('generator.server.request')
+    def test_connect_options(self, request):
+        request.return_value = {'code': 0, 'log': []}
+        path = self._add_project('runner', '--language=runner\n')
+        args = get_args([
+            '--connect', str(self.root / 'generator.sock'),
+            '--incremental', '--fsync', 'project', str(path),
+        ])
+        self.assertEqual(main(args), 0)
+        payload = request.call_args[1]['payload']
+        self.assertTrue(payload['incremental'])
+        self.assertEqual(payload['durability'], 'project')
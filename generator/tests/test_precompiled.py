@@ -0,0 +1,94 @@
+import pathlib
+import shutil
+import tempfile
+import unittest
+
+from generator import templates
+from generator.precompiled import Precompiled, compile_templates
+
+
+class TestPrecompiled(unittest.TestCase):
+    def setUp(self):
+        self.templates_path = pathlib.Path(tempfile.mkdtemp())
+        self.target_path = pathlib.Path(tempfile.mkdtemp())
+        self.lang = self.templates_path / '_' / 'lang'
+        self.search_path = [
+            self.templates_path / '_' / 'name',
+            self.lang,
+            self.templates_path,
+        ]
+
+        self._write(
+            self.templates_path / 'macros' / 'header.j2',
+            '{% macro header() %}HEADER{% endmacro %}',
+        )
+        self._write(
+            self.templates_path / 'base.j2',
+            "{% from 'macros/header.j2' import header %}{{ header() }}\n"
+            '{% block body %}BASE{% endblock %}\n',
+        )
+        # shadowed by the language template
+        self._write(self.templates_path / 'Makefile.j2', 'GLOBAL\n')
+        self._write(
+            self.lang / 'Makefile.j2',
+            "{% extends 'base.j2' %}"
+            '{% block body %}LANG {{ var }}{% endblock %}',
+        )
+        self.addCleanup(templates.set_precompiled, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.templates_path)
+        shutil.rmtree(self.target_path)
+
+    @staticmethod
+    def _write(path: pathlib.Path, content: str):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+    def _render(self) -> str:
+        env = templates.get_environment(self.search_path)
+        return env.get_template('Makefile.j2').render(var='VAL')
+
+    def _compile(self, target: pathlib.Path) -> Precompiled:
+        compile_templates(root=self.templates_path, target=target)
+        return Precompiled.load(path=target, root=self.templates_path)
+
+    def test_directory(self):
+        precompiled = self._compile(self.target_path / 'compiled')
+        self.assertIsNotNone(precompiled)
+
+        expected = self._render()
+        self.assertEqual(expected, 'HEADER\nLANG VAL')
+
+        templates.set_precompiled(precompiled)
+        env = templates.get_environment(self.search_path)
+        template = env.get_template('Makefile.j2')
+        self.assertTrue(template.filename.endswith('.py'))
+        self.assertEqual(self._render(), expected)
+
+    def test_zip(self):
+        precompiled = self._compile(self.target_path / 'compiled.zip')
+        templates.set_precompiled(precompiled)
+        self.assertEqual(self._render(), 'HEADER\nLANG VAL')
+
+    def test_outdated(self):
+        target = self.target_path / 'compiled'
+        self._compile(target)
+
+        (self.templates_path / 'Makefile.j2').write_text('CHANGED')
+        self.assertIsNone(Precompiled.load(target, self.templates_path))
+
+        (self.templates_path / 'new.j2').write_text('')
+        self.assertIsNone(Precompiled.load(target, self.templates_path))
+
+    def test_missing(self):
+        self.assertIsNone(
+            Precompiled.load(self.target_path / 'missing', self.templates_path)
+        )
+
+    def test_parsed(self):
+        precompiled = self._compile(self.target_path / 'compiled')
+        parsed = precompiled.get_parsed(str(self.lang / 'Makefile.j2'))
+        self.assertEqual(parsed.references, {'base.j2'})
+        self.assertEqual(parsed.variables, {'var'})
+        self.assertIsNone(precompiled.get_parsed('/elsewhere/Makefile.j2'))
@@ -0,0 +1,56 @@
+import unittest
+
+from generator import profiling
+
+
+class TestProfiler(unittest.TestCase):
+    def tearDown(self):
+        profiling.set_profiler(None)
+
+    def test_disabled(self):
+        items = iter(['A'])
+        self.assertIs(profiling.iterate('render', items), items)
+        with profiling.phase('write') as span:
+            span.bytes_written += 1
+
+    def test_phase(self):
+        profiler = profiling.Profiler()
+        profiling.set_profiler(profiler)
+        for _ in range(2):
+            with profiling.phase('write', file='Makefile') as span:
+                span.bytes_written += 3
+
+        self.assertEqual(profiler.phases['write']['calls'], 2)
+        self.assertEqual(profiler.phases['write']['bytes_written'], 6)
+        event = profiler.events[0]
+        self.assertEqual(event['ph'], 'X')
+        self.assertEqual(
+            event['args'],
+            {'file': 'Makefile', 'bytes_written': 3},
+        )
+
+    def test_iterate(self):
+        profiler = profiling.Profiler()
+        profiling.set_profiler(profiler)
+        chunks = profiling.iterate('render', ['A', 'B'], template='dummy')
+        self.assertEqual(profiler.events, [])
+        self.assertEqual(list(chunks), ['A', 'B'])
+
+        self.assertEqual(profiler.phases['render']['calls'], 1)
+        self.assertEqual(
+            profiler.events[0]['args'],
+            {'template': 'dummy', 'chunks': 2},
+        )
+
+    def test_merge(self):
+        traces = []
+        for size in (1, 2):
+            profiler = profiling.Profiler()
+            with profiler.phase('read') as span:
+                span.bytes_read += size
+            traces.append(profiler.to_dict())
+
+        merged = profiling.merge(traces)
+        self.assertEqual(len(merged['traceEvents']), 2)
+        self.assertEqual(merged['phases']['read']['calls'], 2)
+        self.assertEqual(merged['phases']['read']['bytes_read'], 3)
@@ -1,10 +1,15 @@
+import os
 import pathlib
 import shutil
 import tempfile
 import unittest
 from unittest import mock
 
+from generator import prefetch
+from generator import templates as template_cache
+from generator.config import Patch
 from generator.project import Project, InvalidConfig
+from generator.sink import MemorySink, set_sink
 
 
 def strip_indent(raw):
@@ -27,11 +32,20 @@ class TestProject(unittest.TestCase):
     def setUp(self):
         self.project_path = pathlib.Path(tempfile.mkdtemp())
         self.templates_path = pathlib.Path(tempfile.mkdtemp())
+        self.cache_path = pathlib.Path(tempfile.mkdtemp())
         GenericProject.register()
 
+        patcher = mock.patch(
+            'generator.manifest.get_cache_dir',
+            return_value=self.cache_path,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def tearDown(self):
         shutil.rmtree(self.project_path)
         shutil.rmtree(self.templates_path)
+        shutil.rmtree(self.cache_path)
         GenericProject.deregister()
 
     def test_simple_access(self):
@@ -54,6 +68,13 @@ class TestProject(unittest.TestCase):
         self.assertEqual(project['arg'], 'OTHER_VAL')
         self.assertTrue(project._changed)
 
+    def test_slots(self):
+        from generator.project.es import ESProject
+
+        project = ESProject(name='NAME', path=self.project_path)
+        with self.assertRaises(AttributeError):
+            project.other = 'VAL'
+
     def test_write(self):
         project = Project(
             name='NAME',
@@ -259,6 +280,28 @@ class TestProject(unittest.TestCase):
         self.assertFalse(project._dump_cfg())
         self.assertEqual(actual, project_in)
 
+    def test_dump_cfg_without_reading(self):
+        project_in = strip_indent(
+            """
+            NAME
+            --language=LANGUAGE
+            --arg=val
+            """
+        )
+        Project.get_cfg_path(self.project_path).write_text(project_in)
+        project = Project.from_path(self.project_path)
+        project._changed = True
+
+        with mock.patch.object(pathlib.Path, 'read_text') as read_text:
+            self.assertFalse(project._dump_cfg())
+            project['arg'] = 'other'
+            self.assertTrue(project._dump_cfg())
+        read_text.assert_not_called()
+        self.assertEqual(
+            Project.get_cfg_path(self.project_path).read_text(),
+            project_in.replace('val', 'other'),
+        )
+
     def test_drop_script_version_(self):
         project_in = strip_indent(
             """
@@ -436,6 +479,75 @@ class TestProject(unittest.TestCase):
             self.assertEqual(path.read_text(), content)
             path.unlink()
 
+    def test_shared_template_env(self):
+        templates = self.templates_path
+        (templates / 'dummy.j2').write_text('{{ name }}\n')
+        project_1 = GenericProject(
+            name='NAME_1',
+            path=self.project_path,
+            templates=templates,
+        )
+        project_2 = GenericProject(
+            name='NAME_2',
+            path=self.project_path,
+            templates=templates,
+        )
+
+        self.assertIs(project_1._template_env, project_2._template_env)
+        self.assertIs(
+            project_1._get_template('dummy'),
+            project_2._get_template('dummy'),
+        )
+
+    def test_shared_template_env_reload(self):
+        templates = self.templates_path
+        source = templates / 'dummy.j2'
+        source.write_text('OLD\n')
+        project = GenericProject(
+            name='NAME',
+            path=self.project_path,
+            templates=templates,
+        )
+        self.assertEqual(project._get_template('dummy').render(), 'OLD\n')
+
+        source.write_text('NEW\n')
+        mtime = source.stat().st_mtime + 1
+        os.utime(str(source), (mtime, mtime))
+
+        other = GenericProject(
+            name='OTHER',
+            path=self.project_path,
+            templates=templates,
+        )
+        self.assertEqual(other._get_template('dummy').render(), 'NEW\n')
+
+    def test_get_affected_outputs(self):
+        templates = self.templates_path
+        project = GenericProject(
+            name='NAME',
+            path=self.project_path,
+            templates=templates,
+        )
+        (templates / 'macros').mkdir()
+        (templates / 'macros' / 'header.j2').write_text('')
+        (templates / 'with_header.j2').write_text(
+            "{% from 'macros/header.j2' import header %}"
+        )
+        (templates / 'plain.j2').write_text('')
+
+        self.assertEqual(
+            project.get_affected_outputs([templates / 'macros/header.j2']),
+            {'with_header'},
+        )
+        self.assertEqual(
+            project.get_affected_outputs([templates / 'plain.j2']),
+            {'plain'},
+        )
+        self.assertEqual(
+            project.get_affected_outputs([templates / 'unrelated.j2']),
+            set(),
+        )
+
     def test_get_files_to_update(self):
         templates = self.templates_path
         project = GenericProject(
@@ -572,3 +684,275 @@ class TestProject(unittest.TestCase):
 
         self.assertEqual(cfg_actual, cfg_expected)
         self.assertEqual(target.read_text(), 'NAME\n')
+
+    def test_process_empty_unchanged(self):
+        templates = self.templates_path
+        (templates / 'dummy.j2').write_text('{{ name }}\n')
+        (templates / '.eslintignore.j2').write_text('\n')
+
+        def process() -> bool:
+            return GenericProject(
+                name='NAME',
+                path=self.project_path,
+                templates=templates,
+            ).process()
+
+        self.assertTrue(process())
+        self.assertFalse(process())
+        self.assertFalse((self.project_path / '.eslintignore').exists())
+
+    def test_process_io_threads(self):
+        templates = self.templates_path
+        (templates / 'dummy.j2').write_text('{{ name }}\n')
+        (templates / 'nested').mkdir()
+        (templates / 'nested' / 'other.j2').write_text('{{ language }}\n')
+        (self.project_path / 'dummy').write_text('OLD\n')
+        project = GenericProject(
+            name='NAME',
+            path=self.project_path,
+            templates=templates,
+        )
+
+        prefetch.set_io_threads(2)
+        self.addCleanup(prefetch.set_io_threads, 0)
+        self.assertTrue(project.process())
+        self.assertEqual(
+            (self.project_path / 'dummy').read_text(),
+            'NAME\n',
+        )
+        self.assertEqual(
+            (self.project_path / 'nested' / 'other').read_text(),
+            'LANGUAGE\n',
+        )
+        self.assertEqual(project.check(), [])
+
+    def test_process_memory(self):
+        templates = self.templates_path
+        (templates / 'dummy.j2').write_text('{{ has_unit_tests }}\n')
+        path = pathlib.Path('/nonexistent/project')
+        sink = MemorySink({
+            Project.get_cfg_path(path): 'NAME\n--language=LANGUAGE\n',
+            path / 'test' / 'unit' / 'a.js': '',
+        })
+        set_sink(sink)
+        self.addCleanup(set_sink, None)
+
+        self.assertIsInstance(Project.from_path(path), GenericProject)
+        project = GenericProject(
+            name='NAME',
+            path=path,
+            templates=templates,
+        )
+        self.assertTrue(project.process())
+        self.assertEqual(sink.read(path / 'dummy'), 'True\n')
+        self.assertEqual(project.check(), [])
+        self.assertFalse(path.exists())
+
+    def test_process_incremental(self):
+        templates = self.templates_path
+        target = self.project_path / 'dummy'
+        source = templates / 'dummy.j2'
+        source.write_text('{{ name }}\n')
+
+        def process():
+            project = GenericProject(
+                name='NAME',
+                path=self.project_path,
+                templates=templates,
+                incremental=True,
+            )
+            with mock.patch.object(
+                project,
+                '_update_file',
+                wraps=project._update_file,
+            ) as update_file:
+                project.process()
+            return update_file.call_count
+
+        self.assertEqual(process(), 1)
+        self.assertEqual(target.read_text(), 'NAME\n')
+
+        # no-op
+        self.assertEqual(process(), 0)
+
+        # touched template
+        os.utime(str(source), (0, 0))
+        self.assertEqual(process(), 0)
+
+        # changed template
+        source.write_text('{{ name }} {{ language }}\n')
+        self.assertEqual(process(), 1)
+        self.assertEqual(target.read_text(), 'NAME LANGUAGE\n')
+
+        # changed output
+        target.write_text('EDITED\n')
+        self.assertEqual(process(), 1)
+        self.assertEqual(target.read_text(), 'NAME LANGUAGE\n')
+
+        # deleted output
+        target.unlink()
+        self.assertEqual(process(), 1)
+        self.assertTrue(target.exists())
+
+    def test_process_incremental_shadowed(self):
+        templates = self.templates_path
+        (templates / 'nested').mkdir()
+        (templates / 'nested' / 'dummy.j2').write_text('LOWER\n')
+        layer = templates / '_' / 'NAME' / 'nested'
+        layer.mkdir(parents=True)
+        (layer / 'other.j2').write_text('OTHER\n')
+        target = self.project_path / 'nested' / 'dummy'
+
+        def process():
+            GenericProject(
+                name='NAME',
+                path=self.project_path,
+                templates=templates,
+                incremental=True,
+            ).process()
+            # the next run resolves from scratch
+            template_cache.clear_cache()
+
+        process()
+        self.assertEqual(target.read_text(), 'LOWER\n')
+
+        # the stat of the recorded search path stays the same
+        (layer / 'dummy.j2').write_text('UPPER\n')
+        process()
+        self.assertEqual(target.read_text(), 'UPPER\n')
+
+    def test_process_all_or_nothing(self):
+        templates = self.templates_path
+        (templates / 'a.j2').write_text('{{ name }}\n')
+        (templates / 'b.j2').write_text('{{ missing.attribute }}\n')
+        project = GenericProject(
+            name='NAME',
+            path=self.project_path,
+            templates=templates,
+        )
+
+        with self.assertRaises(Exception):
+            project.process()
+        self.assertEqual(list(self.project_path.iterdir()), [])
+
+        (templates / 'b.j2').write_text('{{ language }}\n')
+        project.process()
+        self.assertEqual((self.project_path / 'a').read_text(), 'NAME\n')
+        self.assertEqual((self.project_path / 'b').read_text(), 'LANGUAGE\n')
+
+    def test_check(self):
+        templates = self.templates_path
+        target = self.project_path / 'dummy'
+        (templates / 'dummy.j2').write_text('{{ name }}\n')
+        (templates / 'empty.j2').write_text('\n')
+
+        class DemoProject(GenericProject):
+            @staticmethod
+            def _get_deleted_templates():
+                return {'old'}
+
+        project = DemoProject(
+            name='NAME',
+            path=self.project_path,
+            templates=templates,
+        )
+
+        drift = project.check()
+        self.assertEqual(
+            [(item.name, item.current, item.expected) for item in drift],
+            [
+                ('dummy', None, 'NAME\n'),
+                ('buildscript.txt', None, 'NAME\n--language=LANGUAGE\n'),
+            ],
+        )
+        self.assertEqual(list(self.project_path.iterdir()), [])
+
+        project.process()
+        self.assertEqual(project.check(), [])
+
+        target.write_text('OTHER\n')
+        (self.project_path / 'old').touch()
+        drift = project.check()
+        self.assertEqual(
+            [(item.name, item.current, item.expected) for item in drift],
+            [
+                ('old', '', None),
+                ('dummy', 'OTHER\n', 'NAME\n'),
+            ],
+        )
+        self.assertIn('-OTHER\n+NAME\n', drift[1].get_diff())
+        self.assertEqual(target.read_text(), 'OTHER\n')
+
+    def test_render(self):
+        templates = self.templates_path
+        (templates / 'dummy.j2').write_text('{{ name }}\n')
+        (templates / 'empty.j2').write_text('\n')
+        project = GenericProject(
+            name='NAME',
+            path=self.project_path,
+            templates=templates,
+        )
+
+        # the config is an input, not an output
+        self.assertEqual(project.render(), {'dummy': 'NAME\n'})
+        self.assertEqual(project.render({'empty'}), {})
+        self.assertEqual(list(self.project_path.iterdir()), [])
+
+    def test_patch(self):
+        templates = self.templates_path
+        (templates / 'version.j2').write_text('{{ version }}\n')
+        (templates / 'name.j2').write_text('{{ name }}\n')
+        project = GenericProject(
+            name='NAME',
+            path=self.project_path,
+            templates=templates,
+            version='1',
+            tags=['a'],
+        )
+
+        self.assertEqual(
+            project.patch([Patch('set', 'version', '2')]),
+            {'version'},
+        )
+        self.assertEqual(project['version'], '2')
+        self.assertEqual(project.get_outputs_using({'version'}), {'version'})
+
+        self.assertEqual(project.patch([Patch('append', 'tags', 'a')]), set())
+        self.assertEqual(
+            project.patch([
+                Patch('append', 'tags', 'b'),
+                Patch('remove', 'version'),
+            ]),
+            {'tags', 'version'},
+        )
+        self.assertEqual(project['tags'], ['a', 'b'])
+        self.assertNotIn('version', project)
+        self.assertTrue(project._changed)
+
+    def test_render_cache(self):
+        templates = self.templates_path
+        (templates / 'shared.j2').write_text('{{ var }}\n')
+        (templates / 'named.j2').write_text('{{ name }} {{ var }}\n')
+        cache = template_cache.RenderCache()
+        template_cache.set_render_cache(cache)
+        self.addCleanup(template_cache.set_render_cache, None)
+
+        def render(name: str, file: str, var: str) -> str:
+            project = GenericProject(
+                name=name,
+                path=self.project_path,
+                templates=templates,
+            )
+            return project._render(file, {'name': name, 'var': var})
+
+        self.assertEqual(render('ONE', 'shared', 'VAL'), 'VAL\n')
+        self.assertEqual(render('TWO', 'shared', 'VAL'), 'VAL\n')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        self.assertEqual(render('TWO', 'shared', 'OTHER'), 'OTHER\n')
+        self.assertEqual(render('ONE', 'named', 'VAL'), 'ONE VAL\n')
+        self.assertEqual(render('TWO', 'named', 'VAL'), 'TWO VAL\n')
+        self.assertEqual((cache.hits, cache.misses), (1, 4))
+
+        (templates / 'shared.j2').write_text('CHANGED {{ var }}\n')
+        self.assertEqual(render('ONE', 'shared', 'VAL'), 'CHANGED VAL\n')
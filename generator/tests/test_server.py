@@ -0,0 +1,63 @@
+import pathlib
+import shutil
+import tempfile
+import threading
+import unittest
+
+from generator.server import Server, request
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.root = pathlib.Path(tempfile.mkdtemp())
+        self.path = self.root / 'generator.sock'
+        self.requests = []
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _dispatch(self, payload: dict) -> dict:
+        self.requests.append(payload)
+        if payload.get('action') == 'fail':
+            raise RuntimeError('dispatch failed')
+        return {'code': 0, 'echo': payload}
+
+    def _start(self) -> Server:
+        server = Server(self.path, self._dispatch)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        self.addCleanup(stop)
+        return server
+
+    def test_request(self):
+        self._start()
+        response = request(self.path, {'action': 'check', 'paths': ['a']})
+        self.assertEqual(
+            response,
+            {'code': 0, 'echo': {'action': 'check', 'paths': ['a']}},
+        )
+        self.assertEqual(self.path.stat().st_mode & 0o777, 0o600)
+
+    def test_dispatch_error(self):
+        self._start()
+        response = request(self.path, {'action': 'fail'})
+        self.assertEqual(response, {'code': -1, 'log': ['request failed']})
+        self.assertEqual(request(self.path, {})['code'], 0)
+
+    def test_already_serving(self):
+        self._start()
+        with self.assertRaises(FileExistsError):
+            Server(self.path, self._dispatch)
+
+    def test_stale_socket(self):
+        server = Server(self.path, self._dispatch)
+        server.server_close()
+        self.assertTrue(self.path.exists())
+
+        self._start()
+        self.assertEqual(request(self.path, {})['code'], 0)
@@ -0,0 +1,146 @@
+import io
+import pathlib
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from generator.sink import MemorySink, OverlaySink, Sink, TarSink
+
+
+class TestSink(unittest.TestCase):
+    def test_incomplete(self):
+        class ReadOnly(Sink):
+            def read(self, path):
+                return None
+
+        with self.assertRaises(TypeError):
+            ReadOnly()
+
+
+class TestMemorySink(unittest.TestCase):
+    def setUp(self):
+        self.root = pathlib.Path('/nonexistent/project')
+        self.sink = MemorySink({
+            self.root / 'buildscript.txt': 'NAME\n',
+            self.root / 'test' / 'unit' / 'a.js': '',
+        })
+
+    def test_read(self):
+        self.assertEqual(
+            self.sink.read(self.root / 'buildscript.txt'),
+            'NAME\n',
+        )
+        self.assertIsNone(self.sink.read(self.root / 'missing'))
+        self.assertFalse(self.root.exists())
+
+    def test_snapshot(self):
+        snapshot = self.sink.get_snapshot(self.root)
+        self.assertEqual(
+            snapshot.probe({
+                'cfg': 'buildscript.txt',
+                'unit': 'test/unit',
+                'acceptance': 'test/acceptance',
+            }),
+            {'cfg': True, 'unit': True, 'acceptance': False},
+        )
+        self.assertTrue(snapshot.is_dir('test'))
+        self.assertFalse(snapshot.is_dir('buildscript.txt'))
+
+    def test_transaction(self):
+        transaction = self.sink.begin(durability='none')
+        transaction.stage(self.root / 'new', 'NEW')
+        transaction.delete(self.root / 'test' / 'unit' / 'a.js')
+        self.assertEqual(len(transaction), 2)
+        self.assertIsNone(self.sink.read(self.root / 'new'))
+
+        transaction.commit()
+        self.assertEqual(self.sink.read(self.root / 'new'), 'NEW')
+        self.assertIsNone(self.sink.read(self.root / 'test' / 'unit' / 'a.js'))
+        self.assertEqual(
+            self.sink.list_directory(self.root / 'test' / 'unit'),
+            (set(), set()),
+        )
+
+    def test_rollback(self):
+        transaction = self.sink.begin(durability='none')
+        transaction.stage(self.root / 'new', 'NEW')
+        transaction.rollback()
+        transaction.commit()
+        self.assertIsNone(self.sink.read(self.root / 'new'))
+
+
+class TestOverlaySink(unittest.TestCase):
+    def setUp(self):
+        self.root = pathlib.Path(tempfile.mkdtemp())
+        self.project = self.root / 'project'
+        self.output = self.root / 'output'
+        self.project.mkdir()
+        (self.project / 'Makefile').write_text('OLD')
+        (self.project / 'orphan').write_text('ORPHAN')
+        self.sink = OverlaySink(directory=self.output, base=self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_write(self):
+        transaction = self.sink.begin(durability='none')
+        transaction.stage(self.project / 'Makefile', 'NEW')
+        transaction.stage(self.project / 'nested' / 'new', 'CREATED')
+        transaction.delete(self.project / 'orphan')
+        transaction.commit()
+
+        self.assertEqual((self.project / 'Makefile').read_text(), 'OLD')
+        self.assertEqual(
+            (self.output / 'project' / 'Makefile').read_text(),
+            'NEW',
+        )
+        self.assertEqual(self.sink.read(self.project / 'Makefile'), 'NEW')
+        self.assertEqual(
+            self.sink.read(self.project / 'nested' / 'new'),
+            'CREATED',
+        )
+
+        # hidden, but still in the checkout
+        self.assertIsNone(self.sink.read(self.project / 'orphan'))
+        self.assertTrue((self.project / 'orphan').exists())
+        self.assertEqual(
+            self.sink.list_directory(self.project),
+            ({'Makefile', 'nested'}, {'nested'}),
+        )
+
+
+class TestTarSink(unittest.TestCase):
+    def setUp(self):
+        self.root = pathlib.Path(tempfile.mkdtemp())
+        (self.root / 'Makefile').write_text('OLD')
+        (self.root / 'Makefile').chmod(0o600)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_stream(self):
+        file = io.BytesIO()
+        sink = TarSink(file=file, base=self.root.parent)
+        transaction = sink.begin(durability='none')
+        transaction.stage(self.root / 'Makefile', 'NEW')
+        transaction.stage(self.root / 'entrypoint.sh', 'RUN')
+        transaction.commit()
+        sink.close()
+
+        self.assertEqual((self.root / 'Makefile').read_text(), 'OLD')
+        file.seek(0)
+        with tarfile.open(fileobj=file) as archive:
+            members = {
+                member.name: member.mode
+                for member in archive.getmembers()
+            }
+            makefile = archive.extractfile(self.root.name + '/Makefile')
+            self.assertEqual(makefile.read(), b'NEW')
+        self.assertEqual(
+            members,
+            {
+                self.root.name + '/Makefile': 0o600,
+                self.root.name + '/entrypoint.sh': 0o755,
+            },
+        )
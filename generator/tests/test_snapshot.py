@@ -0,0 +1,118 @@
+import concurrent.futures
+import os
+import pathlib
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from generator.snapshot import Snapshot, SnapshotCache
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.root = pathlib.Path(tempfile.mkdtemp())
+        (self.root / 'test' / 'unit').mkdir(parents=True)
+        (self.root / 'test' / 'unit' / 'bootstrap.js').touch()
+        (self.root / 'app.js').touch()
+        (self.root / 'modules').mkdir()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_exists(self):
+        snapshot = Snapshot(self.root)
+        self.assertTrue(snapshot.exists('app.js'))
+        self.assertTrue(snapshot.exists('modules/'))
+        self.assertTrue(snapshot.exists('test/unit'))
+        self.assertTrue(snapshot.exists('test/unit/bootstrap.js'))
+        self.assertFalse(snapshot.exists('index.js'))
+        self.assertFalse(snapshot.exists('test/acceptance'))
+        self.assertFalse(snapshot.exists('test/acceptance/js/Init.js'))
+        self.assertFalse(snapshot.exists('app.js/nested'))
+
+    def test_is_dir(self):
+        snapshot = Snapshot(self.root)
+        self.assertTrue(snapshot.is_dir('test/unit'))
+        self.assertFalse(snapshot.is_dir('app.js'))
+        self.assertFalse(snapshot.is_dir('missing'))
+
+    def test_dangling_symlink(self):
+        os.symlink(str(self.root / 'missing'), str(self.root / 'link'))
+        self.assertFalse(Snapshot(self.root).exists('link'))
+
+    def test_scan_once(self):
+        snapshot = Snapshot(self.root)
+        with mock.patch('os.scandir', wraps=os.scandir) as scandir:
+            snapshot.probe({
+                'a': 'app.js',
+                'b': 'index.js',
+                'c': 'test/unit',
+                'd': 'test/unit/bootstrap.js',
+                'e': 'test/unit/other.js',
+                'f': 'test/acceptance/js/Init.js',
+            })
+            snapshot.exists('modules')
+        self.assertEqual(scandir.call_count, 3)
+
+    def test_prefetch(self):
+        paths = {
+            'a': 'app.js',
+            'b': 'test/unit/bootstrap.js',
+            'c': 'test/acceptance/js/Init.js',
+            'd': 'app.js/nested',
+            'e': 'modules/',
+        }
+        snapshot = Snapshot(self.root)
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            snapshot.prefetch(paths.values(), executor)
+        with mock.patch('os.scandir') as scandir:
+            actual = snapshot.probe(paths)
+        scandir.assert_not_called()
+        self.assertEqual(actual, Snapshot(self.root).probe(paths))
+
+    def test_discard(self):
+        snapshot = Snapshot(self.root)
+        self.assertTrue(snapshot.exists('app.js'))
+        snapshot.discard('app.js')
+        self.assertFalse(snapshot.exists('app.js'))
+
+
+class TestSnapshotCache(unittest.TestCase):
+    def setUp(self):
+        self.root = pathlib.Path(tempfile.mkdtemp())
+        (self.root / 'test').mkdir()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _touch_dir(self, path: pathlib.Path):
+        stat = os.stat(str(path))
+        os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    def test_reuse(self):
+        cache = SnapshotCache()
+        snapshot = cache.get(self.root)
+        self.assertFalse(snapshot.exists('test/unit'))
+        self.assertFalse(snapshot.exists('app.js'))
+        self.assertIs(cache.get(self.root), snapshot)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_invalidate(self):
+        cache = SnapshotCache()
+        snapshot = cache.get(self.root)
+        self.assertFalse(snapshot.exists('test/unit'))
+
+        (self.root / 'test' / 'unit').mkdir()
+        self._touch_dir(self.root / 'test')
+        fresh = cache.get(self.root)
+        self.assertIsNot(fresh, snapshot)
+        self.assertTrue(fresh.exists('test/unit'))
+
+    def test_invalidate_created_dir(self):
+        cache = SnapshotCache()
+        self.assertFalse(cache.get(self.root).exists('src/app.js'))
+
+        (self.root / 'src').mkdir()
+        self.assertTrue(cache.get(self.root).exists('src/'))
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
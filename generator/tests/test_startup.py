@@ -0,0 +1,82 @@
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from generator.project import Project, REPO
+
+HEAVY_MODULES = (
+    'jinja2',
+    'concurrent.futures',
+    'difflib',
+    'generator.templates',
+    'generator.project.es',
+    'generator.project.runner',
+)
+
+
+def get_imported_modules(*args: str) -> dict:
+    """Cumulative import time in microseconds per module of the cli"""
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'generator'] + list(args),
+        cwd=str(REPO),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    modules = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+class TestStartup(unittest.TestCase):
+    def assertLight(self, *args: str):
+        modules = get_imported_modules(*args)
+        self.assertIn('generator.project', modules)
+        for name in HEAVY_MODULES:
+            self.assertNotIn(name, modules)
+
+    def test_help(self):
+        self.assertLight('--help')
+
+    def test_version(self):
+        self.assertLight('--version')
+
+    def test_list_projects(self):
+        path = pathlib.Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, str(path))
+        Project.get_cfg_path(path).write_text('NAME\n--language=es\n')
+        self.assertLight('--list-projects', str(path))
+
+    def test_list_projects_closed_pipe(self):
+        path = pathlib.Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, str(path))
+        Project.get_cfg_path(path).write_text('NAME\n--language=es\n')
+
+        # the reader is gone before the first write, like `| head -0`
+        read, write = os.pipe()
+        os.close(read)
+        try:
+            process = subprocess.run(
+                [
+                    sys.executable, '-m', 'generator',
+                    '--list-projects', str(path),
+                ],
+                cwd=str(REPO),
+                stdout=write,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+            )
+        finally:
+            os.close(write)
+        self.assertEqual(process.returncode, 0)
+        self.assertNotIn('Traceback', process.stderr)
@@ -0,0 +1,76 @@
+import pathlib
+import random
+import re
+import shutil
+import tempfile
+import unittest
+
+from generator import stream
+
+
+def reference(raw: str) -> str:
+    return re.sub(r'\n{3,}', '\n\n', raw).strip('\n') + '\n'
+
+
+class TestNormalize(unittest.TestCase):
+    def assertNormalized(self, chunks):
+        self.assertEqual(
+            ''.join(stream.normalize(chunks)),
+            reference(''.join(chunks)),
+        )
+
+    def test_examples(self):
+        self.assertNormalized([])
+        self.assertNormalized([''])
+        self.assertNormalized(['\n\n\n'])
+        self.assertNormalized(['A'])
+        self.assertNormalized(['\n\nA\n\n\n\nB\n\n\n'])
+        self.assertNormalized(['A\n', '\n', '\n', 'B'])
+        self.assertNormalized(['A\n\n', '', '\nB\n', '\n'])
+
+    def test_random(self):
+        rng = random.Random(42)
+        for _ in range(500):
+            chunks = [
+                ''.join(
+                    rng.choice('ab\n\n\n')
+                    for _ in range(rng.randint(0, 8))
+                )
+                for _ in range(rng.randint(0, 6))
+            ]
+            self.assertNormalized(chunks)
+
+
+class TestCompare(unittest.TestCase):
+    def setUp(self):
+        self.root = pathlib.Path(tempfile.mkdtemp())
+        self.path = self.root / 'file'
+        self.path.write_text('ONE\nTWO\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_equal(self):
+        actual = stream.compare(['ONE\n', 'TWO\n'], self.path)
+        self.assertEqual(actual, (True, 'ONE\nTWO\n'))
+
+    def test_mismatch(self):
+        actual = stream.compare(['ONE\n', 'THREE\n', 'FOUR\n'], self.path)
+        self.assertEqual(actual, (False, 'ONE\nTHREE\nFOUR\n'))
+
+    def test_prefix(self):
+        self.assertEqual(
+            stream.compare(['ONE\n'], self.path),
+            (False, 'ONE\n'),
+        )
+        self.assertEqual(
+            stream.compare(['ONE\nTWO\n', 'THREE\n'], self.path),
+            (False, 'ONE\nTWO\nTHREE\n'),
+        )
+
+    def test_missing(self):
+        self.assertEqual(
+            stream.compare(['ONE\n'], self.root / 'missing'),
+            (False, 'ONE\n'),
+        )
+        self.assertEqual(stream.compare(['ONE\n'], None), (False, 'ONE\n'))
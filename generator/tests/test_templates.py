@@ -0,0 +1,237 @@
+import os
+import pathlib
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import jinja2
+
+from generator import templates
+
+
+class TestBytecodeCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_path = pathlib.Path(tempfile.mkdtemp())
+        self.templates_path = pathlib.Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_path)
+        shutil.rmtree(self.templates_path)
+
+    def _get_env(self, cache: templates.BytecodeCache):
+        return jinja2.Environment(
+            loader=jinja2.FileSystemLoader(
+                searchpath=[str(self.templates_path)],
+            ),
+            bytecode_cache=cache,
+        )
+
+    def test_persist(self):
+        (self.templates_path / 'dummy.j2').write_text('{{ var }}')
+        cache = templates.BytecodeCache(directory=self.cache_path)
+
+        self._get_env(cache).get_template('dummy.j2')
+        self.assertEqual(len(list(self.cache_path.iterdir())), 1)
+
+        bucket = cache.get_bucket(
+            self._get_env(cache),
+            'dummy.j2',
+            str(self.templates_path / 'dummy.j2'),
+            '{{ var }}',
+        )
+        self.assertIsNotNone(bucket.code)
+
+    def test_key_by_source(self):
+        source = self.templates_path / 'dummy.j2'
+        cache = templates.BytecodeCache(directory=self.cache_path)
+
+        source.write_text('ONE')
+        self._get_env(cache).get_template('dummy.j2')
+        source.write_text('TWO')
+        template = self._get_env(cache).get_template('dummy.j2')
+
+        self.assertEqual(template.render(), 'TWO')
+        self.assertEqual(len(list(self.cache_path.iterdir())), 2)
+
+    def test_evict(self):
+        cache = templates.BytecodeCache(directory=self.cache_path)
+        env = self._get_env(cache)
+        for i in range(4):
+            (self.templates_path / ('%d.j2' % i)).write_text(str(i))
+            env.get_template('%d.j2' % i)
+
+        entries = list(self.cache_path.iterdir())
+        self.assertEqual(len(entries), 4)
+
+        cache.max_size = sum(entry.stat().st_size for entry in entries[:2])
+        self.assertEqual(cache.evict(), 2)
+        self.assertEqual(len(list(self.cache_path.iterdir())), 2)
+
+
+class TestTemplateGraph(unittest.TestCase):
+    def setUp(self):
+        self.templates_path = pathlib.Path(tempfile.mkdtemp())
+        self.lang = self.templates_path / '_' / 'lang'
+        self.name = self.templates_path / '_' / 'name'
+        self.search_path = [
+            self.name,
+            self.lang,
+            self.templates_path,
+        ]
+
+        self._write(
+            self.templates_path / 'macros' / 'header.j2',
+            '{% macro header() %}HEADER{% endmacro %}',
+        )
+        self._write(
+            self.lang / 'Makefile.j2',
+            "{% from 'macros/header.j2' import header %}{{ header() }}",
+        )
+        self._write(
+            self.name / 'Makefile.j2',
+            "{% extends '_/lang/Makefile.j2' %}",
+        )
+        self._write(self.lang / 'plain.j2', 'PLAIN')
+
+    def tearDown(self):
+        shutil.rmtree(self.templates_path)
+
+    @staticmethod
+    def _write(path: pathlib.Path, content: str):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+    def test_resolve_preference(self):
+        graph = templates.TemplateGraph(self.search_path)
+        self.assertEqual(
+            graph.resolve('Makefile.j2'),
+            (0, str(self.name / 'Makefile.j2')),
+        )
+        self.assertEqual(
+            graph.resolve('plain.j2'),
+            (1, str(self.lang / 'plain.j2')),
+        )
+        self.assertIsNone(graph.resolve('missing.j2'))
+
+    def test_sources(self):
+        graph = templates.TemplateGraph(self.search_path)
+        self.assertEqual(
+            graph.get_sources('Makefile.j2'),
+            sorted([
+                str(self.name / 'Makefile.j2'),
+                str(self.lang / 'Makefile.j2'),
+                str(self.templates_path / 'macros' / 'header.j2'),
+            ]),
+        )
+        self.assertEqual(
+            graph.get_sources('plain.j2'),
+            [str(self.lang / 'plain.j2')],
+        )
+
+    def test_dynamic_reference(self):
+        self._write(self.lang / 'dynamic.j2', '{% include some_var %}')
+        graph = templates.TemplateGraph(self.search_path)
+        self.assertIsNone(graph.get_sources('dynamic.j2'))
+
+    def test_names(self):
+        graph = templates.TemplateGraph(self.search_path)
+        self.assertEqual(
+            graph.get_names(self.templates_path / 'macros' / 'header.j2'),
+            {'macros/header.j2'},
+        )
+        # shadowed by the project specific template, but extended by it
+        self.assertEqual(
+            graph.get_names(self.lang / 'Makefile.j2'),
+            {'_/lang/Makefile.j2'},
+        )
+        # a new project specific template shadows the language one
+        self.assertEqual(
+            graph.get_names(self.name / 'plain.j2'),
+            {'plain.j2', '_/name/plain.j2'},
+        )
+
+
+class TestTemplateIndex(unittest.TestCase):
+    def setUp(self):
+        self.templates_path = pathlib.Path(tempfile.mkdtemp())
+        (self.templates_path / 'macros').mkdir()
+        (self.templates_path / 'macros' / 'macro.j2').touch()
+        (self.templates_path / 'one').mkdir()
+        (self.templates_path / 'one' / 'nested.j2').touch()
+        (self.templates_path / 'top.j2').touch()
+        templates.clear_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.templates_path)
+        templates.clear_cache()
+
+    def test_files(self):
+        actual = templates.get_template_files(
+            directory=self.templates_path,
+            skip=['macros'],
+        )
+        self.assertEqual(actual, ('one/nested', 'top'))
+
+    def test_missing_directory(self):
+        actual = templates.get_template_files(
+            directory=self.templates_path / 'missing',
+        )
+        self.assertEqual(actual, ())
+
+        (self.templates_path / 'missing').mkdir()
+        (self.templates_path / 'missing' / 'new.j2').touch()
+        actual = templates.get_template_files(
+            directory=self.templates_path / 'missing',
+        )
+        self.assertEqual(actual, ('new',))
+
+    def test_missing_directory_not_cached(self):
+        for index in range(3):
+            templates.get_template_files(
+                directory=self.templates_path / ('missing-%d' % index),
+            )
+        self.assertEqual(templates._indexes, {})
+
+    @mock.patch('os.scandir', wraps=os.scandir)
+    def test_reuse(self, scandir):
+        templates.get_template_files(self.templates_path, skip=['macros'])
+        self.assertEqual(scandir.call_count, 2)
+
+        templates.get_template_files(self.templates_path, skip=['macros'])
+        self.assertEqual(scandir.call_count, 2)
+
+    def test_invalidate_nested(self):
+        templates.get_template_files(self.templates_path, skip=['macros'])
+        nested = self.templates_path / 'one'
+        (nested / 'other.j2').touch()
+        os.utime(str(nested), ns=(0, 0))
+
+        actual = templates.get_template_files(
+            directory=self.templates_path,
+            skip=['macros'],
+        )
+        self.assertEqual(actual, ('one/nested', 'one/other', 'top'))
+
+
+class TestRenderCache(unittest.TestCase):
+    def test_evict_least_recently_used(self):
+        cache = templates.RenderCache(max_entries=2)
+        cache.set(('a',), 'A')
+        cache.set(('b',), 'B')
+        self.assertEqual(cache.get(('a',)), 'A')
+        cache.set(('c',), 'C')
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(('b',)))
+        self.assertEqual(cache.get(('a',)), 'A')
+        self.assertEqual(cache.get(('c',)), 'C')
+
+    def test_survive_invalidate_graphs(self):
+        cache = templates.RenderCache()
+        cache.set(('a',), 'A')
+        templates.set_render_cache(cache)
+        self.addCleanup(templates.set_render_cache, None)
+
+        templates.invalidate_graphs()
+        self.assertEqual(cache.get(('a',)), 'A')
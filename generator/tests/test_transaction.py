@@ -0,0 +1,148 @@
+import concurrent.futures
+import os
+import pathlib
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from generator.transaction import (
+    DURABILITY_FILE,
+    DURABILITY_PROJECT,
+    Transaction,
+    write_atomic,
+)
+
+
+class TestTransaction(unittest.TestCase):
+    def setUp(self):
+        self.root = pathlib.Path(tempfile.mkdtemp())
+        self.target = self.root / 'Makefile'
+        self.target.write_text('OLD')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_commit(self):
+        transaction = Transaction()
+        self.assertEqual(transaction.stage(self.target, 'NEW'), 3)
+        transaction.stage(self.root / 'new.txt', 'CREATED')
+        transaction.delete(self.root / 'Makefile.orig')
+        self.assertEqual(self.target.read_text(), 'OLD')
+
+        transaction.commit()
+        self.assertEqual(self.target.read_text(), 'NEW')
+        self.assertEqual((self.root / 'new.txt').read_text(), 'CREATED')
+        self.assertEqual(
+            sorted(path.name for path in self.root.iterdir()),
+            ['Makefile', 'new.txt'],
+        )
+
+    def test_background(self):
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            transaction = Transaction(executor=executor)
+            self.assertEqual(transaction.stage(self.target, 'FIRST'), 5)
+            transaction.stage(self.target, 'NEW')
+            transaction.stage(self.root / 'new.txt', 'CREATED')
+            self.assertEqual(len(transaction), 2)
+            self.assertEqual(self.target.read_text(), 'OLD')
+
+            transaction.commit()
+        self.assertEqual(self.target.read_text(), 'NEW')
+        self.assertEqual((self.root / 'new.txt').read_text(), 'CREATED')
+        self.assertEqual(
+            sorted(path.name for path in self.root.iterdir()),
+            ['Makefile', 'new.txt'],
+        )
+
+    def test_background_error(self):
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            transaction = Transaction(executor=executor)
+            transaction.stage(self.target, 'NEW')
+            # the parent of the new file is a file
+            transaction.stage(self.target / 'new.txt', 'CREATED')
+            with self.assertRaises(FileExistsError):
+                transaction.commit()
+            transaction.rollback()
+        self.assertEqual(self.target.read_text(), 'OLD')
+        self.assertEqual(
+            [path.name for path in self.root.iterdir()],
+            ['Makefile'],
+        )
+
+    def test_rollback(self):
+        (self.root / 'orphan').touch()
+        transaction = Transaction()
+        transaction.stage(self.target, 'NEW')
+        transaction.delete(self.root / 'orphan')
+        transaction.rollback()
+        transaction.commit()
+
+        self.assertEqual(self.target.read_text(), 'OLD')
+        self.assertEqual(
+            sorted(path.name for path in self.root.iterdir()),
+            ['Makefile', 'orphan'],
+        )
+
+    def test_on_commit(self):
+        transaction = Transaction()
+        callback = mock.Mock()
+        transaction.on_commit(callback, 'ARG')
+        callback.assert_not_called()
+        transaction.commit()
+        callback.assert_called_once_with('ARG')
+
+    def test_permissions(self):
+        self.target.chmod(0o640)
+        write_atomic(self.target, 'NEW')
+        self.assertEqual(self.target.stat().st_mode & 0o777, 0o640)
+
+        script = self.root / 'install_deps.sh'
+        write_atomic(script, 'NEW')
+        self.assertEqual(script.stat().st_mode & 0o777, 0o755)
+
+    @mock.patch('generator.transaction._get_syncfs')
+    @mock.patch('os.fsync', wraps=os.fsync)
+    def test_durability_project(self, fsync, get_syncfs):
+        syncfs = get_syncfs.return_value
+        syncfs.return_value = 0
+        transaction = Transaction(durability=DURABILITY_PROJECT)
+        transaction.stage(self.target, 'ONE')
+        transaction.stage(self.root / 'other', 'TWO')
+        transaction.commit()
+        # once before and once after renaming
+        self.assertEqual(syncfs.call_count, 2)
+        self.assertEqual(fsync.call_count, 0)
+        self.assertEqual(self.target.read_text(), 'ONE')
+
+    @mock.patch('generator.transaction._get_syncfs', return_value=None)
+    @mock.patch('os.fsync', wraps=os.fsync)
+    def test_durability_project_fallback(self, fsync, get_syncfs):
+        transaction = Transaction(durability=DURABILITY_PROJECT)
+        transaction.stage(self.target, 'ONE')
+        transaction.stage(self.root / 'other', 'TWO')
+        transaction.commit()
+        # two files plus their directory
+        self.assertEqual(fsync.call_count, 3)
+
+    @mock.patch('generator.transaction._get_syncfs')
+    @mock.patch('os.fsync', wraps=os.fsync)
+    def test_durability_file(self, fsync, get_syncfs):
+        transaction = Transaction(durability=DURABILITY_FILE)
+        transaction.stage(self.target, 'ONE')
+        transaction.stage(self.root / 'other', 'TWO')
+        transaction.commit()
+        get_syncfs.assert_not_called()
+        # two files plus their directory
+        self.assertEqual(fsync.call_count, 3)
+
+    def test_symlink(self):
+        link = self.root / 'link'
+        link.symlink_to(self.target.name)
+        write_atomic(link, 'NEW')
+        self.assertTrue(link.is_symlink())
+        self.assertEqual(self.target.read_text(), 'NEW')
+
+    def test_invalid_durability(self):
+        with self.assertRaises(ValueError):
+            Transaction(durability='always')
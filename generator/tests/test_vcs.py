@@ -0,0 +1,132 @@
+import pathlib
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from generator.__main__ import get_args, main
+from generator.project import Project
+from generator.vcs import (
+    get_changed_templates,
+    get_changes,
+    has_changed_inputs,
+)
+
+
+def git(path: pathlib.Path, *args: str):
+    subprocess.run(
+        [
+            'git',
+            '-c', 'user.name=test',
+            '-c', 'user.email=test@example.com',
+            '-c', 'commit.gpgsign=false',
+        ] + list(args),
+        cwd=str(path),
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+
+
+def commit(path: pathlib.Path):
+    git(path, 'add', '--all')
+    git(path, 'commit', '--quiet', '--allow-empty', '--message', 'commit')
+
+
+@unittest.skipIf(shutil.which('git') is None, 'git is not installed')
+class TestVcs(unittest.TestCase):
+    def setUp(self):
+        self.root = pathlib.Path(tempfile.mkdtemp())
+        self.project_path = self.root / 'project'
+        self.project_path.mkdir()
+        git(self.project_path, 'init', '--quiet')
+        self.cfg = Project.get_cfg_path(self.project_path)
+        self.cfg.write_text('NAME\n--language=runner\n')
+        (self.project_path / 'test' / 'unit').mkdir(parents=True)
+        (self.project_path / 'test' / 'unit' / 'a.js').touch()
+        (self.project_path / 'app.js').touch()
+        commit(self.project_path)
+        self.project = Project.from_path(self.project_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_get_changes(self):
+        self.assertEqual(get_changes(self.project_path, 'HEAD'), {})
+
+        (self.project_path / 'app.js').write_text('changed')
+        (self.project_path / 'test' / 'unit' / 'a.js').unlink()
+        (self.project_path / 'new file.js').touch()
+        self.assertEqual(
+            get_changes(self.project_path, 'HEAD'),
+            {'app.js': 'M', 'test/unit/a.js': 'D', 'new file.js': 'A'},
+        )
+        self.assertEqual(
+            get_changes(self.project_path / 'test', 'HEAD'),
+            {'unit/a.js': 'D'},
+        )
+
+    def test_get_changes_unknown(self):
+        self.assertIsNone(get_changes(self.project_path, 'missing'))
+        self.assertIsNone(get_changes(self.root, 'HEAD'))
+
+    def test_has_changed_inputs(self):
+        self.assertFalse(has_changed_inputs(
+            self.project, self.project_path, 'HEAD',
+        ))
+        self.assertTrue(has_changed_inputs(
+            self.project, self.project_path, 'missing',
+        ))
+
+        (self.project_path / 'test' / 'unit' / 'a.js').write_text('edit')
+        (self.project_path / 'other.js').touch()
+        self.assertFalse(has_changed_inputs(
+            self.project, self.project_path, 'HEAD',
+        ))
+
+        (self.project_path / 'install_deps.sh').touch()
+        self.assertTrue(has_changed_inputs(
+            self.project, self.project_path, 'HEAD',
+        ))
+        commit(self.project_path)
+
+        self.cfg.write_text('NAME\n--language=runner\n--node-version=1\n')
+        self.assertTrue(has_changed_inputs(
+            self.project, self.project_path, 'HEAD',
+        ))
+
+    def test_get_changed_templates(self):
+        repo = self.root / 'repo'
+        templates = repo / 'templates'
+        (templates / 'es').mkdir(parents=True)
+        (repo / 'generator' / 'tests').mkdir(parents=True)
+        (templates / 'es' / 'Makefile.j2').touch()
+        (templates / 'Dockerfile.j2').touch()
+        (repo / 'generator' / 'tests' / 'test_a.py').touch()
+        (repo / 'generator' / 'a.py').touch()
+        git(repo, 'init', '--quiet')
+        commit(repo)
+
+        self.assertEqual(get_changed_templates('HEAD', repo, templates), [])
+
+        (templates / 'es' / 'Makefile.j2').write_text('changed')
+        (repo / 'generator' / 'tests' / 'test_a.py').write_text('changed')
+        self.assertEqual(
+            get_changed_templates('HEAD', repo, templates),
+            [(templates / 'es' / 'Makefile.j2').resolve()],
+        )
+
+        (repo / 'generator' / 'a.py').write_text('changed')
+        self.assertIsNone(get_changed_templates('HEAD', repo, templates))
+        self.assertIsNone(get_changed_templates('missing', repo, templates))
+
+    @mock.patch('generator.vcs.get_changed_templates', return_value=[])
+    @mock.patch.object(Project, 'process', return_value=True)
+    def test_main_since(self, process, changed_templates):
+        args = get_args(['--since', 'HEAD', str(self.project_path)])
+        self.assertEqual(main(args), 0)
+        process.assert_not_called()
+
+        (self.project_path / 'install_deps.sh').touch()
+        self.assertEqual(main(args), 0)
+        process.assert_called_once_with(outputs=None)
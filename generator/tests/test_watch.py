@@ -0,0 +1,56 @@
+import os
+import pathlib
+import shutil
+import tempfile
+import unittest
+
+from generator.project import Project
+from generator.watch import Watcher
+
+
+class TestWatcher(unittest.TestCase):
+    def setUp(self):
+        self.project_path = pathlib.Path(tempfile.mkdtemp())
+        self.templates_path = pathlib.Path(tempfile.mkdtemp())
+        (self.templates_path / 'dummy.j2').write_text('')
+        Project.get_cfg_path(self.project_path).write_text(
+            'NAME\n--language=runner\n'
+        )
+        self.watcher = Watcher(
+            paths=[self.project_path],
+            templates=self.templates_path,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.project_path)
+        shutil.rmtree(self.templates_path)
+
+    def test_no_changes(self):
+        self.assertEqual(self.watcher.poll(), ([], []))
+
+    def test_template_changes(self):
+        source = self.templates_path / 'dummy.j2'
+        source.write_text('CHANGED')
+        new = self.templates_path / 'nested' / 'new.j2'
+        new.parent.mkdir()
+        new.write_text('')
+
+        self.assertEqual(self.watcher.poll(), ([source, new], []))
+        self.assertEqual(self.watcher.poll(), ([], []))
+
+        source.unlink()
+        self.assertEqual(self.watcher.poll(), ([source], []))
+
+    def test_marker_changes(self):
+        (self.project_path / 'install_deps.sh').touch()
+        self.assertEqual(self.watcher.poll(), ([], [self.project_path]))
+
+        # content changes of marker files are irrelevant
+        (self.project_path / 'install_deps.sh').write_text('CHANGED')
+        self.assertEqual(self.watcher.poll(), ([], []))
+
+    def test_cfg_changes(self):
+        cfg = Project.get_cfg_path(self.project_path)
+        cfg.write_text('NAME\n--language=runner\n--node-version=1\n')
+        os.utime(str(cfg), ns=(0, 0))
+        self.assertEqual(self.watcher.poll(), ([], [self.project_path]))
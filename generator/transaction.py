@@ -0,0 +1,258 @@
+import os
+import pathlib
+import typing
+
+if typing.TYPE_CHECKING:
+    import concurrent.futures
+
+DURABILITY_NONE = 'none'
+DURABILITY_PROJECT = 'project'
+DURABILITY_FILE = 'file'
+DURABILITY_LEVELS = (
+    DURABILITY_NONE,
+    DURABILITY_PROJECT,
+    DURABILITY_FILE,
+)
+
+Staged = typing.List[typing.Tuple[pathlib.Path, pathlib.Path]]
+Pending = typing.Dict[pathlib.Path, 'concurrent.futures.Future']
+
+_syncfs = None  # type: typing.Optional[typing.Callable[[int], int]]
+
+
+def _get_tmp_path(path: pathlib.Path) -> pathlib.Path:
+    # same directory, os.replace does not work across file systems
+    return path.with_name('.{}.{}.tmp'.format(path.name, os.getpid()))
+
+
+def _fsync_path(path: pathlib.Path):
+    fd = os.open(str(path), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _get_syncfs() -> typing.Optional[typing.Callable[[int], int]]:
+    """syncfs(2) of the libc, None where it does not exist"""
+    global _syncfs
+    if _syncfs is None:
+        import ctypes
+
+        try:
+            _syncfs = ctypes.CDLL(None, use_errno=True).syncfs
+        except (AttributeError, OSError):
+            _syncfs = False
+    return _syncfs or None
+
+
+def _sync_file_systems(directories: typing.Iterable[pathlib.Path]) -> bool:
+    """Flush the file systems holding the directories, one call each
+
+    Returns False in case the platform cannot flush a single file system.
+    """
+    syncfs = _get_syncfs()
+    if syncfs is None:
+        return False
+
+    devices = {}
+    for directory in directories:
+        devices.setdefault(os.stat(str(directory)).st_dev, directory)
+    for directory in devices.values():
+        fd = os.open(str(directory), os.O_RDONLY)
+        try:
+            if syncfs(fd) != 0:
+                return False
+        finally:
+            os.close(fd)
+    return True
+
+
+def _stage(
+    path: pathlib.Path,
+    content: str,
+    fsync: bool,
+) -> typing.Tuple[pathlib.Path, int]:
+    tmp = _get_tmp_path(path)
+    data = content.encode()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(str(tmp), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+            if fsync:
+                file.flush()
+                os.fsync(file.fileno())
+
+        if path.suffix == '.sh':
+            tmp.chmod(0o755)
+        else:
+            try:
+                mode = path.stat().st_mode
+            except FileNotFoundError:
+                pass
+            else:
+                # keep the permissions of the replaced file
+                tmp.chmod(mode & 0o7777)
+    except:
+        tmp.unlink()
+        raise
+    return tmp, len(content)
+
+
+def write_atomic(
+    path: pathlib.Path,
+    content: str,
+    durability: str = DURABILITY_NONE,
+) -> int:
+    """Write a single file via a temporary file and an atomic rename"""
+    transaction = Transaction(durability=durability)
+    try:
+        written = transaction.stage(path, content)
+        transaction.commit()
+    finally:
+        transaction.rollback()
+    return written
+
+
+class Transaction:
+    """Batch the file changes of a project
+
+    Writes are staged into temporary files next to their target. Nothing
+     touches the targets until commit, which renames the staged files into
+     place and deletes the queued files. An error before commit leaves the
+     project as it was.
+
+    The durability controls the syncing of the staged data:
+     - none: leave it to the OS
+     - project: flush the file system of the project once before renaming
+       the staged files and once after, via syncfs; where that is not
+       available, fsync the staged files and then their directories
+     - file: fsync every file and the directories holding the renames
+
+    With an executor the staging happens in the background, commit waits
+     for it.
+    """
+
+    def __init__(
+        self,
+        durability: str = DURABILITY_NONE,
+        executor: typing.Optional['concurrent.futures.Executor'] = None,
+    ):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError('unknown durability {!r}'.format(durability))
+
+        self._durability = durability
+        self._executor = executor
+        self._pending = {}  # type: Pending
+        self._staged = []  # type: Staged
+        self._deleted = []  # type: typing.List[pathlib.Path]
+        self._callbacks = []  # type: typing.List[tuple]
+
+    def __len__(self):
+        return len(self._pending) + len(self._staged) + len(self._deleted)
+
+    def _add(
+        self,
+        tmp: pathlib.Path,
+        path: pathlib.Path,
+    ):
+        if (tmp, path) not in self._staged:
+            self._staged.append((tmp, path))
+
+    def stage(
+        self,
+        path: pathlib.Path,
+        content: str,
+    ) -> int:
+        if path.is_symlink():
+            # write through the link, like an in place write does
+            path = path.resolve()
+        fsync = self._durability == DURABILITY_FILE
+        if self._executor is None:
+            tmp, written = _stage(path=path, content=content, fsync=fsync)
+            self._add(tmp, path)
+            return written
+
+        previous = self._pending.pop(path, None)
+        if previous is not None:
+            # the same tmp file, keep the writes in order
+            previous.result()
+        self._pending[path] = self._executor.submit(
+            _stage,
+            path=path,
+            content=content,
+            fsync=fsync,
+        )
+        return len(content)
+
+    def _wait(self):
+        """Collect all the background writes, then raise the first error"""
+        pending, self._pending = self._pending, {}
+        error = None
+        for path, future in pending.items():
+            try:
+                tmp, _ = future.result()
+            except Exception as err:
+                error = error or err
+                continue
+            self._add(tmp, path)
+        if error is not None:
+            raise error
+
+    def delete(self, path: pathlib.Path):
+        self._deleted.append(path)
+
+    def on_commit(self, callback: typing.Callable, *args):
+        self._callbacks.append((callback, args))
+
+    def commit(self):
+        self._wait()
+        batched = False
+        if self._staged and self._durability == DURABILITY_PROJECT:
+            batched = _sync_file_systems(
+                {tmp.parent for tmp, _ in self._staged}
+            )
+            if not batched:
+                for tmp, _ in self._staged:
+                    _fsync_path(tmp)
+
+        directories = set()
+        for tmp, path in self._staged:
+            os.replace(str(tmp), str(path))
+            directories.add(path.parent)
+        self._staged = []
+
+        for path in self._deleted:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            directories.add(path.parent)
+        self._deleted = []
+
+        # make the renames durable
+        if batched:
+            _sync_file_systems(directories)
+        elif self._durability != DURABILITY_NONE:
+            for directory in sorted(directories):
+                _fsync_path(directory)
+
+        callbacks, self._callbacks = self._callbacks, []
+        for callback, args in callbacks:
+            callback(*args)
+
+    def rollback(self):
+        try:
+            self._wait()
+        except Exception:
+            # the failed writes cleaned up after themselves
+            pass
+        for tmp, _ in self._staged:
+            try:
+                tmp.unlink()
+            except FileNotFoundError:
+                pass
+        self._staged = []
+        self._deleted = []
+        self._callbacks = []
@@ -0,0 +1,118 @@
+import logging
+import pathlib
+import subprocess
+import typing
+
+from generator.project import (
+    Project,
+    REPO,
+    TEMPLATES,
+)
+
+Changes = typing.Dict[str, str]
+
+# changes in here alter the output of any template
+GENERATOR_SOURCES = (
+    'generator/',
+    'requirements.txt',
+)
+GENERATOR_TESTS = 'generator/tests/'
+
+# the has_* flags probe for presence only
+PRESENCE_STATUS = frozenset('AD')
+
+logger = logging.getLogger(__name__)
+
+
+def _git(
+    path: pathlib.Path,
+    *args: str
+) -> typing.List[str]:
+    process = subprocess.run(
+        ['git'] + list(args),
+        cwd=str(path),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    )
+    return process.stdout.decode().split('\0')[:-1]
+
+
+def get_changes(
+    path: pathlib.Path,
+    ref: str,
+) -> typing.Optional[Changes]:
+    """Files below path, relative to it, and their status since ref
+
+    The working tree counts, untracked files are added ones. None outside of
+     a git work tree or for an unknown ref.
+    """
+    try:
+        diff = _git(
+            path,
+            'diff', '--name-status', '--no-renames', '--relative', '-z',
+            ref, '--', '.',
+        )
+        untracked = _git(
+            path,
+            'ls-files', '--others', '--exclude-standard', '-z', '--', '.',
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    changes = dict(zip(diff[1::2], (status[0] for status in diff[0::2])))
+    changes.update((name, 'A') for name in untracked)
+    return changes
+
+
+def get_changed_templates(
+    ref: str,
+    repo: pathlib.Path = REPO,
+    templates: pathlib.Path = TEMPLATES,
+) -> typing.Optional[typing.List[pathlib.Path]]:
+    """Templates changed since ref, None in case everything is affected"""
+    changes = get_changes(repo, ref)
+    if changes is None:
+        logger.info('cannot diff the generator against %s', ref)
+        return None
+
+    prefix = templates.relative_to(repo).as_posix() + '/'
+    changed = []
+    for name in sorted(changes):
+        if name.startswith(prefix):
+            changed.append((repo / name).resolve())
+        elif (
+            name.startswith(GENERATOR_SOURCES)
+            and not name.startswith(GENERATOR_TESTS)
+        ):
+            logger.info('the generator changed since %s: %s', ref, name)
+            return None
+    return changed
+
+
+def has_changed_inputs(
+    project: Project,
+    path: pathlib.Path,
+    ref: str,
+) -> bool:
+    """Did the config or the presence of a has_* file change since ref?"""
+    changes = get_changes(path, ref)
+    if changes is None:
+        # not tracked or the ref is unknown, assume the worst
+        return True
+
+    cfg = Project.get_cfg_path(path).relative_to(path).as_posix()
+    if cfg in changes:
+        return True
+
+    markers = [
+        marker.rstrip('/')
+        for marker in project._get_possible_project_files().values()
+    ]
+    for name, status in changes.items():
+        if status not in PRESENCE_STATUS:
+            continue
+        for marker in markers:
+            if name == marker or name.startswith(marker + '/'):
+                return True
+    return False
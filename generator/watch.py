@@ -0,0 +1,147 @@
+import logging
+import os
+import pathlib
+import time
+import typing
+
+from generator import templates as template_cache
+from generator.project import (
+    Project,
+    InvalidConfig,
+    TEMPLATES,
+)
+from generator.snapshot import Snapshot
+
+Signature = typing.Optional[typing.Tuple[int, int]]
+OnChange = typing.Callable[
+    [pathlib.Path, typing.Optional[typing.List[pathlib.Path]]],
+    typing.Any,
+]
+
+logger = logging.getLogger(__name__)
+
+
+def _get_signature(path: str) -> Signature:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _scan_tree(root: str) -> typing.Dict[str, Signature]:
+    files = {}
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        try:
+            it = os.scandir(directory)
+        except FileNotFoundError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        pending.append(entry.path)
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+                except FileNotFoundError:
+                    continue
+    return files
+
+
+class Watcher:
+    """Polls the templates and the inputs of projects for changes
+
+    The inputs of a project are its buildscript.txt and the presence of the
+     files behind the has_* flags. Polling keeps this portable, a poll costs
+     one scandir per template directory plus a snapshot per project.
+    """
+
+    def __init__(
+        self,
+        paths: typing.Iterable[pathlib.Path],
+        templates: pathlib.Path = TEMPLATES,
+    ):
+        self._templates = str(templates)
+        self._template_files = _scan_tree(self._templates)
+        self._markers = {}  # type: typing.Dict[pathlib.Path, dict]
+        self._projects = {
+            path: self._get_project_state(path)
+            for path in paths
+        }
+
+    def _get_markers(
+        self,
+        path: pathlib.Path,
+        cfg: Signature,
+    ) -> typing.Dict[str, str]:
+        # the marker files depend on the config, e.g. the src_dir
+        cached = self._markers.get(path)
+        if cached is not None and cached['cfg'] == cfg:
+            return cached['files']
+
+        try:
+            project = Project.from_path(path)
+        except (InvalidConfig, FileNotFoundError):
+            files = {}
+        else:
+            files = project._get_possible_project_files()
+        self._markers[path] = {'cfg': cfg, 'files': files}
+        return files
+
+    def _get_project_state(self, path: pathlib.Path) -> tuple:
+        cfg = _get_signature(str(Project.get_cfg_path(path)))
+        markers = Snapshot(path).probe(self._get_markers(path, cfg))
+        return (cfg,) + tuple(sorted(markers.items()))
+
+    def poll(
+        self,
+    ) -> typing.Tuple[typing.List[pathlib.Path], typing.List[pathlib.Path]]:
+        """Returns the changed template files and the changed projects"""
+        template_files = _scan_tree(self._templates)
+        changed_templates = sorted(
+            pathlib.Path(path)
+            for path in set(template_files).union(self._template_files)
+            if template_files.get(path) != self._template_files.get(path)
+        )
+        self._template_files = template_files
+
+        changed_projects = []
+        for path, previous in self._projects.items():
+            state = self._get_project_state(path)
+            if state != previous:
+                self._projects[path] = state
+                changed_projects.append(path)
+
+        return changed_templates, changed_projects
+
+
+def watch(
+    paths: typing.List[pathlib.Path],
+    on_change: OnChange,
+    interval: float = 0.2,
+    templates: pathlib.Path = TEMPLATES,
+):
+    """Call on_change for every project that needs an update
+
+    A project that changed by itself gets a full update, all the other
+     projects get the changed template files for limiting the update to the
+     affected outputs.
+    """
+    watcher = Watcher(paths, templates=templates)
+    logger.info('watching %d projects for changes', len(paths))
+    while True:
+        time.sleep(interval)
+        changed_templates, changed_projects = watcher.poll()
+
+        if changed_templates:
+            # new files may shadow the current templates
+            template_cache.invalidate_graphs()
+            for path in paths:
+                if path not in changed_projects:
+                    on_change(path, changed_templates)
+
+        for path in changed_projects:
+            on_change(path, None)